@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+class AdmissionRejected(Exception):
+    """An upstream call was refused before it was sent; retry_after is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamOverloaded(AdmissionRejected):
+    """The upstream queue is full; the request should be shed with Retry-After."""
+
+class UpstreamBudgetExhausted(AdmissionRejected):
+    """The upstream quota is used up or paused, or no slot freed up in time; serve a local fallback."""
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait(self, cost: float = 1.0) -> float:
+        """Seconds until cost tokens are available, 0 if they are now; takes nothing."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take cost tokens; returns 0 on success, otherwise the seconds until they are available."""
+        retry_after = self.wait(cost)
+        if not retry_after:
+            self.tokens -= cost
+        return retry_after
+
+class ClientRateLimiter:
+    """Token bucket per client identity (API key or address), with the least recently seen clients forgotten first.
+
+    A request may be charged to several buckets (its address and its API key); it is only
+    admitted, and only takes a token from each, if every one of them has a token.
+    """
+
+    def __init__(self, rate_per_second: float, burst: float, max_clients: int = 10000):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_clients = max_clients
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()
+
+    def check(self, *clients: str) -> float:
+        """Return 0 if the request may proceed, otherwise the seconds to wait."""
+        if self.rate_per_second <= 0:
+            return 0.0
+
+        buckets = [self._bucket(client) for client in clients]
+        retry_after = max(bucket.wait() for bucket in buckets)
+        if retry_after:
+            self.limited += 1
+            return retry_after
+        for bucket in buckets:
+            bucket.take()
+        self.allowed += 1
+        return 0.0
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate_per_second, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def stats(self) -> dict:
+        return {
+            "clientsTracked": len(self._buckets),
+            "clientRequestsAllowed": self.allowed,
+            "clientRequestsLimited": self.limited,
+        }
+
+class PriorityLimiter:
+    """Bound concurrent upstream calls, serving waiting callers by priority and then arrival order.
+
+    Admission fails fast instead of queueing without limit:
+    - the queue holds at most max_queue callers (UpstreamOverloaded);
+    - a caller waits at most max_wait[priority] seconds for a slot, default_max_wait for a
+      priority not listed (UpstreamBudgetExhausted);
+    - an optional requests-per-second budget, and pause() after an upstream rate limit,
+      refuse new calls outright (UpstreamBudgetExhausted).
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: dict, rate_per_second: float = 0, burst: float = 0,
+                 default_max_wait: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_max_wait = default_max_wait
+        self.budget = TokenBucket(rate_per_second, burst or rate_per_second) if rate_per_second > 0 else None
+        self.active = 0
+        self.waiting = 0  # live entries in _waiters; timed-out ones stay in the heap until popped
+        self.paused_until = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = {"queueFull": 0, "queueTimeout": 0, "budget": 0, "paused": 0}
+        self._hold_seconds = 1.0  # moving average of how long a call keeps its slot
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+
+    def pause(self, seconds: float):
+        """Refuse new calls for a while, e.g. after upstream reported its rate limit."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued caller would get a slot."""
+        return self._hold_seconds * (self.waiting / self.max_concurrency + 1)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_BULK):
+        self._check_budget()
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+        else:
+            await self._wait(priority)
+
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def _check_budget(self):
+        remaining_pause = self.paused_until - time.monotonic()
+        if remaining_pause > 0:
+            self.shed["paused"] += 1
+            raise UpstreamBudgetExhausted("Upstream rate limit reached, paused", remaining_pause)
+        if self.budget is not None:
+            retry_after = self.budget.take()
+            if retry_after:
+                self.shed["budget"] += 1
+                raise UpstreamBudgetExhausted("Upstream request budget exhausted", retry_after)
+
+    async def _wait(self, priority: int):
+        if self.waiting >= self.max_queue:
+            self.shed["queueFull"] += 1
+            raise UpstreamOverloaded("Upstream queue is full", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.waiting += 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait.get(priority, self.default_max_wait))
+        except BaseException as e:
+            # Timed out or cancelled just after the slot was handed over: pass it on
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                self.waiting -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed["queueTimeout"] += 1
+                raise UpstreamBudgetExhausted("Timed out waiting for an upstream slot", self.retry_after()) from None
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the best waiter so the active count never dips
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                self.waiting -= 1
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "maxConcurrency": self.max_concurrency,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "pausedSeconds": max(self.paused_until - time.monotonic(), 0.0),
+        }
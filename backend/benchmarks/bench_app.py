@@ -0,0 +1,21 @@
+"""The backend app for benchmarks that run it in separate uvicorn processes (see worker_scaling.py).
+
+Environment:
+    BENCH_FAKE_GEMINI=1      answer Gemini calls with fake_gemini (BENCH_LATENCY_MS, default 50)
+    BENCH_EAGER_SDK=1        import google.generativeai up front, as the backend used to
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if os.getenv("BENCH_EAGER_SDK") == "1":
+    import google.generativeai  # noqa: F401
+
+if os.getenv("BENCH_FAKE_GEMINI") == "1":
+    import fake_gemini
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(latency_ms=float(os.getenv("BENCH_LATENCY_MS", "50"))))
+
+from main import app  # noqa: E402,F401
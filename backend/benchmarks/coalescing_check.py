@@ -0,0 +1,95 @@
+"""Check that identical concurrent conversions share one upstream call.
+
+Usage (from the backend directory):
+    python benchmarks/coalescing_check.py [--requests 100] [--latency-ms 300]
+
+single-flight - --requests concurrent SingleFlight.do calls with one key and a counting
+                function: the function must run once and every caller get its result; a
+                failure must reach every caller too
+endpoint      - --requests identical concurrent /api/convert-latex requests through the real
+                app over httpx's ASGI transport, against fake_gemini: exactly one upstream
+                call, and every response the same LaTeX
+
+Exits with status 1 on the first failed check.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+os.environ.setdefault("GEMINI_WARMUP", "0")
+os.environ.setdefault("CLIENT_REQUESTS_PER_MINUTE", "0")
+
+import httpx
+
+import fake_gemini
+from single_flight import SingleFlight
+
+def check(condition, message):
+    if not condition:
+        sys.exit(f"FAIL: {message}")
+
+async def single_flight_check(count):
+    flight = SingleFlight()
+    calls = 0
+
+    async def counted():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("key", counted) for _ in range(count)))
+    check(calls == 1, f"SingleFlight.do ran the function {calls} times for {count} concurrent callers")
+    check(results == ["result"] * count, "not every caller got the shared result")
+    check(flight.stats()["coalescedRequests"] == count - 1, f"coalesced {flight.stats()['coalescedRequests']}, expected {count - 1}")
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream failed")
+
+    calls = 0
+    outcomes = await asyncio.gather(*(flight.do("failing", failing) for _ in range(count)), return_exceptions=True)
+    check(calls == 1, f"SingleFlight.do ran a failing function {calls} times")
+    check(all(isinstance(outcome, RuntimeError) for outcome in outcomes), "not every caller got the shared exception")
+    check(flight.stats()["inFlight"] == 0, "finished calls are still in flight")
+    print(f"single-flight: {count} callers, 1 call, shared result and exception - OK")
+
+async def endpoint_check(count):
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check", timeout=60) as client:
+            calls_before = fake_gemini.stats.calls
+            responses = await asyncio.gather(*(
+                client.post("/api/convert-latex", json={"text": "quorble zintax plimmet"}) for _ in range(count)
+            ))
+            calls = fake_gemini.stats.calls - calls_before
+
+    statuses = {response.status_code for response in responses}
+    check(statuses == {200}, f"responses with status {sorted(statuses)}")
+    check(calls == 1, f"{count} identical requests made {calls} upstream calls")
+    answers = {response.json()["latex"] for response in responses}
+    check(len(answers) == 1, f"identical requests got {len(answers)} different answers")
+    print(f"endpoint: {count} identical requests, 1 upstream call - OK")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(latency_ms=args.latency_ms, jitter=0))
+    logging.disable(logging.WARNING)
+    asyncio.run(single_flight_check(args.requests))
+    asyncio.run(endpoint_check(args.requests))
+
+if __name__ == "__main__":
+    main()
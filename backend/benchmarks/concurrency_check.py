@@ -0,0 +1,77 @@
+"""Check that concurrent conversions overlap: N of them finish in about the time of one.
+
+Usage (from the backend directory):
+    python benchmarks/concurrency_check.py [--concurrency 16] [--latency-ms 500] [--tolerance 1.5]
+
+Requests go through the real app over httpx's ASGI transport against fake_gemini with a
+fixed latency. Every input is different and none is handled by the local rules, so each
+request makes its own upstream call. One request is timed alone, then --concurrency at
+once; the check fails (exit status 1) if the concurrent batch takes more than --tolerance
+times the single request, as it would if upstream calls blocked the event loop or each
+other. --concurrency must not exceed GEMINI_MAX_CONCURRENCY (16 by default).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+os.environ.setdefault("GEMINI_WARMUP", "0")
+os.environ.setdefault("CLIENT_REQUESTS_PER_MINUTE", "0")
+
+import httpx
+
+import fake_gemini
+
+# Made-up words: no local rule, cache entry or fuzzy neighbour can answer them
+WORDS = ["quorble", "zintax", "plimmet", "vardune", "skofel", "trindle", "mopsac", "gruvel"]
+
+def distinct_inputs(count):
+    return [f"{WORDS[index % len(WORDS)]} {WORDS[index // len(WORDS) % len(WORDS)]} number {index}" for index in range(count)]
+
+async def convert_all(client, texts):
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.post("/api/convert-latex", json={"text": text}) for text in texts))
+    return time.perf_counter() - started, responses
+
+async def run(args):
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://check", timeout=60) as client:
+            texts = distinct_inputs(args.concurrency + 1)
+            single, responses = await convert_all(client, texts[:1])
+            calls_before = fake_gemini.stats.calls
+            concurrent, more = await convert_all(client, texts[1:])
+            return single, concurrent, responses + more, fake_gemini.stats.calls - calls_before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed ratio of batch time to single time")
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(latency_ms=args.latency_ms, jitter=0))
+    logging.disable(logging.WARNING)
+    single, concurrent, responses, calls = asyncio.run(run(args))
+
+    failed = [response.status_code for response in responses if response.status_code != 200]
+    ratio = concurrent / single
+    print(f"1 conversion: {single * 1000:.0f} ms; {args.concurrency} concurrent: {concurrent * 1000:.0f} ms "
+          f"({ratio:.2f}x, {calls} upstream calls)")
+    if failed:
+        sys.exit(f"FAIL: non-200 responses {failed}")
+    if calls < args.concurrency:
+        sys.exit(f"FAIL: expected {args.concurrency} upstream calls, got {calls}; inputs were answered locally")
+    if ratio > args.tolerance:
+        sys.exit(f"FAIL: {args.concurrency} concurrent conversions took {ratio:.2f}x one conversion (limit {args.tolerance}x)")
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""In-process stand-in for google.generativeai.GenerativeModel, for benchmarks without network or API key.
+
+install(FakeGeminiConfig(...)) replaces genai.GenerativeModel, so models built by the
+backend's ModelRegistry afterwards answer locally. Answers are deterministic for a given
+input: LaTeX-looking text for the LaTeX prompts, numbered lines for packed prompts and
+tableData JSON for JSON-mode models. Latency, failures, rate limits and truncated
+output are drawn from a seeded random generator.
+"""
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+@dataclass
+class FakeGeminiConfig:
+    latency_ms: float = 300.0  # time to first token
+    jitter: float = 0.5  # lognormal sigma applied to latency_ms; 0 for a fixed latency
+    tokens_per_second: float = 200.0  # output speed after the first token
+    failure_rate: float = 0.0  # fraction of calls failing with 503
+    rate_limit_rate: float = 0.0  # fraction of calls failing with 429
+    truncation_rate: float = 0.0  # fraction of answers cut off at a random point
+    max_table_size: int = 8  # rows and columns of generated tables are capped at this
+    seed: int = 0
+
+class FakeGeminiStats:
+    def __init__(self):
+        self.calls = 0
+        self.stream_calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.truncated = 0
+        self.output_tokens = 0
+
+    def reset(self):
+        self.__init__()
+
+stats = FakeGeminiStats()
+_config = FakeGeminiConfig()
+_random = random.Random(0)
+_original_model = genai.GenerativeModel
+
+def install(config: FakeGeminiConfig = None):
+    global _config, _random
+    _config = config or FakeGeminiConfig()
+    _random = random.Random(_config.seed)
+    stats.reset()
+    genai.GenerativeModel = FakeGenerativeModel
+
+def uninstall():
+    genai.GenerativeModel = _original_model
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+_numbered_line_re = re.compile(r"^\s*(\d+)\s*:\s*(.+)$")
+_dimensions_re = re.compile(r"(\d+)\s*(?:x|by)\s*(\d+)", re.IGNORECASE)
+_described_table_re = re.compile(r'based on this description:\s*"(.*?)"', re.DOTALL)
+
+def fake_latex(text: str) -> str:
+    words = re.findall(r"[A-Za-z0-9]+", text)
+    return "\\mathrm{" + "\\,".join(words[:12] or ["x"]) + "}"
+
+def fake_answer(contents: str, json_mode: bool) -> str:
+    if json_mode:
+        match = _described_table_re.search(contents)
+        description = match.group(1) if match else contents
+        dimensions = _dimensions_re.search(description)
+        rows, cols = (int(dimensions.group(1)), int(dimensions.group(2))) if dimensions else (4, 3)
+        rows, cols = min(rows, _config.max_table_size), min(cols, _config.max_table_size)
+        table_data = [
+            {"cells": [{"content": f"r{r}c{c}" if r else f"Header {c}", "isHeader": r == 0} for c in range(cols)]}
+            for r in range(rows)
+        ]
+        return json.dumps({"tableData": table_data}, indent=2)
+
+    lines = [line for line in contents.split("\n") if line.strip()]
+    numbered = [_numbered_line_re.match(line) for line in lines]
+    if len(lines) > 1 and all(numbered):
+        return "\n".join(f"{match.group(1)}: {fake_latex(match.group(2))}" for match in numbered)
+    return " \\\\ ".join(fake_latex(line) for line in lines)
+
+class FakeGenerativeModel:
+    def __init__(self, model_name="gemini-fake", generation_config=None, system_instruction=None, **kwargs):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+        self._json_mode = getattr(generation_config, "response_mime_type", None) == "application/json"
+
+    async def _before_answer(self):
+        stats.calls += 1
+        latency = _config.latency_ms / 1000
+        if _config.jitter:
+            latency *= _random.lognormvariate(0, _config.jitter)
+        await asyncio.sleep(latency)
+
+        roll = _random.random()
+        if roll < _config.failure_rate:
+            stats.failures += 1
+            raise api_exceptions.ServiceUnavailable("fake upstream outage")
+        if roll < _config.failure_rate + _config.rate_limit_rate:
+            stats.rate_limited += 1
+            raise api_exceptions.ResourceExhausted("429 RATE_LIMIT_EXCEEDED (fake)")
+
+    def _answer(self, contents) -> str:
+        answer = fake_answer(contents if isinstance(contents, str) else str(contents), self._json_mode)
+        if _random.random() < _config.truncation_rate:
+            stats.truncated += 1
+            answer = answer[:_random.randrange(1, len(answer))]
+        stats.output_tokens += estimate_tokens(answer)
+        return answer
+
+    def _usage(self, contents, answer):
+        return SimpleNamespace(prompt_token_count=estimate_tokens(str(contents)), candidates_token_count=estimate_tokens(answer))
+
+    async def generate_content_async(self, contents, stream=False, request_options=None, **kwargs):
+        await self._before_answer()
+        answer = self._answer(contents)
+        if stream:
+            stats.stream_calls += 1
+            return self._stream(contents, answer)
+
+        await asyncio.sleep(estimate_tokens(answer) / _config.tokens_per_second)
+        return SimpleNamespace(text=answer, usage_metadata=self._usage(contents, answer))
+
+    async def _stream(self, contents, answer, chunk_chars=64):
+        for start in range(0, len(answer), chunk_chars):
+            chunk = answer[start:start + chunk_chars]
+            await asyncio.sleep(estimate_tokens(chunk) / _config.tokens_per_second)
+            last = start + chunk_chars >= len(answer)
+            yield SimpleNamespace(text=chunk, usage_metadata=self._usage(contents, answer) if last else None)
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=estimate_tokens(str(contents)))
@@ -0,0 +1,123 @@
+"""Measure the fuzzy conversion cache: precision and recall on labelled pairs, then speed and memory at scale.
+
+Usage (from the backend directory):
+    python benchmarks/fuzzy_cache_bench.py [--entries 300000] [--lookups 20000]
+                                           [--thresholds 0.2,0.35,0.5,0.7]
+
+Precision/recall: for every pair in fixtures/fuzzy_pairs.json the first input is cached
+and the second looked up; "same" pairs should hit and the others must not. The exact-key
+column is what the existing cache (normalized exact match) would get on the same pairs.
+
+Scale: the index is filled with --entries synthetic inputs, then timed on lookups of
+paraphrases of cached inputs (hits) and of inputs with different numbers (misses).
+Memory is the traced allocation growth while filling the index, including the stored LaTeX.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversion_cache import normalize_text
+from fuzzy_cache import FuzzyLatexIndex
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "fuzzy_pairs.json")
+
+# (cached wording, paraphrase) pairs filled with a variable and two numbers
+TEMPLATES = [
+    ("integral from {a} to {b} of {v} squared d{v}", "the integral between {a} and {b} of {v}^2 d{v}"),
+    ("{v} to the power of {a} plus {b}", "{v}^{a} + {b}"),
+    ("sum from {v} equals {a} to {b} of {v} squared", "summation from {v} = {a} to {b} of {v}**2"),
+    ("limit as {v} approaches {a} of sin {v} over {v} plus {b}", "lim as {v} goes to {a} of sine {v} / {v} + {b}"),
+    ("square root of {v} plus {a} times {b}", "sqrt {v} + {a} times {b}"),
+    ("log base {a} of {v} minus {b}", "logarithm base {a} of {v} - {b}"),
+]
+
+def precision_recall(pairs, thresholds):
+    print(f"{'threshold':>10}{'hits':>7}{'false':>7}{'missed':>8}{'precision':>11}{'recall':>8}")
+    same = sum(pair["same"] for pair in pairs)
+    exact = sum(normalize_text(pair["a"]) == normalize_text(pair["b"]) for pair in pairs if pair["same"])
+    print(f"{'exact-key':>10}{exact:>7}{0:>7}{same - exact:>8}{1.0:>11.2f}{exact / same:>8.2f}")
+    for threshold in thresholds:
+        hits = false = 0
+        for pair in pairs:
+            index = FuzzyLatexIndex(threshold=threshold)
+            index.add(pair["a"], "latex")
+            if index.lookup(pair["b"]) is not None:
+                if pair["same"]:
+                    hits += 1
+                else:
+                    false += 1
+                    print(f"{'':>10}  false match: {pair['a']!r} ~ {pair['b']!r}")
+        precision = hits / (hits + false) if hits + false else 1.0
+        print(f"{threshold:>10}{hits:>7}{false:>7}{same - hits:>8}{precision:>11.2f}{hits / same:>8.2f}")
+
+def synthetic(rng, count):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for _ in range(count):
+        template = rng.randrange(len(TEMPLATES))
+        values = {"v": rng.choice(letters), "a": rng.randrange(1000), "b": rng.randrange(1000)}
+        yield template, values
+
+def time_lookups(index, texts):
+    durations = []
+    hits = 0
+    for text in texts:
+        started = time.perf_counter()
+        hits += index.lookup(text) is not None
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return hits, durations[len(durations) // 2] * 1e6, durations[int(len(durations) * 0.99)] * 1e6
+
+def scale(entries, lookups, threshold):
+    rng = random.Random(7)
+    index = FuzzyLatexIndex(max_entries=entries, threshold=threshold)
+    cached = list(synthetic(rng, entries))
+    texts = [(TEMPLATES[template][0].format(**values), TEMPLATES[template][1].format(**values))
+             for template, values in cached]
+
+    started = time.perf_counter()
+    for text, latex in texts:
+        index.add(text, latex)
+    fill_seconds = time.perf_counter() - started
+
+    # Memory is measured on a second fill, which tracemalloc slows down
+    index = FuzzyLatexIndex(max_entries=entries, threshold=threshold)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for text, latex in texts:
+        index.add(text, latex)
+    memory_mb = (tracemalloc.get_traced_memory()[0] - before) / 1e6
+    tracemalloc.stop()
+    del texts
+
+    sample = rng.sample(cached, min(lookups, len(cached)))
+    paraphrases = [TEMPLATES[template][1].format(**values) for template, values in sample]
+    others = [TEMPLATES[template][1].format(**{**values, "a": values["a"] + 1000}) for template, values in sample]
+
+    print(f"\n{index.stats()['fuzzyEntries']} entries, filled in {fill_seconds:.1f}s "
+          f"({fill_seconds / entries * 1e6:.1f} us/add), {memory_mb:.0f} MB ({memory_mb * 1e6 / entries:.0f} B/entry)")
+    print(f"{'lookups':<12}{'hit rate':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name, texts in (("paraphrase", paraphrases), ("different", others)):
+        hits, p50, p99 = time_lookups(index, texts)
+        print(f"{name:<12}{hits / len(texts):>10.2f}{p50:>10.1f}{p99:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=300000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--thresholds", default="0.2,0.35,0.5,0.7")
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        pairs = json.load(f)
+    thresholds = [float(value) for value in args.thresholds.split(",")]
+    precision_recall(pairs, thresholds)
+    scale(args.entries, args.lookups, FuzzyLatexIndex().threshold)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Compare documents that embed their images with documents that reference uploaded images.
+
+Usage (from the backend directory):
+    python benchmarks/image_upload_bench.py [--images 5] [--paragraphs 200] [--size 3000x2000]
+                                            [--workers 1,2] [--repeat 5]
+
+Photos are synthesized (noise over a gradient, JPEG quality 90, about the size of a phone
+photo). Requests go through the real app over httpx's ASGI transport, with the document
+store and the image store in a temporary directory.
+
+documents - a document of --paragraphs paragraphs and --images photos, once with each photo
+            embedded as a data URL (as the editor did) and once with the URLs the upload
+            endpoint returns: JSON size, creating it, saving the step that inserts one more
+            photo, loading it, and the image bytes a browser fetches to show it (the data
+            URLs themselves, or the w1280 variants)
+uploads   - time to upload the photos with IMAGE_WORKERS=--workers (resizing runs in the
+            process pool; the first upload also starts it), and to upload them again
+            (deduplicated by content hash, nothing is decoded)
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from PIL import Image
+
+def synthetic_photo(width, height, seed):
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40 + seed).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(gradient, noise, 0.5).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+def paragraph(index):
+    return {"type": "paragraph", "content": [{"type": "text", "text": f"Paragraph {index} of the benchmark document, with some text."}]}
+
+def image_node(attrs):
+    return {"type": "resizableImage", "attrs": {"alt": "photo.jpg", "title": None, "width": None, "height": None, **attrs}}
+
+def document(paragraphs, image_attrs):
+    content = [paragraph(index) for index in range(paragraphs)]
+    step = max(1, paragraphs // (len(image_attrs) + 1))
+    for offset, attrs in enumerate(image_attrs):
+        content.insert((offset + 1) * step + offset, image_node(attrs))
+    return {"type": "doc", "content": content}
+
+def upload_attrs(image):
+    candidates = [f"{variant['url']} {variant['width']}w" for name, variant in image["variants"].items() if name.startswith("w")]
+    return {"src": image["variants"].get("w1280", image)["url"], "srcset": ", ".join(candidates + [f"{image['url']} {image['width']}w"])}
+
+async def timed(coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - started
+
+async def document_costs(client, content, extra_image, repeat):
+    body = json.dumps({"title": "Benchmark", "content": content})
+    create_seconds, step_seconds, load_seconds = [], [], []
+    step_bytes = 0
+    for _ in range(repeat):
+        response, seconds = await timed(client.post("/api/documents", content=body, headers={"Content-Type": "application/json"}))
+        create_seconds.append(seconds)
+        doc_id = response.json()["id"]
+
+        # The ProseMirror step that inserts one more photo at the end
+        step = {"stepType": "replace", "from": 0, "to": 0, "slice": {"content": [image_node(extra_image)]}}
+        response, seconds = await timed(client.post(f"/api/documents/{doc_id}/steps", json={"version": 0, "steps": [step]}))
+        step_seconds.append(seconds)
+        step_bytes = response.json()["bytesWritten"]
+
+        _, seconds = await timed(client.get(f"/api/documents/{doc_id}", params={"limit": 1000}))
+        load_seconds.append(seconds)
+    return len(body), min(create_seconds), min(step_seconds), step_bytes, min(load_seconds)
+
+async def image_bytes(client, content):
+    total = 0
+    for node in content["content"]:
+        if node["type"] == "resizableImage":
+            src = node["attrs"]["src"]
+            if src.startswith("data:"):
+                total += len(src)
+            else:
+                total += len((await client.get(src)).content)
+    return total
+
+async def run(args, photos, workers):
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=300) as client:
+            uploads = []
+            for index, photo in enumerate(photos):
+                response, seconds = await timed(client.post("/api/images", files={"file": (f"{index}.jpg", photo, "image/jpeg")}))
+                response.raise_for_status()
+                uploads.append((response.json(), seconds))
+            started = time.perf_counter()
+            await asyncio.gather(*(client.post("/api/images", files={"file": ("again.jpg", photo, "image/jpeg")}) for photo in photos))
+            again_seconds = time.perf_counter() - started
+
+            if workers != args.worker_counts[0]:
+                return uploads, again_seconds, None
+
+            data_urls = [{"src": "data:image/jpeg;base64," + base64.b64encode(photo).decode("ascii")} for photo in photos]
+            references = [upload_attrs(image) for image, _ in uploads]
+            results = {}
+            for name, attrs in (("embedded", data_urls), ("uploaded", references)):
+                content = document(args.paragraphs, attrs[:-1])
+                results[name] = (*await document_costs(client, content, attrs[-1], args.repeat), await image_bytes(client, content))
+            return uploads, again_seconds, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=5, help="photos in the document (one more is inserted by a step)")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--size", default="3000x2000", help="photo width x height")
+    parser.add_argument("--workers", default="1,2", help="comma-separated IMAGE_WORKERS values for the upload timing")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per document measurement; the fastest is reported")
+    args = parser.parse_args()
+    args.worker_counts = [int(count) for count in args.workers.split(",")]
+    width, height = (int(value) for value in args.size.split("x"))
+
+    photos = [synthetic_photo(width, height, seed) for seed in range(args.images + 1)]
+    print(f"{len(photos)} photos of {width}x{height}, {sum(map(len, photos)) / len(photos) / 1e6:.1f} MB each on average, "
+          f"{os.cpu_count()} CPUs")
+
+    os.environ.setdefault("GEMINI_WARMUP", "0")
+    os.environ["CLIENT_REQUESTS_PER_MINUTE"] = "0"
+    for workers in args.worker_counts:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.environ.update({"IMAGES_DIR": os.path.join(workdir, "images"), "IMAGE_WORKERS": str(workers),
+                               "DOCUMENTS_DB": os.path.join(workdir, "documents.db")})
+            sys.modules.pop("main", None)
+            uploads, again_seconds, results = asyncio.run(run(args, photos, workers))
+
+        if results:
+            print(f"\n{'document':<10}{'JSON KB':>10}{'create ms':>11}{'step ms':>9}{'step KB':>9}{'load ms':>9}{'image KB':>10}")
+            for name, (json_bytes, create, step, step_bytes, load, shown) in results.items():
+                print(f"{name:<10}{json_bytes / 1024:>10.1f}{create * 1000:>11.1f}{step * 1000:>9.1f}"
+                      f"{step_bytes / 1024:>9.1f}{load * 1000:>9.1f}{shown / 1024:>10.0f}")
+            print(f"\n{'workers':>8}{'1st upload ms':>15}{'next p50 ms':>13}{'again ms':>10}")
+
+        seconds = sorted(seconds for _, seconds in uploads[1:])
+        print(f"{workers:>8}{uploads[0][1] * 1000:>15.0f}{seconds[len(seconds) // 2] * 1000:>13.0f}"
+              f"{again_seconds / len(uploads) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure what checking the model's LaTeX adds to a conversion, and what it catches.
+
+Usage (from the backend directory):
+    python benchmarks/latex_validator_bench.py [--rounds 2000] [--block-lines 20]
+
+Outcomes: every output in fixtures/latex_outputs.json is checked once, listing any that
+do not end up as labelled (valid outputs unchanged apart from canonical spacing, repairable
+ones repaired without problems, unrepairable ones reported for a retry).
+
+Timing: each labelled group, and a --block-lines block of the valid outputs joined with \\\\,
+is checked --rounds times; the table shows the mean, p50 and p99 microseconds per check.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latex_validator import check_latex
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "latex_outputs.json")
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+def outcomes(groups):
+    print(f"{'group':<14}{'outputs':>8}{'ok':>6}{'repaired':>10}{'unexpected':>12}")
+    for name, outputs in groups.items():
+        checks = [check_latex(output) for output in outputs]
+        expected = {
+            "valid": lambda check: check.ok and not check.repairs,
+            "repairable": lambda check: check.ok and check.repairs,
+            "unrepairable": lambda check: not check.ok,
+        }[name]
+        unexpected = [(output, check) for output, check in zip(outputs, checks) if not expected(check)]
+        print(f"{name:<14}{len(outputs):>8}{sum(check.ok for check in checks):>6}"
+              f"{sum(bool(check.repairs) for check in checks):>10}{len(unexpected):>12}")
+        for output, check in unexpected:
+            print(f"{'':<14}  {output!r}: repairs {check.repairs}, problems {check.problems}")
+
+def timing(cases, rounds, alignment=False):
+    samples = []
+    for _ in range(rounds):
+        for output in cases:
+            started = time.perf_counter()
+            check_latex(output, alignment)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    return sum(samples) / len(samples), percentile(samples, 0.5), percentile(samples, 0.99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--block-lines", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        groups = json.load(f)
+    outcomes(groups)
+
+    valid = groups["valid"]
+    block = " \\\\ ".join(valid[index % len(valid)] for index in range(args.block_lines))
+    cases = [(name, outputs, False) for name, outputs in groups.items()]
+    cases.append((f"block x{args.block_lines}", [block], True))
+
+    print(f"\n{'group':<14}{'avg chars':>10}{'mean us':>9}{'p50 us':>9}{'p99 us':>9}")
+    for name, outputs, alignment in cases:
+        mean, p50, p99 = timing(outputs, args.rounds if len(outputs) > 1 else args.rounds * 10, alignment)
+        chars = sum(len(output) for output in outputs) / len(outputs)
+        print(f"{name:<14}{chars:>10.0f}{mean * 1e6:>9.1f}{p50 * 1e6:>9.1f}{p99 * 1e6:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Offline load test for the conversion endpoints against an in-process fake Gemini.
+
+Usage (from the backend directory):
+    python benchmarks/load_test.py [--workloads latex,block,table] [--concurrency 1,8,32]
+                                   [--requests 200] [--latency-ms 300] [--failure-rate 0.02] ...
+
+Requests go through the real FastAPI app over httpx's ASGI transport, so routing,
+validation, caching, single-flight, admission control and fallbacks are all exercised;
+only the Gemini SDK is replaced (see fake_gemini.py). No API key or network is needed.
+
+Workloads replay the fixture corpora:
+    latex  - inline phrases, drawn with a Zipf-like skew so popular phrases repeat
+    block  - multi-line proofs with annotations, each followed by single-line edits
+    table  - table prompts, structural and content-bearing, with the same skew
+
+For each workload and concurrency level the backend is reloaded (cold caches unless
+--warm) and the report shows requests/sec, p50/p95/p99 latency, non-200 responses,
+upstream calls per request and peak RSS.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before the backend is imported; explicit environment values win
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-fake-key")
+os.environ.setdefault("GEMINI_WARMUP", "0")
+os.environ.setdefault("CLIENT_REQUESTS_PER_MINUTE", "0")  # every request comes from one client here
+
+import httpx
+
+import fake_gemini
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def skewed_choices(rng, items, count):
+    weights = [1 / (rank + 1) for rank in range(len(items))]
+    return rng.choices(items, weights=weights, k=count)
+
+def latex_workload(rng, count):
+    phrases = load_fixture("inline_phrases")
+    return [("/api/convert-latex", {"text": text}) for text in skewed_choices(rng, phrases, count)]
+
+def block_workload(rng, count):
+    """Each proof is sent whole, then re-sent with one line edited at a time, like a user typing."""
+    proofs = load_fixture("proofs")
+    requests = []
+    while len(requests) < count:
+        lines = list(rng.choice(proofs))
+        requests.append(("/api/convert-latex-block", {"englishText": "\n".join(lines)}))
+        for _ in range(rng.randint(1, 4)):
+            index = rng.randrange(len(lines))
+            math_part, _, annotation = lines[index].partition(" - ")
+            edited = f"{math_part} plus {rng.randint(1, 9)}"
+            lines[index] = f"{edited} - {annotation}" if annotation else edited
+            requests.append(("/api/convert-latex-block", {"englishText": "\n".join(lines)}))
+    return requests[:count]
+
+def table_workload(rng, count):
+    prompts = load_fixture("table_prompts")
+    return [("/api/convert-table", {"prompt": prompt}) for prompt in skewed_choices(rng, prompts, count)]
+
+WORKLOADS = {"latex": latex_workload, "block": block_workload, "table": table_workload}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+async def run(app, requests, concurrency):
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    latencies = []
+    errors = 0
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            path, body = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return sorted(latencies), errors, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default="latex,block,table")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per workload and concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="fake time to first token")
+    parser.add_argument("--jitter", type=float, default=0.5, help="lognormal sigma on the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--truncation-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="keep caches between runs instead of reloading the backend")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's logging")
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        truncation_rate=args.truncation_rate,
+        seed=args.seed,
+    ))
+
+    import main as backend
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    results = []
+    print(f"{'workload':<10}{'conc':>6}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'up/req':>8}{'rss MB':>8}")
+    for workload in args.workloads.split(","):
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            if not args.warm:
+                backend = importlib.reload(backend)
+            requests = WORKLOADS[workload](random.Random(args.seed), args.requests)
+            calls_before = fake_gemini.stats.calls
+
+            latencies, errors, elapsed = asyncio.run(run(backend.app, requests, concurrency))
+
+            upstream_calls = fake_gemini.stats.calls - calls_before
+            result = {
+                "workload": workload,
+                "concurrency": concurrency,
+                "requests": len(requests),
+                "errors": errors,
+                "requestsPerSecond": len(requests) / elapsed,
+                "p50Ms": percentile(latencies, 0.50) * 1000,
+                "p95Ms": percentile(latencies, 0.95) * 1000,
+                "p99Ms": percentile(latencies, 0.99) * 1000,
+                "upstreamCallsPerRequest": upstream_calls / len(requests),
+                "peakRssMb": peak_rss_mb(),
+            }
+            results.append(result)
+            rss = f"{result['peakRssMb']:.0f}" if result["peakRssMb"] is not None else "-"
+            print(f"{workload:<10}{concurrency:>6}{result['requests']:>7}{errors:>8}{result['requestsPerSecond']:>9.1f}"
+                  f"{result['p50Ms']:>9.1f}{result['p95Ms']:>9.1f}{result['p99Ms']:>9.1f}"
+                  f"{result['upstreamCallsPerRequest']:>8.2f}{rss:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
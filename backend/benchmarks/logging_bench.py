@@ -0,0 +1,113 @@
+"""Measure request throughput under different logging configurations.
+
+Usage (from the backend directory):
+    python benchmarks/logging_bench.py [--workloads latex,table] [--requests 400] [--concurrency 16]
+
+Each configuration reloads the backend with its LOG_* environment and replays the fixture
+workloads against the fake Gemini (see load_test.py), best of --repeat runs. Every input is
+made unique so each request goes upstream and logs its response, and fake tables are
+--table-size square, about the size of a long real table response. Log output goes to a temporary file, so the
+report includes the bytes written per request. A second table shows the time a request
+spends logging one large table response. The "sync-full" rows approximates the old
+behaviour: every response logged in full, written on the event loop.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import load_test  # sets the benchmark environment before the backend is imported
+import fake_gemini
+
+CONFIGS = {
+    "sync-full": {"LOG_QUEUE": "0", "LOG_FORMAT": "text", "LOG_LEVEL": "INFO",
+                  "LOG_PAYLOAD_SAMPLE_RATE": "1", "LOG_PAYLOAD_MAX_CHARS": "100000000"},
+    "queue-full": {"LOG_QUEUE": "1", "LOG_FORMAT": "text", "LOG_LEVEL": "INFO",
+                   "LOG_PAYLOAD_SAMPLE_RATE": "1", "LOG_PAYLOAD_MAX_CHARS": "100000000"},
+    "text-default": {"LOG_QUEUE": "1", "LOG_FORMAT": "text", "LOG_LEVEL": "INFO"},
+    "json-default": {"LOG_QUEUE": "1", "LOG_FORMAT": "json", "LOG_LEVEL": "INFO"},
+    "json-sampled-1%": {"LOG_QUEUE": "1", "LOG_FORMAT": "json", "LOG_LEVEL": "INFO", "LOG_PAYLOAD_SAMPLE_RATE": "0.01"},
+    "json-warning": {"LOG_QUEUE": "1", "LOG_FORMAT": "json", "LOG_LEVEL": "WARNING"},
+}
+LOG_VARIABLES = ("LOG_QUEUE", "LOG_FORMAT", "LOG_LEVEL", "LOG_PAYLOAD_SAMPLE_RATE", "LOG_PAYLOAD_MAX_CHARS")
+
+def unique(requests):
+    # Distinct inputs so nothing is answered from the cache
+    return [(path, {key: f"{value} (variant {index})" for key, value in body.items()})
+            for index, (path, body) in enumerate(requests)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default="latex,table")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fake time to first token")
+    parser.add_argument("--table-size", type=int, default=40, help="cap on rows and columns of fake tables")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration; the fastest is reported")
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(
+        latency_ms=args.latency_ms, jitter=0, tokens_per_second=1e9, max_table_size=args.table_size
+    ))
+    # Only the backend's own logging is measured
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    import main as backend
+    import structured_logging
+
+    print(f"{'workload':<10}{'config':<18}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'log B/req':>11}")
+    for workload in args.workloads.split(","):
+        for name in args.configs.split(","):
+            for variable in LOG_VARIABLES:
+                os.environ.pop(variable, None)
+            os.environ.update(CONFIGS[name])
+
+            runs = []
+            for _ in range(args.repeat):
+                with tempfile.TemporaryFile("w+", encoding="utf-8") as log_file:
+                    stderr, sys.stderr = sys.stderr, log_file
+                    try:
+                        backend = importlib.reload(backend)
+                        requests = unique(load_test.WORKLOADS[workload](random.Random(0), args.requests))
+                        latencies, _, elapsed = asyncio.run(load_test.run(backend.app, requests, args.concurrency))
+                        structured_logging.flush_logging()
+                    finally:
+                        sys.stderr = stderr
+                    runs.append((elapsed, latencies, log_file.tell()))
+            elapsed, latencies, log_bytes = min(runs, key=lambda run: run[0])
+
+            print(f"{workload:<10}{name:<18}{len(requests) / elapsed:>9.1f}"
+                  f"{load_test.percentile(latencies, 0.5) * 1000:>9.1f}{load_test.percentile(latencies, 0.99) * 1000:>9.1f}"
+                  f"{log_bytes / len(requests):>11.0f}")
+
+    # Time spent by the request itself (on the event loop) per logged response body
+    payload = fake_gemini.fake_answer(f"{args.table_size}x{args.table_size} table", json_mode=True)
+    print(f"\n{'config':<18}{'us/response':>12}  ({len(payload)} char table response)")
+    for name in args.configs.split(","):
+        for variable in LOG_VARIABLES:
+            os.environ.pop(variable, None)
+        os.environ.update(CONFIGS[name])
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as log_file:
+            stderr, sys.stderr = sys.stderr, log_file
+            try:
+                backend = importlib.reload(backend)
+                started = time.perf_counter()
+                for _ in range(200):
+                    backend.log_payload("convert-table", "Gemini API Response", payload)
+                elapsed = time.perf_counter() - started
+                structured_logging.flush_logging()
+            finally:
+                sys.stderr = stderr
+        print(f"{name:<18}{elapsed / 200 * 1e6:>12.1f}")
+
+    structured_logging.configure_logging(use_queue=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Measure document search over a store of many documents, against scanning them without an index.
+
+Usage (from the backend directory):
+    python benchmarks/search_bench.py [--documents 20000] [--blocks 30] [--repeat 20] [--scan-repeat 3]
+
+Documents are synthesized with a fixed seed: paragraphs of words drawn from a Zipf-distributed
+vocabulary, inline LaTeX nodes and LaTeX blocks taken from fixtures/latex_outputs.json, each
+with English as its originalText. The store lives in a temporary directory.
+
+build   - creating every document (its blocks and their index rows are written in the same
+          transaction), the database size and the size of the inverted index in it
+saves   - appending one step that inserts a paragraph, and a snapshot that changes one block
+queries - p50 and p99 milliseconds of DocumentStore.search for common, rare, prefix, multi-word,
+          LaTeX and spoken-math queries, the documents matched, and the time to find the same
+          words by scanning the stored blocks with LIKE (what a search without the index costs)
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_store import DocumentStore
+from search_index import search_query
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "latex_outputs.json")
+SYLLABLES = ["ka", "lo", "mi", "ner", "sta", "vu", "dre", "pol", "ti", "zan", "que", "ro", "ba", "fen", "gli", "hu"]
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+def synthetic_document(rng, words, weights, formulas, blocks):
+    # weights are cumulative (Zipf), so drawing a word does not sum the whole vocabulary
+    content = []
+    for _ in range(blocks):
+        kind = rng.random()
+        if kind < 0.1:
+            latex = rng.choice(formulas)
+            content.append({"type": "latexBlock", "attrs": {"originalText": " ".join(rng.choices(words, cum_weights=weights, k=6)),
+                                                            "latexCode": latex, "isRendered": True}})
+            continue
+        inline = [{"type": "text", "text": " ".join(rng.choices(words, cum_weights=weights, k=rng.randint(8, 30))) + " "}]
+        if kind < 0.4:
+            inline.append({"type": "latex", "attrs": {"originalText": " ".join(rng.choices(words, cum_weights=weights, k=4)),
+                                                      "latexCode": rng.choice(formulas), "isRendered": True}})
+        content.append({"type": "paragraph", "content": inline})
+    return {"type": "doc", "content": content}
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--blocks", type=int, default=30, help="top-level blocks per document")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each query")
+    parser.add_argument("--scan-repeat", type=int, default=3, help="runs of each LIKE scan")
+    args = parser.parse_args()
+
+    rng = random.Random(25)
+    words = vocabulary(args.vocabulary, rng)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    with open(FIXTURES, encoding="utf-8") as f:
+        formulas = json.load(f)["valid"]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "documents.db")
+        store = DocumentStore(path)
+        create_seconds = 0.0
+        for index in range(args.documents):
+            content = synthetic_document(rng, words, weights, formulas, args.blocks)
+            meta, seconds = timed(store.create, f"Notes {index} {words[index % 500]}", content)
+            create_seconds += seconds
+        store._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        total_bytes = os.path.getsize(path)
+        # The inverted index itself; the stored columns add about the size of the text
+        index_bytes = store._db.execute("SELECT sum(length(block)) FROM document_search_data").fetchone()[0]
+        print(f"build: {args.documents} documents of {args.blocks} blocks in {create_seconds:.1f}s "
+              f"({create_seconds / args.documents * 1000:.2f} ms each), database {total_bytes / 1e6:.0f} MB, "
+              f"inverted index {index_bytes / 1e6:.0f} MB")
+
+        doc_id = meta["id"]
+        step_seconds, snapshot_seconds = [], []
+        document = content
+        for version in range(args.repeat):
+            paragraph = {"type": "paragraph", "content": [{"type": "text", "text": " ".join(rng.choices(words, cum_weights=weights, k=20))}]}
+            step = {"stepType": "replace", "from": 0, "to": 0, "slice": {"content": [paragraph]}}
+            _, seconds = timed(store.append_steps, doc_id, version, [step])
+            step_seconds.append(seconds)
+            document = {"type": "doc", "content": [paragraph] + document["content"][1:]}
+            _, seconds = timed(store.save_snapshot, doc_id, version + 1, document)
+            snapshot_seconds.append(seconds)
+        print(f"saves: step p50 {percentile(sorted(step_seconds), 0.5) * 1000:.2f} ms, "
+              f"snapshot changing one block p50 {percentile(sorted(snapshot_seconds), 0.5) * 1000:.2f} ms")
+
+        queries = [
+            ("common word", words[0], words[0]),
+            ("mid word", words[100], words[100]),
+            ("rare word", words[5000], words[5000]),
+            ("prefix", words[50][:3], words[50][:3]),
+            ("two words", f"{words[10]} {words[200]}", None),
+            ("latex", "x^2", "x^2"),
+            ("latex frac", "\\frac{1}{2}", None),
+            ("spoken", "x squared", None),
+            ("title", "notes 7", None),
+        ]
+        print(f"\n{'query':<12}{'text':<18}{'docs':>6}{'p50 ms':>9}{'p99 ms':>9}{'scan ms':>10}")
+        for name, query, like in queries:
+            samples = []
+            for _ in range(args.repeat):
+                results, seconds = timed(store.search, query, 20)
+                samples.append(seconds)
+            matched = store._db.execute(
+                "SELECT count(DISTINCT rowid >> 32) FROM document_search WHERE document_search MATCH ?",
+                (search_query(query).expression,)
+            ).fetchone()[0]
+            scan = ""
+            if like:
+                scans = [timed(store._db.execute(
+                    "SELECT DISTINCT d.doc_id FROM document_blocks d JOIN blocks b ON b.hash = d.hash WHERE b.content LIKE ?",
+                    (f"%{like}%",)
+                ).fetchall)[1] for _ in range(args.scan_repeat)]
+                scan = f"{min(scans) * 1000:.0f}"
+            samples.sort()
+            print(f"{name:<12}{query:<18}{matched:>6}{percentile(samples, 0.5) * 1000:>9.2f}"
+                  f"{percentile(samples, 0.99) * 1000:>9.2f}{scan:>10}")
+
+if __name__ == "__main__":
+    main()
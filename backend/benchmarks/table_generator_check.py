@@ -0,0 +1,54 @@
+"""Check the tables LocalTableGenerator builds without the model.
+
+Usage (from the backend directory):
+    python benchmarks/table_generator_check.py
+
+Every prompt in fixtures/local_tables.json must produce a table of the given number of
+rows and columns (header row and column included) whose bottom-right cell is "corner"
+when one is given; prompts with "rows": null must be left to the model.
+
+Exits with status 1 on the first failed check.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_generator import LocalTableGenerator
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "local_tables.json")
+
+def check(condition, message):
+    if not condition:
+        sys.exit(f"FAIL: {message}")
+
+def check_case(generator, case):
+    prompt = case["prompt"]
+    table_data = generator.generate(prompt)
+    if case["rows"] is None:
+        check(table_data is None, f"{prompt!r} was built locally instead of being left to the model")
+        return "model"
+
+    check(table_data is not None, f"{prompt!r} was not built locally")
+    rows, cols = len(table_data), {len(row["cells"]) for row in table_data}
+    check(cols == {case["cols"]} and rows == case["rows"],
+          f"{prompt!r} gave {rows} rows of {sorted(cols)} cells, expected {case['rows']}x{case['cols']}")
+    if "corner" in case:
+        corner = table_data[-1]["cells"][-1]["content"]
+        check(corner == case["corner"], f"{prompt!r} ends with {corner!r}, expected {case['corner']!r}")
+    return f"{rows}x{case['cols']}"
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    with open(FIXTURES, encoding="utf-8") as f:
+        cases = json.load(f)
+
+    generator = LocalTableGenerator()
+    for case in cases:
+        print(f"{case['prompt']:<40}{check_case(generator, case):>8}")
+    print(f"{len(cases)} prompts - OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark and fuzz the table response parser against a corpus of model outputs.
+
+Usage (from the backend directory):
+    python benchmarks/table_parser_bench.py [--iterations 2000] [--fuzz 200]
+
+For every fixture it reports how many rows were recovered, whether the parse was complete
+(no salvaged or padded rows) and the mean parse time.
+The fuzz pass truncates each fixture at random offsets and checks that the parser
+either returns rectangular rows or raises TableParseError, never anything else.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_parser import TableParseError, parse_table_response
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "table_responses.json")
+
+def parse_or_none(text):
+    try:
+        return parse_table_response(text)
+    except TableParseError:
+        return None, False
+
+def benchmark(cases, iterations):
+    print(f"{'fixture':<26}{'rows':>6}{'cols':>6}{'complete':>10}{'us/parse':>12}")
+    for case in cases:
+        table_data, complete = parse_or_none(case["text"])
+        started = time.perf_counter()
+        for _ in range(iterations):
+            parse_or_none(case["text"])
+        micros = (time.perf_counter() - started) * 1e6 / iterations
+        rows = len(table_data) if table_data else 0
+        cols = len(table_data[0]["cells"]) if table_data else 0
+        print(f"{case['name']:<26}{rows:>6}{cols:>6}{'yes' if complete else 'no':>10}{micros:>12.1f}")
+
+def fuzz(cases, rounds, seed=0):
+    rng = random.Random(seed)
+    salvaged = failed = 0
+    for case in cases:
+        text = case["text"]
+        for _ in range(rounds):
+            cut = rng.randrange(len(text) + 1)
+            table_data, complete = parse_or_none(text[:cut])
+            if table_data is None:
+                failed += 1
+                continue
+            widths = {len(row["cells"]) for row in table_data}
+            assert len(widths) == 1, f"non-rectangular result for {case['name']}"
+            assert not complete or cut == len(text) or not text[cut:].strip("` \n"), \
+                f"truncated output of {case['name']} parsed as complete"
+            salvaged += 1
+    total = salvaged + failed
+    print(f"\nfuzz: {total} truncations, {salvaged} salvaged ({salvaged / total:.0%}), {failed} without a complete row")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--fuzz", type=int, default=200, help="random truncations per fixture")
+    args = parser.parse_args()
+
+    # The parser logs a warning for every salvaged response
+    logging.disable(logging.WARNING)
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        cases = json.load(f)
+
+    benchmark(cases, args.iterations)
+    fuzz(cases, args.fuzz)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Measure cold start and throughput of the backend run as 1..N uvicorn worker processes.
+
+Usage (from the backend directory):
+    python benchmarks/worker_scaling.py [--workers 1,2,4] [--clients 4] [--concurrency 16]
+                                        [--duration 10] [--latency-ms 50]
+
+Each run starts a real server (uvicorn --workers N, see bench_app.py) on a free port:
+
+cold start  - seconds from spawning the server until /health answers, with the Gemini SDK
+              imported lazily (current) and eagerly (as before), and the startup time
+              of a single worker, in-process, measured by importing the app
+throughput  - --clients load generator processes post inline conversions (fixture
+              phrases, Zipf-like skew, fake Gemini with --latency-ms) for --duration
+              seconds; reported as requests/sec and p50/p99 latency
+shared cache - the distinct phrases are converted once, then again: with the shared
+              SQLite cache the second pass is answered from the cache by every worker,
+              so its p50 stays near the cache latency instead of the upstream latency
+
+Scaling is bounded by the machine's cores (printed first); the load generators share them.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(BENCHMARKS, "fixtures")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, port, workdir, extra_env=None):
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([BACKEND, BENCHMARKS]),
+        "GEMINI_API_KEY": "benchmark-fake-key",
+        "GEMINI_WARMUP": "0",
+        "CLIENT_REQUESTS_PER_MINUTE": "0",
+        "WEB_CONCURRENCY": str(workers),
+        "CONVERSION_CACHE_DB": os.path.join(workdir, "conversion_cache.db"),
+        "DOCUMENTS_DB": os.path.join(workdir, "documents.db"),
+        **(extra_env or {}),
+    }
+    command = [sys.executable, "-m", "uvicorn", "bench_app:app", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_ready(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError("server did not start in time")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def cold_start(workers, extra_env):
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        started = time.perf_counter()
+        process = start_server(workers, port, workdir, extra_env)
+        try:
+            wait_until_ready(port, process)
+            return time.perf_counter() - started
+        finally:
+            stop_server(process)
+
+def import_seconds(eager):
+    code = "import google.generativeai; " if eager else ""
+    env = {**os.environ, "GEMINI_WARMUP": "0", "DOCUMENTS_DB": ":memory:"}
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code + "import main"], cwd=BACKEND, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+def skewed_phrases(seed, count):
+    with open(os.path.join(FIXTURES, "inline_phrases.json"), encoding="utf-8") as f:
+        phrases = json.load(f)
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(phrases))]
+    # Numbered variants keep a share of the traffic going upstream
+    return [f"{phrase} plus {rng.randrange(200)}" if rng.random() < 0.3 else phrase
+            for phrase in rng.choices(phrases, weights=weights, k=count)]
+
+async def drive(port, texts, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration if duration else None
+    queue = list(reversed(texts))
+
+    async def worker(client):
+        nonlocal errors
+        while queue and (deadline is None or time.monotonic() < deadline):
+            text = queue.pop()
+            started = time.perf_counter()
+            response = await client.post("/api/convert-latex", json={"text": text})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, errors
+
+def load_client(port, seed, concurrency, duration, results):
+    results.put(asyncio.run(drive(port, skewed_phrases(seed, 1000000), concurrency, duration)))
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+def throughput(workers, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        process = start_server(workers, port, workdir, {"BENCH_FAKE_GEMINI": "1", "BENCH_LATENCY_MS": str(args.latency_ms)})
+        try:
+            wait_until_ready(port, process)
+
+            # Shared cache: every distinct phrase once, then all of them again
+            with open(os.path.join(FIXTURES, "inline_phrases.json"), encoding="utf-8") as f:
+                phrases = json.load(f)
+            passes = [sorted(asyncio.run(drive(port, phrases, args.concurrency, 0))[0]) for _ in range(2)]
+
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=load_client, args=(port, seed, args.concurrency, args.duration, results))
+                       for seed in range(args.clients)]
+            started = time.perf_counter()
+            for client in clients:
+                client.start()
+            outcomes = [results.get() for _ in clients]
+            elapsed = time.perf_counter() - started
+            for client in clients:
+                client.join()
+        finally:
+            stop_server(process)
+
+    latencies = sorted(latency for client_latencies, _ in outcomes for latency in client_latencies)
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in outcomes),
+        "requestsPerSecond": len(latencies) / elapsed,
+        "p50Ms": percentile(latencies, 0.5) * 1000,
+        "p99Ms": percentile(latencies, 0.99) * 1000,
+        "firstPassP50Ms": percentile(passes[0], 0.5) * 1000,
+        "repeatPassP50Ms": percentile(passes[1], 0.5) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per load generator")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake Gemini time to first token")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    worker_counts = [int(count) for count in args.workers.split(",")]
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"\nimport main: {import_seconds(eager=False):.2f}s lazy SDK, {import_seconds(eager=True):.2f}s eager SDK")
+    print(f"{'workers':>8}{'ready lazy s':>14}{'ready eager s':>15}")
+    starts = []
+    for workers in worker_counts:
+        lazy, eager = cold_start(workers, {}), cold_start(workers, {"BENCH_EAGER_SDK": "1"})
+        starts.append({"workers": workers, "readyLazySeconds": lazy, "readyEagerSeconds": eager})
+        print(f"{workers:>8}{lazy:>14.2f}{eager:>15.2f}")
+
+    print(f"\n{'workers':>8}{'reqs':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'1st p50':>9}{'2nd p50':>9}")
+    results = []
+    for workers in worker_counts:
+        result = throughput(workers, args)
+        results.append(result)
+        print(f"{workers:>8}{result['requests']:>8}{result['errors']:>8}{result['requestsPerSecond']:>9.1f}"
+              f"{result['p50Ms']:>9.1f}{result['p99Ms']:>9.1f}{result['firstPassP50Ms']:>9.1f}{result['repeatPassP50Ms']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "coldStart": starts, "throughput": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
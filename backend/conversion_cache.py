@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_whitespace_re = re.compile(r"[ \t\r\f\v]+")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace within each line so trivially different inputs share a cache entry."""
+    lines = (_whitespace_re.sub(" ", line).strip() for line in text.strip().split("\n"))
+    return "\n".join(line for line in lines if line)
+
+def make_cache_key(endpoint: str, model_name: str, system_prompt: str, text: str) -> str:
+    """Build a cache key from the endpoint, model, prompt and normalized input."""
+    digest = hashlib.sha256()
+    for part in (endpoint, model_name, system_prompt, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class ConversionCache:
+    """In-memory LRU cache with TTL and optional SQLite persistence.
+
+    The SQLite file can be shared by several processes: a miss in memory is looked up in
+    the file, so a conversion stored by one worker is found by the others. Another worker
+    may hold the file's write lock for a moment, so nothing waits on the file from the
+    event loop: get() only reads memory, fetch() reads the file in a thread, and set() and
+    delete() update memory and leave the file to a background writer thread.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 7 * 24 * 3600, db_path: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._db = None
+        self._writes = None
+
+        if db_path:
+            # Other workers may hold the write lock for a moment
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=2.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # A cache can lose its last writes on power loss; skipping the fsync per entry matters more
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM conversions WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            # Lookups run in worker threads and share this connection; the writer has its own
+            self._read_lock = threading.Lock()
+            self._writes = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, name="conversion-cache-writer", daemon=True)
+            self._writer.start()
+
+    def get(self, key: str):
+        """Return the value cached in memory for key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        return self._hit(key, entry)
+
+    async def fetch(self, key: str):
+        """Return the cached value for key, looking it up in the SQLite file (in a thread) on a memory miss."""
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load, key)
+            # Another coroutine may have stored a newer value while the lookup ran
+            if entry is not None and key not in self._entries:
+                self._store(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        return self._hit(key, entry)
+
+    def set(self, key: str, value):
+        """Store a JSON-serializable value under key."""
+        entry = (time.time() + self.ttl_seconds, value)
+        self._store(key, entry)
+        if self._writes is not None:
+            self._writes.put(("INSERT OR REPLACE INTO conversions (key, value, expires_at) VALUES (?, ?, ?)",
+                              (key, json.dumps(value), entry[0])))
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+        if self._writes is not None:
+            self._writes.put(("DELETE FROM conversions WHERE key = ?", (key,)))
+
+    def close(self):
+        """Write out the queued entries and stop the writer thread."""
+        if self._writes is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writes = None
+
+    def _hit(self, key, entry):
+        expires_at, value = entry
+        if expires_at < time.time():
+            self.delete(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _load(self, key):
+        try:
+            with self._read_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM conversions WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Failed to read cache entry: %s", e)
+            return None
+        return (row[1], json.loads(row[0])) if row else None
+
+    def _write_loop(self):
+        # Off the event loop, so it can wait out another worker's write lock for longer
+        db = sqlite3.connect(self.db_path, timeout=30.0)
+        while True:
+            writes = [self._writes.get()]
+            # Commit everything queued so far in one transaction
+            while not self._writes.empty():
+                writes.append(self._writes.get())
+            stop = None in writes
+            try:
+                with db:
+                    for write in writes:
+                        if write is not None:
+                            db.execute(*write)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                logger.error("Failed to persist %d cache writes: %s", len(writes), e)
+            if stop:
+                db.close()
+                return
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            # Evicted entries stay on disk and are reloaded on the next lookup
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "persistent": self._db is not None,
+            "pendingWrites": self._writes.qsize() if self._writes is not None else 0,
+            "writeErrors": self.write_errors,
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+def error_payload(e: HTTPException) -> dict:
+    """The fields of an HTTP error response, as sent in an "error" event."""
+    payload = {"status": e.status_code, "detail": e.detail}
+    retry_after = (e.headers or {}).get("Retry-After")
+    if retry_after is not None:
+        payload["retryAfter"] = int(retry_after)
+    return payload
+
+class ConversionChannel:
+    """Multiplex conversions over one WebSocket, keyed by a request id the client chooses.
+
+    Client messages are JSON objects:
+        {"id": ..., "type": "<conversion>", "key": ..., <request fields>}
+        {"id": ..., "type": "cancel"}
+    Each conversion runs as its own task and every event it produces is sent as
+    {"id", "event", "data"} as soon as it is ready, so slow conversions never hold up fast
+    ones. A new request with the same optional "key" (e.g. the editor node being typed in)
+    cancels the one it supersedes. Cancelled requests get a "cancelled" event and no others.
+
+    conversions maps a message type to (request model, handler); the handler takes the
+    validated request and yields (event, data) pairs, raising HTTPException like the REST
+    endpoints. admit(type) returns None or an HTTPException refusing the request.
+    """
+
+    def __init__(self, websocket, conversions: dict, admit, max_in_flight: int = 32, on_finish=None):
+        self.websocket = websocket
+        self.conversions = conversions
+        self.admit = admit
+        self.max_in_flight = max_in_flight
+        self.on_finish = on_finish  # called with (type, outcome) when a conversion ends
+        self.closed = False
+        self._tasks = {}  # request id -> task
+        self._keys = {}  # supersede key -> request id
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, request_id, event: str, data):
+        # Events from concurrent conversions must not interleave on the socket. Once the
+        # connection is gone sends are dropped; the receive loop notices and cancels the rest.
+        if self.closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_json({"id": request_id, "event": event, "data": data})
+            except Exception:
+                self.closed = True
+
+    async def handle(self, message: dict):
+        request_id = message.get("id")
+        kind = message.get("type")
+        if request_id is None:
+            await self.send(None, "error", {"status": 400, "detail": "Message needs an id"})
+            return
+        if kind == "cancel":
+            await self.cancel(request_id)
+            return
+        if kind not in self.conversions:
+            await self.send(request_id, "error", {"status": 400, "detail": f"Unknown message type: {kind}"})
+            return
+        if request_id in self._tasks:
+            await self.send(request_id, "error", {"status": 409, "detail": "A request with this id is still running"})
+            return
+        if len(self._tasks) >= self.max_in_flight:
+            await self.send(request_id, "error", {"status": 429, "detail": "Too many conversions in flight on this connection"})
+            return
+        refused = self.admit(kind)
+        if refused is not None:
+            await self.send(request_id, "error", error_payload(refused))
+            return
+
+        key = message.get("key")
+        if key is not None:
+            superseded = self._keys.get(key)
+            if superseded is not None:
+                await self.cancel(superseded)
+            self._keys[key] = request_id
+
+        task = asyncio.create_task(self._run(request_id, kind, message))
+        task.add_done_callback(lambda done: self._finish(request_id, kind, key, done))
+        self._tasks[request_id] = task
+
+    async def cancel(self, request_id):
+        task = self._tasks.pop(request_id, None)
+        if task is None:
+            return  # already finished; its last event has been sent
+        task.cancel()
+        await self.send(request_id, "cancelled", {})
+
+    async def _run(self, request_id, kind: str, message: dict) -> str:
+        request_model, handler = self.conversions[kind]
+        outcome = "done"
+        try:
+            async for event, data in handler(request_model.model_validate(message)):
+                if event == "error":
+                    outcome = "error"
+                await self.send(request_id, event, data)
+            return outcome
+        except ValidationError as e:
+            await self.send(request_id, "error", {"status": 422, "detail": e.errors(include_url=False, include_context=False)})
+        except HTTPException as e:
+            await self.send(request_id, "error", error_payload(e))
+        except Exception as e:
+            logger.error("WebSocket %s conversion failed: %s", kind, e)
+            await self.send(request_id, "error", {"status": 500, "detail": "Conversion failed"})
+        return "error"
+
+    def _finish(self, request_id, kind: str, key, task):
+        # A done callback rather than a finally block, so tasks cancelled before they started are counted too
+        if self._tasks.get(request_id) is task:
+            del self._tasks[request_id]
+        if key is not None and self._keys.get(key) == request_id:
+            del self._keys[key]
+        if self.on_finish is not None:
+            self.on_finish(kind, "cancelled" if task.cancelled() else task.result())
+
+    async def close(self):
+        """Cancel every running conversion; called when the connection ends."""
+        self.closed = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
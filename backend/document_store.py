@@ -0,0 +1,430 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from search_index import (
+    MATCH_END, MATCH_START, IndexedText, highlight_segments, indexed_text, math_terms, search_query, steps_text
+)
+
+def _serialized(method):
+    """Hold the store's lock for the call: every thread shares one SQLite connection."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+class DocumentNotFound(Exception):
+    pass
+
+class VersionConflict(Exception):
+    """Steps were based on an older version; the client must fetch the newer steps and rebase."""
+
+    def __init__(self, version: int):
+        super().__init__(f"Document is at version {version}")
+        self.version = version
+
+class StepsCompacted(Exception):
+    """The requested steps were folded into a snapshot; the client must reload the document."""
+
+def _dumps(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+# Search index rows of a document are rowids (key << _SLOT_BITS) + slot: its title, the text of
+# the steps since its snapshot, then one row per top-level block
+_SLOT_BITS = 32
+_TITLE_SLOT, _STEPS_SLOT, _FIRST_BLOCK_SLOT = 0, 1, 2
+# Title matches count most, then LaTeX, then text (latex is stored for display only)
+_RANK = "bm25(10.0, 1.0, 2.0, 0.0)"
+_SEARCH_COLUMNS = "title, text, math, latex UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2'"
+
+class DocumentStore:
+    """TipTap documents in SQLite (WAL), saved as ProseMirror steps instead of whole documents.
+
+    Like the prosemirror-collab authority, the store keeps an append-only log of steps with a
+    version per document; a save only appends the new steps. The client, which can apply
+    steps, periodically sends a snapshot of the document at some version: steps up to that
+    version are then dropped. Snapshots are stored per top-level block, content-addressed,
+    so compaction only writes blocks that changed and large documents load page by page.
+
+    Documents are searchable through an FTS5 index kept in the same database and updated in
+    the same transactions as the blocks and steps: a save reindexes only what it wrote.
+    """
+
+    def __init__(self, db_path: str, compact_after_steps: int = 200, max_ranked_blocks: int = 1000):
+        self.compact_after_steps = compact_after_steps
+        self.max_ranked_blocks = max_ranked_blocks
+        self.saves = 0
+        self.steps_appended = 0
+        self.snapshots = 0
+        self.blocks_written = 0
+        self.bytes_written = 0
+        self.conflicts = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+        # Callers run in worker threads (asyncio.to_thread); public methods take this lock
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=2.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent on a crash; NORMAL only risks the last commits on power loss
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY, title TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " version INTEGER NOT NULL, snapshot_version INTEGER NOT NULL, block_count INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS document_blocks ("
+            " doc_id TEXT NOT NULL, idx INTEGER NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (doc_id, idx));"
+            "CREATE INDEX IF NOT EXISTS document_blocks_hash ON document_blocks (hash);"
+            "CREATE TABLE IF NOT EXISTS blocks (hash TEXT PRIMARY KEY, content TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS document_steps ("
+            " doc_id TEXT NOT NULL, version INTEGER NOT NULL, step TEXT NOT NULL, client_id TEXT,"
+            " PRIMARY KEY (doc_id, version));"
+            # Integer keys for the search index rowids; a table's own rowids may change on VACUUM
+            "CREATE TABLE IF NOT EXISTS search_documents (key INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE);"
+        )
+        self._db.commit()
+        self._create_search_index()
+        self._db.execute(f"CREATE VIRTUAL TABLE temp.search_snippets USING fts5({_SEARCH_COLUMNS})")
+
+    def _create_search_index(self):
+        # Documents saved before the index existed are indexed once. Other workers starting at
+        # the same time wait for the write lock (longer than usual) and find the index built
+        self._db.execute("PRAGMA busy_timeout = 60000")
+        try:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                if self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'document_search'").fetchone():
+                    return
+                self._db.execute(f"CREATE VIRTUAL TABLE document_search USING fts5({_SEARCH_COLUMNS})")
+                self._db.execute("INSERT INTO document_search (document_search, rank) VALUES ('rank', ?)", (_RANK,))
+                for doc_id, title in self._db.execute("SELECT id, title FROM documents").fetchall():
+                    key = self._search_key(doc_id)
+                    self._index_row(key, _TITLE_SLOT, title=title)
+                    rows = self._db.execute(
+                        "SELECT d.idx, b.content FROM document_blocks d JOIN blocks b ON b.hash = d.hash WHERE d.doc_id = ?",
+                        (doc_id,)
+                    ).fetchall()
+                    for index, content in rows:
+                        self._index_row(key, _FIRST_BLOCK_SLOT + index, *indexed_text(json.loads(content)))
+                    snapshot_version = self._meta(doc_id)["snapshotVersion"]
+                    self._index_row(key, _STEPS_SLOT, *steps_text(self._steps_after(doc_id, snapshot_version)))
+        finally:
+            self._db.execute("PRAGMA busy_timeout = 2000")
+
+    def _meta(self, doc_id: str) -> dict:
+        row = self._db.execute(
+            "SELECT id, title, created_at, updated_at, version, snapshot_version, block_count"
+            " FROM documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+        if row is None:
+            raise DocumentNotFound(doc_id)
+        return self._meta_dict(row)
+
+    @staticmethod
+    def _meta_dict(row) -> dict:
+        return {
+            "id": row[0],
+            "title": row[1],
+            "createdAt": row[2],
+            "updatedAt": row[3],
+            "version": row[4],
+            "snapshotVersion": row[5],
+            "blockCount": row[6],
+        }
+
+    @_serialized
+    def list(self) -> list:
+        rows = self._db.execute(
+            "SELECT id, title, created_at, updated_at, version, snapshot_version, block_count"
+            " FROM documents ORDER BY updated_at DESC"
+        ).fetchall()
+        return [self._meta_dict(row) for row in rows]
+
+    @_serialized
+    def create(self, title: str, content: dict = None) -> dict:
+        doc_id = uuid.uuid4().hex
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, 0, 0, 0)", (doc_id, title, now, now)
+            )
+            self._index_row(self._search_key(doc_id), _TITLE_SLOT, title=title)
+            self._write_blocks(doc_id, (content or {}).get("content", []))
+        return self._meta(doc_id)
+
+    @_serialized
+    def rename(self, doc_id: str, title: str) -> dict:
+        with self._db:
+            updated = self._db.execute(
+                "UPDATE documents SET title = ?, updated_at = ? WHERE id = ?", (title, time.time(), doc_id)
+            ).rowcount
+            if updated:
+                self._index_row(self._search_key(doc_id), _TITLE_SLOT, title=title)
+        if not updated:
+            raise DocumentNotFound(doc_id)
+        return self._meta(doc_id)
+
+    @_serialized
+    def delete(self, doc_id: str):
+        with self._db:
+            old_hashes = self._block_hashes(doc_id)
+            if not self._db.execute("DELETE FROM documents WHERE id = ?", (doc_id,)).rowcount:
+                raise DocumentNotFound(doc_id)
+            self._db.execute("DELETE FROM document_blocks WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM document_steps WHERE doc_id = ?", (doc_id,))
+            key = self._search_key(doc_id)
+            self._unindex_rows(key, _TITLE_SLOT)
+            self._db.execute("DELETE FROM search_documents WHERE key = ?", (key,))
+            self._collect_blocks(set(old_hashes))
+
+    @_serialized
+    def load(self, doc_id: str, offset: int = 0, limit: int = 200) -> dict:
+        """One page of the snapshot's top-level blocks; the last page also carries the steps after it."""
+        meta = self._meta(doc_id)
+        rows = self._db.execute(
+            "SELECT b.content FROM document_blocks d JOIN blocks b ON b.hash = d.hash"
+            " WHERE d.doc_id = ? AND d.idx >= ? AND d.idx < ? ORDER BY d.idx",
+            (doc_id, offset, offset + limit)
+        ).fetchall()
+        page = {**meta, "offset": offset, "blocks": [json.loads(row[0]) for row in rows]}
+        page["complete"] = offset + limit >= meta["blockCount"]
+        if page["complete"]:
+            page["steps"] = self._steps_after(doc_id, meta["snapshotVersion"])
+        return page
+
+    @_serialized
+    def steps_since(self, doc_id: str, version: int) -> dict:
+        meta = self._meta(doc_id)
+        if version < meta["snapshotVersion"]:
+            raise StepsCompacted(f"Steps before version {meta['snapshotVersion']} were compacted")
+        return {"version": meta["version"], "steps": self._steps_after(doc_id, version)}
+
+    @_serialized
+    def append_steps(self, doc_id: str, version: int, steps: list, client_id: str = None) -> dict:
+        """Append steps made on top of version; raises VersionConflict if the document moved on."""
+        rows = [_dumps(step) for step in steps]
+        try:
+            with self._db:
+                meta = self._meta(doc_id)
+                if version != meta["version"]:
+                    raise VersionConflict(meta["version"])
+                self._db.executemany(
+                    "INSERT INTO document_steps VALUES (?, ?, ?, ?)",
+                    [(doc_id, version + number, step, client_id) for number, step in enumerate(rows, start=1)]
+                )
+                new_version = version + len(rows)
+                self._db.execute(
+                    "UPDATE documents SET version = ?, updated_at = ? WHERE id = ?", (new_version, time.time(), doc_id)
+                )
+                self._index_steps(doc_id, steps)
+        except sqlite3.IntegrityError:
+            # Another worker process appended steps for the same version first
+            self.conflicts += 1
+            raise VersionConflict(self._meta(doc_id)["version"])
+        except VersionConflict:
+            self.conflicts += 1
+            raise
+
+        written = sum(len(step) for step in rows)
+        self.saves += 1
+        self.steps_appended += len(rows)
+        self.bytes_written += written
+        return {
+            "version": new_version,
+            "bytesWritten": written,
+            # Ask the client for a snapshot once replaying the log on load gets expensive
+            "snapshotRequested": new_version - meta["snapshotVersion"] >= self.compact_after_steps,
+        }
+
+    @_serialized
+    def save_snapshot(self, doc_id: str, version: int, content: dict) -> dict:
+        """Replace the snapshot with the document at version and drop the steps it includes."""
+        with self._db:
+            meta = self._meta(doc_id)
+            if version > meta["version"]:
+                raise VersionConflict(meta["version"])
+            if version <= meta["snapshotVersion"]:
+                return {"version": meta["version"], "snapshotVersion": meta["snapshotVersion"], "bytesWritten": 0}
+
+            blocks_written, written = self._write_blocks(doc_id, content.get("content", []))
+            self._db.execute("DELETE FROM document_steps WHERE doc_id = ? AND version <= ?", (doc_id, version))
+            self._db.execute("UPDATE documents SET snapshot_version = ? WHERE id = ?", (version, doc_id))
+            # The snapshot now has the text of the steps it includes; keep that of the later ones
+            self._index_row(self._search_key(doc_id), _STEPS_SLOT, *steps_text(self._steps_after(doc_id, version)))
+
+        self.saves += 1
+        self.snapshots += 1
+        self.blocks_written += blocks_written
+        self.bytes_written += written
+        return {"version": meta["version"], "snapshotVersion": version, "bytesWritten": written}
+
+    def _steps_after(self, doc_id: str, version: int) -> list:
+        rows = self._db.execute(
+            "SELECT step FROM document_steps WHERE doc_id = ? AND version > ? ORDER BY version", (doc_id, version)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _block_hashes(self, doc_id: str) -> list:
+        rows = self._db.execute(
+            "SELECT hash FROM document_blocks WHERE doc_id = ? ORDER BY idx", (doc_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _write_blocks(self, doc_id: str, blocks: list):
+        """Point the document at blocks, writing only content not stored yet; returns (blocks, bytes) written."""
+        old_hashes = self._block_hashes(doc_id)
+        known = set(old_hashes)
+        key = self._search_key(doc_id)
+        blocks_written = written = 0
+        new_hashes = []
+        for index, block in enumerate(blocks):
+            content = _dumps(block)
+            block_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            new_hashes.append(block_hash)
+            # Unchanged blocks of this document are skipped without a query
+            if block_hash not in known and self._db.execute(
+                "INSERT OR IGNORE INTO blocks VALUES (?, ?)", (block_hash, content)
+            ).rowcount:
+                blocks_written += 1
+                written += len(content)
+            if index >= len(old_hashes) or old_hashes[index] != block_hash:
+                self._db.execute("INSERT OR REPLACE INTO document_blocks VALUES (?, ?, ?)", (doc_id, index, block_hash))
+                self._index_row(key, _FIRST_BLOCK_SLOT + index, *indexed_text(block))
+
+        self._db.execute("DELETE FROM document_blocks WHERE doc_id = ? AND idx >= ?", (doc_id, len(new_hashes)))
+        if len(new_hashes) < len(old_hashes):
+            self._unindex_rows(key, _FIRST_BLOCK_SLOT + len(new_hashes))
+        self._db.execute("UPDATE documents SET block_count = ? WHERE id = ?", (len(new_hashes), doc_id))
+        self._collect_blocks(set(old_hashes) - set(new_hashes))
+        return blocks_written, written
+
+    def _collect_blocks(self, hashes: set):
+        # Blocks are shared between documents (and repeated within one), so only drop unreferenced ones
+        for block_hash in hashes:
+            self._db.execute(
+                "DELETE FROM blocks WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM document_blocks WHERE hash = ?)",
+                (block_hash, block_hash)
+            )
+
+    def _search_key(self, doc_id: str) -> int:
+        self._db.execute("INSERT OR IGNORE INTO search_documents (doc_id) VALUES (?)", (doc_id,))
+        return self._db.execute("SELECT key FROM search_documents WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+    def _index_row(self, key: int, slot: int, text: str = "", math: str = "", latex: str = "", title: str = ""):
+        rowid = (key << _SLOT_BITS) + slot
+        if text or math or title:
+            self._db.execute(
+                "INSERT OR REPLACE INTO document_search (rowid, title, text, math, latex) VALUES (?, ?, ?, ?, ?)",
+                (rowid, title, text, math, latex)
+            )
+        else:
+            self._db.execute("DELETE FROM document_search WHERE rowid = ?", (rowid,))
+
+    def _unindex_rows(self, key: int, first_slot: int):
+        self._db.execute(
+            "DELETE FROM document_search WHERE rowid >= ? AND rowid < ?",
+            ((key << _SLOT_BITS) + first_slot, (key + 1) << _SLOT_BITS)
+        )
+
+    def _index_steps(self, doc_id: str, steps: list):
+        added = steps_text(steps)
+        if not (added.text or added.math):
+            return
+        key = self._search_key(doc_id)
+        row = self._db.execute(
+            "SELECT text, math, latex FROM document_search WHERE rowid = ?", ((key << _SLOT_BITS) + _STEPS_SLOT,)
+        ).fetchone()
+        if row is not None:
+            text, math, latex = row
+            added = IndexedText(f"{text} {added.text}".strip(), f"{math} {added.math}".strip(),
+                                "\n".join(filter(None, (latex, added.latex))))
+        self._index_row(key, _STEPS_SLOT, *added)
+
+    @_serialized
+    def search(self, query: str, limit: int = 20) -> list:
+        """Documents matching query, best first, each with the block that matched best and a snippet of it.
+
+        Documents are ranked by the BM25 scores of their matching title and blocks. Scoring is
+        most of a query's cost, so a query matching more than max_ranked_blocks blocks (a very
+        common word) only ranks the matches in the most recently created documents.
+        """
+        parsed = search_query(query)
+        if parsed is None:
+            return []
+        started = time.perf_counter()
+        # min() also picks the rowid of each document's best block (titles count for the score only)
+        rows = self._db.execute(
+            "SELECT d.id, d.title, d.created_at, d.updated_at, d.version, d.snapshot_version, d.block_count,"
+            " hits.score, hits.matches, hits.best FROM ("
+            "  SELECT key, sum(rank) AS score, count(*) AS matches,"
+            f"  min(CASE WHEN rowid & {(1 << _SLOT_BITS) - 1} != {_TITLE_SLOT} THEN rank END), rowid AS best FROM ("
+            f"   SELECT rowid, rowid >> {_SLOT_BITS} AS key, rank FROM document_search WHERE document_search MATCH ?"
+            "    ORDER BY rowid DESC LIMIT ?"
+            "  ) GROUP BY key ORDER BY score LIMIT ?"
+            " ) hits JOIN search_documents s ON s.key = hits.key JOIN documents d ON d.id = s.doc_id"
+            " ORDER BY hits.score",
+            (parsed.expression, self.max_ranked_blocks, limit)
+        ).fetchall()
+        snippets = self._snippets(parsed, [row[9] for row in rows])
+
+        results = []
+        for row in rows:
+            score, matches, best = row[7:]
+            slot = best & ((1 << _SLOT_BITS) - 1)
+            results.append({
+                **self._meta_dict(row),
+                "score": -score,
+                "matches": matches,
+                # Matches in the title, or in steps not compacted into the snapshot yet, have no block to point at
+                "block": slot - _FIRST_BLOCK_SLOT if slot >= _FIRST_BLOCK_SLOT else None,
+                "snippet": snippets.get(best, []) if slot != _TITLE_SLOT else [],
+            })
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return results
+
+    def _snippets(self, parsed, rowids: list) -> dict:
+        # snippet() on the index itself walks a common term's whole doclist for every row asked
+        # for; copied into a scratch table of just these rows, the same query takes microseconds
+        if not rowids:
+            return {}
+        with self._db:
+            self._db.execute("DELETE FROM temp.search_snippets")
+            self._db.execute(
+                "INSERT INTO temp.search_snippets (rowid, title, text, math, latex)"
+                f" SELECT rowid, title, text, math, latex FROM document_search WHERE rowid IN ({', '.join('?' * len(rowids))})",
+                rowids
+            )
+            rows = self._db.execute(
+                f"SELECT rowid, snippet(search_snippets, 1, '{MATCH_START}', '{MATCH_END}', '…', 16), latex"
+                " FROM temp.search_snippets WHERE search_snippets MATCH ?",
+                (parsed.expression,)
+            ).fetchall()
+        return {rowid: self._snippet(snippet, latex, parsed.math) for rowid, snippet, latex in rows}
+
+    @staticmethod
+    def _snippet(snippet: str, latex: str, terms: tuple) -> list:
+        if MATCH_START in snippet or not latex:
+            return highlight_segments(snippet)
+        # Only the math matched: show the LaTeX node it matched in
+        sources = latex.split("\n")
+        phrase = " ".join(terms)
+        source = next((source for source in sources if phrase in " ".join(math_terms(source))), sources[0])
+        return [{"text": source, "match": True}]
+
+    def stats(self) -> dict:
+        return {
+            "saves": self.saves,
+            "stepsAppended": self.steps_appended,
+            "snapshots": self.snapshots,
+            "blocksWritten": self.blocks_written,
+            "bytesWritten": self.bytes_written,
+            "versionConflicts": self.conflicts,
+            "searches": self.searches,
+            "searchSeconds": self.search_seconds,
+        }
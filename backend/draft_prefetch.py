@@ -0,0 +1,138 @@
+import asyncio
+import re
+from collections import OrderedDict
+
+# A draft ending like this is still being typed ("x over", "integral from 0 to")
+_unfinished_re = re.compile(
+    r"(?:\b(?:of|over|to|from|plus|minus|times|divided|by|equals|and|or|with|as|the|is)"
+    r"|[-+*/^_=<>(\[{,\\])\s*$",
+    re.IGNORECASE
+)
+
+def looks_unfinished(text: str) -> bool:
+    """True if the text ends mid-expression, so converting it now would almost surely be wasted."""
+    return bool(_unfinished_re.search(text))
+
+class _Draft:
+    __slots__ = ("text", "task", "sent", "used")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.task = None
+        self.sent = False  # the speculative call went upstream
+        self.used = False
+
+class DraftPrefetcher:
+    """Convert text speculatively while the user is still typing it, so the final request finds it ready.
+
+    Each session (one input being edited by one client) has at most one draft. A client keeps
+    at most max_sessions_per_client sessions, its oldest dropped first; past max_sessions in
+    all, the least recently active client loses its oldest session, so no single client can
+    push the others out. A newer draft with different
+    text cancels the previous one: its debounce timer if it was still waiting, or its upstream
+    call if it was already sent. After debounce_seconds without a newer draft, prefetch() runs;
+    it fills the cache the final request reads from and returns False if it chose not to call
+    upstream. commit() records whether the final text matched what was prefetched.
+
+    Speculative calls that are cancelled or never committed are counted as wasted.
+    """
+
+    def __init__(self, debounce_seconds: float = 0.4, max_sessions: int = 1000, max_sessions_per_client: int = 16):
+        self.debounce_seconds = debounce_seconds
+        self.max_sessions = max_sessions
+        self.max_sessions_per_client = max_sessions_per_client
+        self.drafts = 0
+        self.sent = 0
+        self.skipped = 0
+        self.used = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self._clients = OrderedDict()  # client -> OrderedDict of session id -> _Draft
+        self._session_count = 0
+
+    def draft(self, client: str, session: str, text: str, prefetch=None):
+        """Record the current text of a client's session; schedule prefetch() unless it is None."""
+        self.drafts += 1
+        sessions = self._clients.get(client)
+        if sessions is None:
+            sessions = self._clients[client] = OrderedDict()
+        self._clients.move_to_end(client)
+
+        current = sessions.get(session)
+        if current is not None:
+            sessions.move_to_end(session)
+            if current.text == text and (prefetch is None or current.task is not None):
+                return
+            self._discard(current)
+        else:
+            self._session_count += 1
+
+        draft = sessions[session] = _Draft(text)
+        if prefetch is not None:
+            draft.task = asyncio.ensure_future(self._run(draft, prefetch))
+        if len(sessions) > self.max_sessions_per_client:
+            self._evict(client)
+        if self._session_count > self.max_sessions:
+            self._evict(next(iter(self._clients)))
+
+    def commit(self, client: str, session: str, text: str) -> bool:
+        """The session's final text arrived; returns True if it was already prefetched or in flight."""
+        sessions = self._clients.get(client)
+        draft = sessions.pop(session, None) if sessions is not None else None
+        if draft is None:
+            return False
+        self._session_count -= 1
+        if not sessions:
+            del self._clients[client]
+        if draft.text == text and draft.sent:
+            draft.used = True
+            self.used += 1
+            return True
+        self._discard(draft)
+        return False
+
+    async def _run(self, draft: _Draft, prefetch):
+        await asyncio.sleep(self.debounce_seconds)
+        draft.sent = True
+        try:
+            if not await prefetch():
+                draft.sent = False
+                self.skipped += 1
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The final request will run the conversion again and report the error
+            pass
+        self.sent += 1
+
+    def _evict(self, client: str):
+        """Drop the client's oldest session."""
+        sessions = self._clients[client]
+        _, oldest = sessions.popitem(last=False)
+        self._session_count -= 1
+        if not sessions:
+            del self._clients[client]
+        self._discard(oldest)
+
+    def _discard(self, draft: _Draft):
+        if draft.task is not None and not draft.task.done():
+            draft.task.cancel()
+            if draft.sent:
+                self.cancelled += 1
+                self.sent += 1
+        if draft.sent and not draft.used:
+            self.wasted += 1
+
+    def stats(self) -> dict:
+        return {
+            "drafts": self.drafts,
+            "speculativeCalls": self.sent,
+            "speculativeSkipped": self.skipped,
+            "speculativeUsed": self.used,
+            "speculativeCancelled": self.cancelled,
+            "speculativeWasted": self.wasted,
+            "wastedCallRatio": self.wasted / self.sent if self.sent else 0.0,
+            "draftSessions": self._session_count,
+            "draftClients": len(self._clients),
+        }
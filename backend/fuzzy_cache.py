@@ -0,0 +1,215 @@
+import re
+from collections import OrderedDict
+from typing import NamedTuple
+
+from latex_rules import SYMBOL_WORDS, UPPERCASE_GREEK
+
+# Spoken forms mapped to the token the canonical form uses; SYMBOL_WORDS adds symbols and Greek letters
+_PHRASES = {
+    **SYMBOL_WORDS,
+    "double integral": "\\iint",
+    "integral": "\\int",
+    "integrate": "\\int",
+    "int": "\\int",
+    "square root of": "\\sqrt",
+    "square root": "\\sqrt",
+    "sqrt": "\\sqrt",
+    "squared": "^ 2",
+    "cubed": "^ 3",
+    "raised to the power of": "^",
+    "to the power of": "^",
+    "to the power": "^",
+    "raised to": "^",
+    "to the": "^",
+    "plus": "+",
+    "minus": "-",
+    "divided by": "/",
+    "over": "/",
+    "is equal to": "=",
+    "equal to": "=",
+    "equals": "=",
+    "summation": "\\sum",
+    "sum": "\\sum",
+    "limit": "\\lim",
+    "lim": "\\lim",
+    "approaches": "\\to",
+    "goes to": "\\to",
+    "tends to": "\\to",
+    "sine": "\\sin",
+    "sin": "\\sin",
+    "cosine": "\\cos",
+    "cos": "\\cos",
+    "tangent": "\\tan",
+    "tan": "\\tan",
+    "natural log of": "\\ln",
+    "natural log": "\\ln",
+    "ln": "\\ln",
+    "logarithm": "\\log",
+    "log": "\\log",
+    "factorial": "!",
+    "subscript": "_",
+    "sub": "_",
+    **{word: str(number) for number, word in enumerate(
+        ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"])},
+}
+_phrase_re = re.compile(
+    r"(?<![\\A-Za-z])(?:" + "|".join(re.escape(phrase) for phrase in sorted(_PHRASES, key=len, reverse=True)) + r")(?![A-Za-z])",
+    re.IGNORECASE
+)
+_uppercase_greek = {name.lower(): f"\\{name}" for name in UPPERCASE_GREEK}
+_token_re = re.compile(r"\\[A-Za-z]+|[A-Za-z]+|\d+(?:\.\d+)?|\*\*|[^\sA-Za-z\d]")
+
+# Dropped from the canonical form
+_FILLER_WORDS = {"the", "an", "of"}
+# Kept in the canonical form but free to differ between near matches ("from 0 to 1" / "between 0 and 1")
+_CONNECTIVES = {
+    "from", "to", "between", "and", "with", "by", "at", "for", "in", "on", "is", "are",
+    "as", "when", "where", "that", "then", "respect", "wrt", "all", "s",
+}
+
+_OPERATORS = {"+", "-", "*", "/", "^", "_", "=", "<", ">", "!", ","}
+
+def _phrase_token(match) -> str:
+    phrase = match.group(0)
+    # "Delta" and "delta" are different letters
+    if phrase[0].isupper() and phrase.lower() in _uppercase_greek:
+        return f" {_uppercase_greek[phrase.lower()]} "
+    return f" {_PHRASES[phrase.lower()]} "
+
+def canonical_tokens(text: str) -> list:
+    """Tokens of text with spoken forms replaced by symbols, e.g. "int x squared dx" -> \\int x ^ 2 dx.
+
+    Only spoken words are case-insensitive: "Ax" and "ax" or "AB" and "ab" stay different.
+    "between a and b" reads as "from a to b".
+    """
+    tokens = []
+    in_between = False
+    for token in _token_re.findall(_phrase_re.sub(_phrase_token, text)):
+        if token == "**":
+            token = "^"
+        elif len(token) > 1 and token.lower() in _FILLER_WORDS:
+            continue
+        elif len(token) > 1 and token.lower() in _CONNECTIVES:
+            token = token.lower()
+            if token == "between":
+                token, in_between = "from", True
+            elif token == "and" and in_between:
+                token, in_between = "to", False
+        # "f(x)" reads the same as "f of x"
+        if len(tokens) >= 2 and token == ")" and tokens[-2] == "(" and tokens[-1] not in _OPERATORS:
+            tokens[-2:] = tokens[-1:]
+            continue
+        tokens.append(token)
+    return tokens
+
+def _anchor_key(tokens: list) -> int:
+    # Everything but the connectives, in order: near matches may only differ in connectives.
+    # Kept as a hash to save memory; a collision only adds a candidate to the similarity check
+    return hash(" ".join(token for token in tokens if token not in _CONNECTIVES))
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(max(len(text) - 2, 1))}
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the character trigrams of two canonical forms."""
+    a_grams, b_grams = _trigrams(a), _trigrams(b)
+    return len(a_grams & b_grams) / len(a_grams | b_grams)
+
+class FuzzyMatch(NamedTuple):
+    latex: str
+    similarity: float
+    matched: str  # canonical form of the cached input that matched
+
+class FuzzyLatexIndex:
+    """Find cached conversions for inputs that say the same thing in different words.
+
+    Inputs are reduced to a canonical token form ("integral of x^2 dx", "int x squared dx"
+    and "integral x^2 dx" all become "\\int x ^ 2 dx"); equal canonical forms are a match.
+    Otherwise the candidates are inputs with the same tokens in the same order apart from
+    connectives, like "as x approaches 0" versus "when x tends to 0". The closest one is a
+    match if its trigram similarity reaches threshold; connectives weigh the most in short
+    inputs, so those need more of them in common.
+
+    Requiring identical math tokens is what keeps precision high: "x^2 from 0 to 1" and
+    "x^2 from 0 to 2" are close as strings but never match. A general n-gram index (MinHash
+    with LSH) would still need that check, and the anchor key already is an exact index,
+    so lookups are a dict access plus at most max_candidates similarity checks.
+    """
+
+    def __init__(self, max_entries: int = 200000, threshold: float = 0.35, max_candidates: int = 8):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.agreed = 0
+        self._entries = OrderedDict()  # canonical form -> (latex, anchor key)
+        self._candidates = {}  # anchor key -> canonical forms, most recent last
+
+    def add(self, text: str, latex: str):
+        canonical_list = canonical_tokens(text)
+        if not canonical_list:
+            return
+        canonical = " ".join(canonical_list)
+        anchor = _anchor_key(canonical_list)
+
+        previous = self._entries.pop(canonical, None)
+        if previous is not None:
+            self._unlink(canonical, previous[1])
+        self._entries[canonical] = (latex, anchor)
+        bucket = self._candidates.setdefault(anchor, [])
+        bucket.append(canonical)
+        if len(bucket) > self.max_candidates:
+            del bucket[0]
+
+        while len(self._entries) > self.max_entries:
+            oldest, (_, oldest_anchor) = self._entries.popitem(last=False)
+            self._unlink(oldest, oldest_anchor)
+
+    def lookup(self, text: str):
+        """Return a FuzzyMatch for the closest cached input at or above threshold, or None."""
+        canonical_list = canonical_tokens(text)
+        canonical = " ".join(canonical_list)
+        entry = self._entries.get(canonical)
+        if entry is not None:
+            self._entries.move_to_end(canonical)
+            self.exact_hits += 1
+            return FuzzyMatch(entry[0], 1.0, canonical)
+
+        best, best_similarity = None, self.threshold
+        for candidate in self._candidates.get(_anchor_key(canonical_list), ()):
+            candidate_similarity = similarity(canonical, candidate)
+            if candidate_similarity >= best_similarity:
+                best, best_similarity = candidate, candidate_similarity
+        if best is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best)
+        self.near_hits += 1
+        return FuzzyMatch(self._entries[best][0], best_similarity, best)
+
+    def record_verification(self, agreed: bool):
+        """Record whether upstream's answer for a fuzzy hit matched the cached one."""
+        self.verified += 1
+        self.agreed += agreed
+
+    def _unlink(self, canonical: str, anchor: int):
+        bucket = self._candidates.get(anchor)
+        if bucket and canonical in bucket:
+            bucket.remove(canonical)
+            if not bucket:
+                del self._candidates[anchor]
+
+    def stats(self) -> dict:
+        return {
+            "fuzzyEntries": len(self._entries),
+            "fuzzyExactHits": self.exact_hits,
+            "fuzzyNearHits": self.near_hits,
+            "fuzzyMisses": self.misses,
+            "fuzzyVerified": self.verified,
+            "fuzzyAgreed": self.agreed,
+            "fuzzyPrecision": self.agreed / self.verified if self.verified else None,
+        }
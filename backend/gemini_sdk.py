@@ -0,0 +1,48 @@
+import asyncio
+import importlib
+import threading
+
+class LazySdk:
+    """Stand-in for the google.generativeai module that imports it on first use.
+
+    The SDK takes about a second to import (gRPC, protobuf, the discovery clients), which
+    was most of the backend's startup time and is paid again by every worker process.
+    configure() is recorded and applied once the module is loaded; any other attribute
+    loads it. load() can be called from a thread to import it in the background; code on the
+    event loop awaits ready() before touching the SDK, so it never runs the import itself.
+    """
+
+    def __init__(self, module_name: str = "google.generativeai"):
+        self._module_name = module_name
+        self._module = None
+        self._configuration = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def configure(self, **kwargs):
+        self._configuration = kwargs
+        if self._module is not None:
+            self._module.configure(**kwargs)
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._module_name)
+                    if self._configuration is not None:
+                        module.configure(**self._configuration)
+                    self._module = module
+        return self._module
+
+    async def ready(self):
+        """Load the module in a thread, waiting for a background import already under way."""
+        if self._module is None:
+            await asyncio.to_thread(self.load)
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+genai = LazySdk()
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from admission import PRIORITY_INTERACTIVE
+
+# Formats accepted for upload: Pillow format -> (media type, file extension)
+IMAGE_FORMATS = {
+    "JPEG": ("image/jpeg", "jpg"),
+    "PNG": ("image/png", "png"),
+    "GIF": ("image/gif", "gif"),
+    "WEBP": ("image/webp", "webp"),
+}
+VARIANT_MEDIA_TYPE = "image/webp"
+ORIGINAL = "original"
+THUMBNAIL = "thumb"
+
+_image_id_re = re.compile(r"^[0-9a-f]{64}$")
+
+class ImageRejected(ValueError):
+    def __init__(self, message: str, status_code: int = 415):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Raised in worker processes; keep the status code when it is pickled back
+        return ImageRejected, (str(self), self.status_code)
+
+def _write_atomic(path: str, data: bytes):
+    # Readers never see a partial file, and concurrent writers of the same image write the same bytes
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def _save_variant(image, path: str) -> dict:
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=82, method=4)
+    _write_atomic(path, buffer.getvalue())
+    return {"width": image.width, "height": image.height, "bytes": buffer.tell()}
+
+def process_image(directory: str, image_id: str, data: bytes, widths: tuple, thumbnail_size: int, max_pixels: int) -> dict:
+    """Decode an upload, store it and its resized WebP variants under directory, and return its metadata.
+
+    Runs in a worker process. Variants narrower than the image are made for each of widths,
+    plus a thumbnail that fits in thumbnail_size squared; EXIF orientation is applied to them.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in IMAGE_FORMATS:
+            raise ImageRejected(f"Unsupported image format {image.format}")
+        if image.width * image.height > max_pixels:
+            raise ImageRejected(f"Image is larger than {max_pixels} pixels", status_code=413)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+    except Image.DecompressionBombError:
+        raise ImageRejected(f"Image is larger than {max_pixels} pixels", status_code=413)
+    except (Image.UnidentifiedImageError, OSError, SyntaxError):
+        raise ImageRejected("Not a readable JPEG, PNG, GIF or WebP image")
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    os.makedirs(directory, exist_ok=True)
+    media_type, extension = IMAGE_FORMATS[image_format]
+    _write_atomic(os.path.join(directory, f"{image_id}.{extension}"), data)
+
+    variants = {}
+    for width in sorted(widths, reverse=True):
+        if width < image.width:
+            size = (width, max(1, round(image.height * width / image.width)))
+            # reducing_gap shrinks by whole factors first, which is most of the speed on large photos
+            resized = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+            variants[f"w{width}"] = _save_variant(resized, os.path.join(directory, f"{image_id}-w{width}.webp"))
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS, reducing_gap=3.0)
+    variants[THUMBNAIL] = _save_variant(thumbnail, os.path.join(directory, f"{image_id}-{THUMBNAIL}.webp"))
+
+    metadata = {
+        "id": image_id,
+        "contentType": media_type,
+        "extension": extension,
+        "width": image.width,
+        "height": image.height,
+        "bytes": len(data),
+        "variants": variants,
+    }
+    # Written last: an image counts as stored once its metadata exists
+    _write_atomic(os.path.join(directory, f"{image_id}.json"), json.dumps(metadata).encode("utf-8"))
+    return metadata
+
+class ImageStore:
+    """Uploaded images on disk, addressed by the SHA-256 of their bytes.
+
+    Uploading the same bytes again returns the stored image without decoding it. New images
+    are decoded and resized in a process pool, at most as many at a time as the limiter
+    allows (a full queue is refused), so large photos never block the event loop. Files are
+    never modified once written, which is what lets them be served as immutable.
+    """
+
+    def __init__(self, root: str, limiter, workers: int = 2, widths: tuple = (320, 640, 1280),
+                 thumbnail_size: int = 256, max_bytes: int = 20 * 1024 * 1024, max_pixels: int = 40_000_000,
+                 metadata_cache_size: int = 1024):
+        self.root = root
+        self.limiter = limiter
+        self.workers = workers
+        self.widths = tuple(widths)
+        self.thumbnail_size = thumbnail_size
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.metadata_cache_size = metadata_cache_size
+        self.uploads = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.processing_seconds = 0.0
+        self._metadata = OrderedDict()  # image id -> metadata, most recently used last
+        self._executor = None
+
+    def _directory(self, image_id: str) -> str:
+        return os.path.join(self.root, image_id[:2])
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned rather than forked: the server has threads (logging, SQLite) a fork would copy mid-use
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def store(self, data: bytes) -> Tuple[dict, bool]:
+        """Store an upload and return (metadata, deduplicated). Raises ImageRejected or AdmissionRejected."""
+        if len(data) > self.max_bytes:
+            self.rejected += 1
+            raise ImageRejected(f"Image is larger than {self.max_bytes} bytes", status_code=413)
+        if not data:
+            self.rejected += 1
+            raise ImageRejected("Empty upload", status_code=400)
+
+        # hashlib releases the GIL on large inputs
+        image_id = (await asyncio.to_thread(hashlib.sha256, data)).hexdigest()
+        self.uploads += 1
+        metadata = self.metadata(image_id)
+        if metadata is not None:
+            self.deduplicated += 1
+            return metadata, True
+
+        async with self.limiter.slot(PRIORITY_INTERACTIVE):
+            started = time.perf_counter()
+            try:
+                metadata = await asyncio.get_running_loop().run_in_executor(
+                    self._pool(), process_image, self._directory(image_id), image_id, data,
+                    self.widths, self.thumbnail_size, self.max_pixels
+                )
+            except ImageRejected:
+                self.rejected += 1
+                raise
+            finally:
+                self.processing_seconds += time.perf_counter() - started
+        self._remember(image_id, metadata)
+        return metadata, False
+
+    def metadata(self, image_id: str) -> Optional[dict]:
+        """Metadata of a stored image, or None if there is no image with that id."""
+        if not _image_id_re.match(image_id):
+            return None
+        metadata = self._metadata.get(image_id)
+        if metadata is not None:
+            self._metadata.move_to_end(image_id)
+            return metadata
+        try:
+            with open(os.path.join(self._directory(image_id), f"{image_id}.json"), encoding="utf-8") as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._remember(image_id, metadata)
+        return metadata
+
+    def _remember(self, image_id: str, metadata: dict):
+        self._metadata[image_id] = metadata
+        if len(self._metadata) > self.metadata_cache_size:
+            self._metadata.popitem(last=False)
+
+    def file(self, image_id: str, variant: str = ORIGINAL) -> Optional[Tuple[str, str]]:
+        """(path, media type) of an image or one of its variants, or None if it does not exist.
+
+        A width variant that was not made because the image is narrower is the original.
+        """
+        metadata = self.metadata(image_id)
+        if metadata is None:
+            return None
+        if variant in metadata["variants"]:
+            return os.path.join(self._directory(image_id), f"{image_id}-{variant}.webp"), VARIANT_MEDIA_TYPE
+        if variant == ORIGINAL or variant.startswith("w") and variant[1:].isdigit() and int(variant[1:]) in self.widths:
+            return os.path.join(self._directory(image_id), f"{image_id}.{metadata['extension']}"), metadata["contentType"]
+        return None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "imageUploads": self.uploads,
+            "imageUploadsDeduplicated": self.deduplicated,
+            "imageUploadsRejected": self.rejected,
+            "imageProcessingSeconds": self.processing_seconds,
+            "imageProcessingQueue": self.limiter.stats(),
+        }
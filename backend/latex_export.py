@@ -0,0 +1,414 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from admission import PRIORITY_BULK
+from single_flight import SingleFlight
+
+# Bump when fragment output changes so cached fragments from older code are not reused
+EXPORT_FORMAT_VERSION = "2"
+
+PREAMBLE = r"""\documentclass[12pt]{article}
+\usepackage[utf8]{inputenc}
+\usepackage{amsmath}
+\usepackage{amsfonts}
+\usepackage{amssymb}
+\usepackage{geometry}
+\usepackage{graphicx}
+\usepackage{hyperref}
+\usepackage[normalem]{ulem}
+\usepackage{listings}
+\usepackage{color}
+\usepackage{xcolor}
+
+\geometry{margin=1in}
+
+% Define colors for syntax highlighting
+\definecolor{dkgreen}{rgb}{0,0.6,0}
+\definecolor{gray}{rgb}{0.5,0.5,0.5}
+\definecolor{mauve}{rgb}{0.58,0,0.82}
+\definecolor{lightgray}{rgb}{0.97,0.97,0.97}
+
+% Configure listings package
+\lstset{
+  frame=single,
+  backgroundcolor=\color{lightgray},
+  aboveskip=3mm,
+  belowskip=3mm,
+  showstringspaces=false,
+  columns=flexible,
+  basicstyle={\small\ttfamily},
+  numbers=none,
+  numberstyle=\tiny\color{gray},
+  keywordstyle=\color{blue},
+  commentstyle=\color{dkgreen},
+  stringstyle=\color{mauve},
+  breaklines=true,
+  breakatwhitespace=true,
+  tabsize=2,
+  rulecolor=\color{gray},
+  framexleftmargin=5pt,
+  framexrightmargin=5pt,
+  framexbottommargin=3pt,
+  framextopmargin=3pt
+}
+
+\title{TITLE}
+\author{}
+\date{\today}
+
+\begin{document}
+
+\maketitle
+
+"""
+
+END_DOCUMENT = "\n\\end{document}"
+
+_text_specials = {
+    "\\": r"\textbackslash{}",
+    "^": r"\textasciicircum{}",
+    "~": r"\textasciitilde{}",
+    **{char: "\\" + char for char in "&%$#_{}"},
+}
+_text_specials_re = re.compile(r"[\\^~&%$#_{}]")
+
+def escape_text(text: str) -> str:
+    """Escape characters that are special in LaTeX text mode."""
+    return _text_specials_re.sub(lambda match: _text_specials[match.group(0)], text)
+
+# Ends a listing wherever it appears in its body, so such code cannot go into lstlisting
+_LISTING_END = "\\end{lstlisting}"
+
+def escape_code_lines(code: str) -> str:
+    """Escaped typewriter lines keeping their indentation, for code that cannot be verbatim."""
+    lines = []
+    for line in code.split("\n"):
+        stripped = line.lstrip(" ")
+        lines.append("~" * (len(line) - len(stripped)) + escape_text(stripped) + "\\mbox{}")
+    return "\\\\\n".join(lines)
+
+_HEADING_COMMANDS = {1: "\\section", 2: "\\subsection", 3: "\\subsubsection"}
+
+# Our language names mapped to LaTeX listings language names
+_LISTINGS_LANGUAGES = {
+    "javascript": "Java",  # Close enough for basic highlighting
+    "java": "Java",
+    "python": "Python",
+    "c": "C",
+    "cpp": "C++",
+    "csharp": "[Sharp]C",
+    "html": "HTML",
+    "css": "CSS",
+    "sql": "SQL",
+    "bash": "bash",
+    "json": "JavaScript",
+    "typescript": "Java",
+    "markdown": "TeX",
+    "markup": "HTML",
+}
+
+class LatexExporter:
+    """Convert TipTap JSON to a LaTeX document, one top-level node at a time.
+
+    Mirrors exportToLatex in src/services/exportService.js. Each top-level node's fragment
+    is cached under a hash of its JSON, so exporting a mostly unchanged document again
+    only renders the nodes that changed.
+    """
+
+    def __init__(self, fragment_cache):
+        self.fragment_cache = fragment_cache
+        self._fragments = threading.Lock()  # PDF exports render in worker threads
+        self.rendered = 0
+        self.reused = 0
+
+    def fragment(self, node: dict, for_pdf: bool = False) -> str:
+        canonical = json.dumps(node, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        key = hashlib.sha256(f"{EXPORT_FORMAT_VERSION}|{for_pdf}|{canonical}".encode("utf-8")).hexdigest()
+        with self._fragments:
+            latex = self.fragment_cache.get(key)
+            if latex is not None:
+                self.reused += 1
+                return latex
+
+        latex = self.render_node(node, for_pdf)
+        with self._fragments:
+            self.rendered += 1
+            self.fragment_cache.set(key, latex)
+        return latex
+
+    def document(self, doc: dict, title: str = "Document", for_pdf: bool = False):
+        """Yield the preamble, one fragment per top-level node and the closing of the document."""
+        yield PREAMBLE.replace("TITLE", re.sub(r"[#$%&_{}]", lambda match: "\\" + match.group(0), title))
+        for node in doc.get("content") or []:
+            yield self.fragment(node, for_pdf)
+        yield END_DOCUMENT
+
+    async def stream(self, doc: dict, title: str = "Document", chunk_bytes: int = 16384):
+        """document() regrouped into chunks of about chunk_bytes, so small nodes are not sent one by one.
+
+        Rendering runs on the event loop; it yields to other requests after each chunk.
+        """
+        buffered = []
+        size = 0
+        for part in self.document(doc, title):
+            buffered.append(part)
+            size += len(part)
+            if size >= chunk_bytes:
+                yield "".join(buffered)
+                buffered.clear()
+                size = 0
+                await asyncio.sleep(0)
+        if buffered:
+            yield "".join(buffered)
+
+    def render_node(self, node: dict, for_pdf: bool = False) -> str:
+        node_type = node.get("type")
+        if node_type == "paragraph":
+            content = self.render_inline(node)
+            return f"{content}\n\n" if content else "\n"
+        if node_type == "heading":
+            if not node.get("content"):
+                return ""
+            command = _HEADING_COMMANDS.get((node.get("attrs") or {}).get("level") or 1, "\\paragraph")
+            return f"{command}{{{self.render_inline(node)}}}\n\n"
+        if node_type in ("bulletList", "orderedList"):
+            if not node.get("content"):
+                return ""
+            environment = "itemize" if node_type == "bulletList" else "enumerate"
+            items = "".join(self.render_node(child, for_pdf) for child in node["content"])
+            return f"\\begin{{{environment}}}\n{items}\\end{{{environment}}}\n\n"
+        if node_type == "listItem":
+            if not node.get("content"):
+                return ""
+            content = "".join(self.render_node(child, for_pdf) for child in node["content"])
+            return f"  \\item {content.strip()}\n"
+        if node_type == "customTable":
+            return self.render_table(node)
+        if node_type == "latex":
+            return self.render_latex(node)
+        if node_type == "codeBlock":
+            return self.render_code_block(node)
+        if node_type == "latexBlock":
+            return self.render_latex_block(node)
+        if node_type in ("resizableImage", "image"):
+            return self.render_image(node, for_pdf)
+        # For unknown node types, try to process their content
+        return "".join(self.render_node(child, for_pdf) for child in node.get("content") or [])
+
+    def render_inline(self, node: dict) -> str:
+        parts = []
+        for child in node.get("content") or []:
+            if child.get("type") == "text":
+                parts.append(self.render_text(child))
+            elif child.get("type") == "latex":
+                parts.append(self.render_latex(child))
+            elif child.get("type") == "hardBreak":
+                parts.append("\\\\\n")
+        return "".join(parts)
+
+    def render_text(self, node: dict) -> str:
+        # Escape before applying marks so the braces of the mark commands stay intact
+        text = escape_text(node.get("text") or "")
+        for mark in node.get("marks") or []:
+            mark_type = mark.get("type")
+            if mark_type == "bold":
+                text = f"\\textbf{{{text}}}"
+            elif mark_type == "italic":
+                text = f"\\textit{{{text}}}"
+            elif mark_type == "underline":
+                text = f"\\underline{{{text}}}"
+            elif mark_type == "strike":
+                text = f"\\sout{{{text}}}"
+            elif mark_type == "link":
+                href = re.sub(r"[%#]", lambda match: "\\" + match.group(0), (mark.get("attrs") or {}).get("href") or "")
+                text = f"\\href{{{href}}}{{{text}}}"
+        return text
+
+    def render_latex(self, node: dict) -> str:
+        attrs = node.get("attrs") or {}
+        latex_code = attrs.get("latexCode") or ""
+        style_mode = attrs.get("styleMode") or "display"
+        if not latex_code:
+            return ""
+        if style_mode == "script":
+            latex_code = f"\\scriptstyle{{{latex_code}}}"
+        elif style_mode == "scriptscript":
+            latex_code = f"\\scriptscriptstyle{{{latex_code}}}"
+        # Use display mode for 'display' style, inline for others
+        return f"\\[{latex_code}\\]" if style_mode == "display" else f"\\({latex_code}\\)"
+
+    def render_table(self, node: dict) -> str:
+        table_data = (node.get("attrs") or {}).get("tableData") or []
+        col_count = len(table_data[0].get("cells") or []) if table_data else 0
+        if not col_count:
+            return ""
+
+        lines = ["\\begin{table}[h]", "\\centering", f"\\begin{{tabular}}{{|{'|'.join('l' * col_count)}|}}", "\\hline"]
+        for index, row in enumerate(table_data):
+            cells = row.get("cells") or []
+            lines.append(" & ".join(escape_text(cell.get("content") or "") for cell in cells) + " \\\\")
+            if index == 0 and cells and cells[0].get("isHeader"):
+                lines.append("\\hline")
+        lines += ["\\hline", "\\end{tabular}", "\\end{table}"]
+        return "\n".join(lines) + "\n\n"
+
+    def render_code_block(self, node: dict) -> str:
+        attrs = node.get("attrs") or {}
+        code = attrs.get("code") or ""
+        if not code:
+            return ""
+        language = _LISTINGS_LANGUAGES.get((attrs.get("language") or "text").lower(), "")
+        if _LISTING_END in code:
+            return f"\\begin{{flushleft}}\\small\\ttfamily\n{escape_code_lines(code)}\n\\end{{flushleft}}\n\n"
+        prefix = f"\\lstset{{language={language}}}\n" if language else ""
+        return f"{prefix}\\begin{{lstlisting}}\n{code}\n\\end{{lstlisting}}\n\n"
+
+    def render_latex_block(self, node: dict) -> str:
+        attrs = node.get("attrs") or {}
+        latex_code = attrs.get("latexCode") or ""
+        original_text = attrs.get("originalText") or ""
+        if not latex_code and not original_text:
+            return ""
+
+        # "math - annotation" lines: annotations become a margin note
+        math_lines, annotations = [], []
+        for line in original_text.split("\n"):
+            math_part, separator, annotation = line.strip().partition(" - ")
+            if math_part.strip():
+                math_lines.append(math_part.strip())
+            if separator and annotation.strip():
+                annotations.append(annotation.strip())
+
+        if latex_code:
+            if "\\\\" in latex_code and "\\begin{" not in latex_code:
+                output = f"\\begin{{align*}}\n{latex_code}\n\\end{{align*}}"
+            else:
+                output = f"\\[{latex_code}\\]"
+        else:
+            # Unconverted block: keep the math text, without annotations
+            output = f"\\text{{{escape_text(' '.join(math_lines))}}}"
+
+        if annotations:
+            output += f"\\marginpar{{\\tiny {escape_text(' • '.join(annotations))}}}"
+        return output + "\n\n"
+
+    def render_image(self, node: dict, for_pdf: bool = False) -> str:
+        attrs = node.get("attrs") or {}
+        src, alt = attrs.get("src"), attrs.get("alt")
+        if not src:
+            return ""
+
+        filename = alt or "image"
+        if for_pdf:
+            # Image files are not part of the build, so a compiled PDF shows a labelled frame
+            return f"\\begin{{figure}}[h]\n\\centering\n\\fbox{{Image: {escape_text(filename)}}}\n\\end{{figure}}\n\n"
+
+        options = [f"{name}={attrs[name]}px" for name in ("width", "height") if attrs.get(name)]
+        include = f"\\includegraphics{'[' + ','.join(options) + ']' if options else ''}{{{filename}}}"
+        if src.startswith("data:"):
+            include = f"% Base64 image needs to be saved as a separate file\n% {include}"
+        caption = f"\\caption{{{escape_text(alt)}}}\n" if alt else ""
+        return f"\\begin{{figure}}[h]\n\\centering\n{include}\n{caption}\\end{{figure}}\n\n"
+
+    def stats(self) -> dict:
+        return {"fragmentsRendered": self.rendered, "fragmentsReused": self.reused}
+
+class PdfBuildFailed(Exception):
+    def __init__(self, message: str, log: str = ""):
+        super().__init__(message)
+        self.log = log
+
+def find_latex_engine(preference: str = ""):
+    """Path of the LaTeX engine to use: LATEX_ENGINE if set (a name or a path), else tectonic, else pdflatex."""
+    if preference == "none":
+        return None
+    for name in ([preference] if preference else ["tectonic", "pdflatex"]):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+class PdfBuilder:
+    """Compile LaTeX to PDF with a local engine, a bounded number of builds at a time.
+
+    Builds wait for a slot in a PriorityLimiter (a full queue is refused), identical
+    documents share one build, and recent PDFs are kept in memory by the hash of their source.
+    """
+
+    def __init__(self, engine: str, limiter, timeout_seconds: float = 60.0, cache_size: int = 32):
+        self.engine = engine
+        self.limiter = limiter
+        self.timeout_seconds = timeout_seconds
+        self.cache_size = cache_size
+        self.builds = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self._results = OrderedDict()  # source hash -> PDF bytes
+        self._inflight = SingleFlight()
+
+    async def build(self, tex: str) -> bytes:
+        key = hashlib.sha256(tex.encode("utf-8")).hexdigest()
+        pdf = self._results.get(key)
+        if pdf is not None:
+            self._results.move_to_end(key)
+            self.cache_hits += 1
+            return pdf
+        return await self._inflight.do(key, lambda: self._build(key, tex))
+
+    def _command(self) -> list:
+        if "tectonic" in os.path.basename(self.engine):
+            # tectonic ignores openin_any/openout_any; --untrusted turns off every feature it
+            # considers insecure (shell escape among them) whatever the document asks for
+            return [self.engine, "--untrusted", "--chatter", "minimal", "--outdir", ".", "main.tex"]
+        return [self.engine, "-interaction=nonstopmode", "-halt-on-error", "-no-shell-escape", "main.tex"]
+
+    async def _build(self, key: str, tex: str) -> bytes:
+        async with self.limiter.slot(PRIORITY_BULK):
+            with tempfile.TemporaryDirectory(prefix="export-") as workdir:
+                with open(os.path.join(workdir, "main.tex"), "w", encoding="utf-8") as f:
+                    f.write(tex)
+
+                # Keep TeX from reading or writing files outside the build directory
+                env = {**os.environ, "openin_any": "p", "openout_any": "p"}
+                self.builds += 1
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(), cwd=workdir, env=env,
+                    stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+                )
+                try:
+                    output, _ = await asyncio.wait_for(process.communicate(), self.timeout_seconds)
+                except BaseException:
+                    process.kill()
+                    await process.wait()
+                    self.failures += 1
+                    raise
+
+                pdf_path = os.path.join(workdir, "main.pdf")
+                if process.returncode != 0 or not os.path.exists(pdf_path):
+                    self.failures += 1
+                    log = output.decode("utf-8", errors="replace")
+                    raise PdfBuildFailed(f"LaTeX build failed with exit code {process.returncode}", log[-4000:])
+                with open(pdf_path, "rb") as f:
+                    pdf = f.read()
+
+        self._results[key] = pdf
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return pdf
+
+    def stats(self) -> dict:
+        return {
+            "engineAvailable": self.engine is not None,
+            "pdfBuilds": self.builds,
+            "pdfBuildFailures": self.failures,
+            "pdfCacheHits": self.cache_hits,
+            "pdfCached": len(self._results),
+            "pdfBuildQueue": self.limiter.stats(),
+        }
@@ -0,0 +1,220 @@
+import re
+from typing import NamedTuple, Optional
+
+class LocalConversion(NamedTuple):
+    latex: str
+    confident: bool
+
+GREEK_LETTERS = [
+    "alpha", "beta", "gamma", "delta", "epsilon", "varepsilon", "zeta", "eta", "theta",
+    "vartheta", "iota", "kappa", "lambda", "mu", "nu", "xi", "pi", "rho", "sigma",
+    "tau", "upsilon", "phi", "varphi", "chi", "psi", "omega",
+]
+UPPERCASE_GREEK = ["Gamma", "Delta", "Theta", "Lambda", "Xi", "Pi", "Sigma", "Upsilon", "Phi", "Psi", "Omega"]
+
+# Words and phrases that map directly to a single symbol (matched case-insensitively)
+SYMBOL_WORDS = {
+    "infinity": "\\infty",
+    "inf": "\\infty",
+    "plus or minus": "\\pm",
+    "plus minus": "\\pm",
+    "minus or plus": "\\mp",
+    "minus plus": "\\mp",
+    "approximately equal to": "\\approx",
+    "approximately": "\\approx",
+    "approx": "\\approx",
+    "not equal to": "\\neq",
+    "less than or equal to": "\\leq",
+    "greater than or equal to": "\\geq",
+    "less than": "<",
+    "greater than": ">",
+    "for all": "\\forall",
+    "there exists": "\\exists",
+    "therefore": "\\therefore",
+    "because": "\\because",
+    "implies": "\\rightarrow",
+    "right arrow": "\\rightarrow",
+    "left arrow": "\\leftarrow",
+    "equivalent to": "\\equiv",
+    "equiv": "\\equiv",
+    "partial": "\\partial",
+    "nabla": "\\nabla",
+    "empty set": "\\emptyset",
+    "element of": "\\in",
+    "subset of": "\\subset",
+    "union": "\\cup",
+    "intersection": "\\cap",
+    "dot": "\\cdot",
+    "times": "\\times",
+}
+SYMBOL_WORDS.update({name: f"\\{name}" for name in GREEK_LETTERS})
+
+_number_re = re.compile(r"\d+(?:\.\d+)?")
+_variable_re = re.compile(r"[A-Za-z]")
+_latex_command_re = re.compile(r"\\[A-Za-z]+")
+_latex_text_re = re.compile(r"\\(?:text|mathrm|operatorname)\{[^{}]*\}")
+_english_word_re = re.compile(r"(?<![\\A-Za-z])[A-Za-z]{2,}")
+_single_letter_re = re.compile(r"(?<![\\A-Za-z])[A-Za-z](?![A-Za-z])")
+
+# Input that is already plain math, e.g. "x^2 + 1 = y" (functions like sin are handled by rules)
+_plain_math_re = re.compile(r"[A-Za-z0-9\s+\-=<>^_().,!|'\[\]]+")
+_multi_char_script_re = re.compile(r"[\^_][A-Za-z0-9]{2,}")
+
+MAX_RULE_DEPTH = 6
+
+def _wrap(latex: str) -> str:
+    """Brace a sub/superscript argument unless it is a single character."""
+    return latex if len(latex) == 1 else f"{{{latex}}}"
+
+def _is_simple(latex: str) -> bool:
+    """True for single tokens that can take a power without parentheses."""
+    return " " not in latex and not any(op in latex for op in "+-=<>")
+
+def _integration_variable(latex: str) -> str:
+    letters = set(_single_letter_re.findall(latex))
+    return letters.pop() if len(letters) == 1 else "x"
+
+def _power(base, exponent):
+    if not _is_simple(base):
+        return None
+    return f"{base}^{_wrap(exponent)}"
+
+def _integral(integrand, lower=None, upper=None):
+    bounds = f"_{_wrap(lower)}^{_wrap(upper)}" if lower is not None else ""
+    return f"\\int{bounds} {integrand} \\, d{_integration_variable(integrand)}"
+
+def _binary(operator):
+    return lambda left, right: f"{left} {operator} {right}"
+
+def _function(name):
+    return lambda argument: f"\\{name}({argument})"
+
+_A = r"(.+?)"
+_Z = r"(.+)"
+
+# Ordered rules: prefix operators that scope to the end of the input come first,
+# then binary operators (lowest precedence), then fractions, powers and functions.
+# Every captured group is itself converted recursively; a rule only applies if all of them convert.
+_PHRASE_RULES = [(re.compile(pattern, re.IGNORECASE), build) for pattern, build in [
+    (rf"(?:definite )?integral of {_A} from {_A} to {_Z}", lambda f, a, b: _integral(f, a, b)),
+    (rf"(?:definite )?integral from {_A} to {_A} of {_Z}", lambda a, b, f: _integral(f, a, b)),
+    (rf"(?:integral|int) of {_Z}", lambda f: _integral(f)),
+    (rf"sum from {_A} to {_A} of {_Z}", lambda a, b, f: f"\\sum_{_wrap(a)}^{_wrap(b)} {f}"),
+    (rf"product from {_A} to {_A} of {_Z}", lambda a, b, f: f"\\prod_{_wrap(a)}^{_wrap(b)} {f}"),
+    (rf"limit as {_A} (?:approaches|goes to) {_A} of {_Z}", lambda v, a, f: f"\\lim_{{{v} \\to {a}}} {f}"),
+    (rf"limit of {_A} as {_A} (?:approaches|goes to) {_Z}", lambda f, v, a: f"\\lim_{{{v} \\to {a}}} {f}"),
+    (rf"partial derivative of {_A} with respect to {_Z}", lambda f, v: f"\\frac{{\\partial {f}}}{{\\partial {v}}}" if _is_simple(f) else None),
+    (rf"derivative of {_A} with respect to {_Z}", lambda f, v: f"\\frac{{d}}{{d{v}}}({f})"),
+    (rf"derivative of {_Z}", lambda f: f"\\frac{{d}}{{dx}}({f})"),
+    (rf"{_A} (?:equals|is equal to) {_Z}", _binary("=")),
+    (rf"{_A} (?:is )?not equal to {_Z}", _binary("\\neq")),
+    (rf"{_A} (?:is )?less than or equal to {_Z}", _binary("\\leq")),
+    (rf"{_A} (?:is )?greater than or equal to {_Z}", _binary("\\geq")),
+    (rf"{_A} (?:is )?less than {_Z}", _binary("<")),
+    (rf"{_A} (?:is )?greater than {_Z}", _binary(">")),
+    (rf"{_A} plus or minus {_Z}", _binary("\\pm")),
+    (rf"{_A} plus {_Z}", _binary("+")),
+    (rf"{_A} minus {_Z}", _binary("-")),
+    (rf"{_A} times {_Z}", _binary("\\cdot")),
+    (rf"(?:fraction )?{_A} over {_Z}", lambda n, d: f"\\frac{{{n}}}{{{d}}}"),
+    (rf"{_Z} squared", lambda b: _power(b, "2")),
+    (rf"{_Z} cubed", lambda b: _power(b, "3")),
+    (rf"{_A} to the power of {_Z}", _power),
+    (rf"{_A} to the {_Z}", _power),
+    (rf"(?:square root|sqrt) of {_Z}", lambda x: f"\\sqrt{{{x}}}"),
+    (rf"sqrt {_Z}", lambda x: f"\\sqrt{{{x}}}"),
+    (rf"cube root of {_Z}", lambda x: f"\\sqrt[3]{{{x}}}"),
+    (rf"(?:sine|sin) (?:of )?{_Z}", _function("sin")),
+    (rf"(?:cosine|cos) (?:of )?{_Z}", _function("cos")),
+    (rf"(?:tangent|tan) (?:of )?{_Z}", _function("tan")),
+    (rf"(?:natural log|ln) (?:of )?{_Z}", _function("ln")),
+    (rf"(?:logarithm|log) (?:of )?{_Z}", _function("log")),
+    (rf"e to the {_Z}", lambda x: f"e^{_wrap(x)}"),
+    (rf"absolute value of {_Z}", lambda x: f"|{x}|"),
+]]
+
+class LocalLatexConverter:
+    """Deterministic rule-based conversion for common phrases, used before calling the model."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.local_hits = 0
+
+    def convert(self, text: str) -> Optional[LocalConversion]:
+        """Return a local conversion, or None if the input should go to the model."""
+        self.attempts += 1
+        result = self._convert_input(text.strip())
+        if result is not None and result.confident:
+            self.local_hits += 1
+        return result
+
+    def _convert_input(self, text):
+        if not text:
+            return None
+
+        if self._is_latex(text):
+            return LocalConversion(text, True)
+
+        latex = self._convert(text, 0)
+        if latex is not None:
+            return LocalConversion(latex, True)
+
+        if _plain_math_re.fullmatch(text) and not _english_word_re.search(text):
+            # Multi-character scripts like x^10 are ambiguous (x^{10} vs x^1 0)
+            return LocalConversion(text, not _multi_char_script_re.search(text))
+
+        return None
+
+    def _is_latex(self, text):
+        if not _latex_command_re.search(text) or text.count("{") != text.count("}"):
+            return False
+        stripped = _latex_command_re.sub(" ", _latex_text_re.sub(" ", text))
+        return not _english_word_re.search(stripped)
+
+    def _convert(self, text, depth):
+        text = text.strip()
+        if not text or depth > MAX_RULE_DEPTH:
+            return None
+
+        atom = self._atom(text)
+        if atom is not None:
+            return atom
+
+        for pattern, build in _PHRASE_RULES:
+            match = pattern.fullmatch(text)
+            if not match:
+                continue
+            parts = [self._convert(group, depth + 1) for group in match.groups()]
+            if all(part is not None for part in parts):
+                latex = build(*parts)
+                if latex is not None:
+                    return latex
+
+        # A run of symbols, e.g. "alpha beta gamma"
+        tokens = text.split()
+        if len(tokens) > 1:
+            atoms = [self._atom(token) for token in tokens]
+            if all(atom is not None for atom in atoms):
+                return " ".join(atoms)
+
+        return None
+
+    def _atom(self, text):
+        if _number_re.fullmatch(text) or _variable_re.fullmatch(text):
+            return text
+        if text in UPPERCASE_GREEK:
+            return f"\\{text}"
+        symbol = SYMBOL_WORDS.get(text.lower())
+        if symbol is not None:
+            return symbol
+        if _plain_math_re.fullmatch(text) and not _english_word_re.search(text) \
+                and not _multi_char_script_re.search(text) and " " not in text:
+            return text
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "localAttempts": self.attempts,
+            "localHits": self.local_hits,
+            "localHitRate": self.local_hits / self.attempts if self.attempts else 0.0,
+        }
@@ -0,0 +1,311 @@
+import re
+from typing import NamedTuple, Tuple
+
+# Commands KaTeX renders (https://katex.org/docs/supported.html), without the leading backslash
+KATEX_COMMANDS = frozenset("""
+    alpha beta gamma delta epsilon varepsilon zeta eta theta vartheta iota kappa varkappa lambda mu nu xi
+    omicron pi varpi rho varrho sigma varsigma tau upsilon phi varphi chi psi omega digamma
+    Alpha Beta Gamma Delta Epsilon Zeta Eta Theta Iota Kappa Lambda Mu Nu Xi Omicron Pi Rho Sigma Tau
+    Upsilon Phi Chi Psi Omega varGamma varDelta varTheta varLambda varXi varPi varSigma varUpsilon
+    varPhi varPsi varOmega
+    aleph beth gimel daleth hbar hslash ell wp Re Im partial nabla infty imath jmath eth Finv Game
+    Bbbk mho R N Z Q C Reals Complex natnums cnums Bbb
+    frac dfrac tfrac cfrac genfrac over above atop choose binom dbinom tbinom brace brack
+    sqrt root
+    sum prod coprod int iint iiint oint oiint oiiint intop smallint bigcup bigcap bigsqcup bigvee
+    bigwedge bigodot bigoplus bigotimes biguplus
+    sin cos tan cot sec csc arcsin arccos arctan arctg arcctg sinh cosh tanh coth sech csch sh ch th
+    cth tg ctg cotg cosec log ln lg exp lim liminf limsup max min sup inf arg det dim gcd hom ker
+    deg Pr injlim projlim varlimsup varliminf varinjlim varprojlim plim argmin argmax operatorname
+    operatornamewithlimits limits nolimits mod bmod pmod pod
+    left right middle big Big bigg Bigg bigl Bigl biggl Biggl bigr Bigr biggr Biggr bigm Bigm biggm Biggm
+    lparen rparen lbrack rbrack lbrace rbrace langle rangle lang rang lvert rvert lVert rVert vert Vert
+    lceil rceil lfloor rfloor lmoustache rmoustache lgroup rgroup ulcorner urcorner llcorner lrcorner
+    llbracket rrbracket lBrace rBrace backslash uparrow downarrow updownarrow Uparrow Downarrow
+    Updownarrow
+    leq le geq ge neq ne lt gt eq equiv approx approxeq sim simeq cong ncong nsim propto asymp doteq
+    Doteq doteqdot fallingdotseq risingdotseq eqcirc circeq triangleq bumpeq Bumpeq thicksim thickapprox
+    prec succ preceq succeq precsim succsim precapprox succapprox precneqq succneqq precnsim succnsim
+    precnapprox succnapprox nprec nsucc npreceq nsucceq ll gg lll ggg llless gggtr leqq geqq leqslant
+    geqslant eqslantless eqslantgtr lesssim gtrsim lessapprox gtrapprox lessgtr gtrless lesseqgtr
+    gtreqless lesseqqgtr gtreqqless lessdot gtrdot lneq gneq lneqq gneqq lvertneqq gvertneqq lnsim gnsim
+    lnapprox gnapprox nless ngtr nleq ngeq nleqq ngeqq nleqslant ngeqslant
+    subset supset subseteq supseteq subsetneq supsetneq subseteqq supseteqq subsetneqq supsetneqq
+    varsubsetneq varsupsetneq varsubsetneqq varsupsetneqq nsubseteq nsupseteq nsubseteqq nsupseteqq
+    Subset Supset sqsubset sqsupset sqsubseteq sqsupseteq in notin ni owns notni isin
+    mid nmid parallel nparallel shortmid nshortmid shortparallel nshortparallel perp vdash dashv
+    Vdash vDash Vvdash nvdash nvDash nVdash nVDash models smile frown smallsmile smallfrown between
+    pitchfork backepsilon therefore because multimap
+    triangleleft triangleright vartriangle vartriangleleft vartriangleright trianglelefteq
+    trianglerighteq ntriangleleft ntriangleright ntrianglelefteq ntrianglerighteq lhd rhd unlhd unrhd
+    blacktriangleleft blacktriangleright
+    plus minus pm mp times div cdot cdotp ast star circ bullet oplus ominus otimes oslash odot
+    circledast circledcirc circleddash boxplus boxminus boxtimes boxdot cap cup sqcap sqcup uplus
+    Cap Cup doublecap doublecup wedge vee land lor barwedge veebar doublebarwedge curlywedge curlyvee
+    setminus smallsetminus amalg dagger ddagger dag ddag wr bigcirc bigtriangleup bigtriangledown
+    diamond intercal ltimes rtimes leftthreetimes rightthreetimes divideontimes centerdot dotplus
+    gtrdot lessdot
+    leftarrow rightarrow to gets leftrightarrow Leftarrow Rightarrow Leftrightarrow longleftarrow
+    longrightarrow longleftrightarrow Longleftarrow Longrightarrow Longleftrightarrow mapsto longmapsto
+    hookleftarrow hookrightarrow leftharpoonup leftharpoondown rightharpoonup rightharpoondown
+    rightleftharpoons leftrightharpoons nearrow searrow swarrow nwarrow iff implies impliedby
+    leftleftarrows rightrightarrows leftrightarrows rightleftarrows Lleftarrow Rrightarrow
+    twoheadleftarrow twoheadrightarrow leftarrowtail rightarrowtail looparrowleft looparrowright
+    curvearrowleft curvearrowright circlearrowleft circlearrowright Lsh Rsh upuparrows downdownarrows
+    upharpoonleft upharpoonright downharpoonleft downharpoonright restriction leadsto rightsquigarrow
+    leftrightsquigarrow nleftarrow nrightarrow nLeftarrow nRightarrow nleftrightarrow nLeftrightarrow
+    dashleftarrow dashrightarrow longleftrightarrows Uparrow
+    xleftarrow xrightarrow xLeftarrow xRightarrow xleftrightarrow xLeftrightarrow xhookleftarrow
+    xhookrightarrow xmapsto xrightharpoonup xrightharpoondown xleftharpoonup xleftharpoondown
+    xrightleftharpoons xleftrightharpoons xtwoheadleftarrow xtwoheadrightarrow xlongequal xtofrom
+    forall exists nexists neg lnot top bot emptyset varnothing complement
+    angle measuredangle sphericalangle triangle triangledown blacktriangle blacktriangledown square
+    Box blacksquare lozenge blacklozenge Diamond bigstar clubsuit diamondsuit heartsuit spadesuit
+    clubs diamonds hearts spades flat natural sharp checkmark maltese yen pounds euro copyright
+    circledR circledS textregistered textcopyright degree prime backprime surd
+    dots ldots cdots vdots ddots dotsb dotsc dotsi dotsm dotso mathellipsis
+    hat widehat check widecheck tilde widetilde utilde bar overline underline vec overrightarrow
+    overleftarrow overleftrightarrow underrightarrow underleftarrow underleftrightarrow
+    overleftharpoon overrightharpoon Overrightarrow dot ddot dddot ddddot acute grave breve mathring
+    overbrace underbrace overgroup undergroup overlinesegment underlinesegment
+    overset underset stackrel atop substack sideset
+    mathrm mathit mathbf mathsf mathtt mathcal mathscr mathfrak mathbb mathnormal boldsymbol bold
+    pmb bm Bbb frak cal mit rm it bf sf tt mathring boldsymbol
+    text textrm textit textbf textsf texttt textnormal textup textmd emph mbox hbox textcolor
+    textsc textsl
+    displaystyle textstyle scriptstyle scriptscriptstyle
+    color colorbox fcolorbox boxed fbox cancel bcancel xcancel sout not phantom hphantom vphantom
+    smash mathstrut rlap llap clap mathrlap mathllap mathclap tag notag nonumber label ref eqref
+    quad qquad enspace thinspace medspace thickspace negthinspace negmedspace negthickspace space
+    nobreakspace hspace hskip mskip kern mkern mspace
+    cr newline nonumber hline hdashline cline
+    mathbin mathrel mathop mathopen mathclose mathpunct mathinner mathord
+    huge Huge LARGE Large large normalsize small footnotesize scriptsize tiny
+    KaTeX LaTeX TeX
+    char S P colon vcentcolon dblcolon coloneqq Coloneqq coloneq Coloneq eqqcolon Eqqcolon eqcolon
+    Eqcolon infin empty And ldotp nobreak allowbreak underbar displaylimits raisebox vcenter
+    textbackslash textasciitilde textasciicircum textbullet textdollar textunderscore textendash
+    textemdash textquoteleft textquoteright textquotedblleft textquotedblright textdegree textbar
+    textdagger textdaggerdbl textsection textpilcrow
+""".split())
+
+# Environments KaTeX renders
+KATEX_ENVIRONMENTS = frozenset("""
+    matrix pmatrix bmatrix Bmatrix vmatrix Vmatrix smallmatrix matrix* pmatrix* bmatrix* Bmatrix*
+    vmatrix* Vmatrix* array darray subarray cases dcases rcases drcases aligned alignedat gathered
+    split align align* alignat alignat* gather gather* equation equation* CD
+""".split())
+
+# Environments in which & separates columns
+ALIGNMENT_ENVIRONMENTS = KATEX_ENVIRONMENTS - {"equation", "equation*", "gather", "gather*", "gathered", "CD"}
+
+# Commands whose argument is text, where spaces matter and $ switches back to math
+TEXT_COMMANDS = frozenset(
+    "text textrm textit textbf textsf texttt textnormal textup textmd textsc textsl emph mbox hbox".split()
+)
+
+# Spellings of the same symbol, rewritten to one form so equivalent outputs compare equal
+COMMAND_ALIASES = {
+    "le": "leq", "ge": "geq", "ne": "neq", "to": "rightarrow", "gets": "leftarrow",
+    "land": "wedge", "lor": "vee", "lnot": "neg", "owns": "ni",
+}
+
+# Commands from LaTeX packages or \DeclareMathOperator that KaTeX lacks, with a KaTeX equivalent
+COMMAND_REPAIRS = {
+    "mathbbm": "\\mathbb", "vv": "\\vec", "intertext": "\\text",
+    **{name: f"\\operatorname{{{name}}}" for name in "tr Tr rank sgn sign diag lcm erf erfc Var Cov span id supp".split()},
+}
+
+_token_re = re.compile(r"""
+    \\(?:begin|end)\s*\{([^{}]*)\}   # environment boundary
+  | \\[A-Za-z]+                      # control word
+  | \\.                              # control symbol
+  | \\                               # backslash at the very end
+  | \s+
+  | [{}$%#&]
+  | [^\\{}$%#&\s]+
+""", re.VERBOSE | re.DOTALL)
+
+_fence_re = re.compile(r"^```[A-Za-z]*\s*(.*?)\s*```$", re.DOTALL)
+_math_delimiters = (("$$", "$$"), ("\\[", "\\]"), ("\\(", "\\)"), ("$", "$"))
+_braced_script_re = re.compile(r"(?<!\\)([\^_])\{([A-Za-z0-9])\}(?=([A-Za-z0-9])?)")
+
+class LatexCheck(NamedTuple):
+    latex: str                 # repaired, canonical LaTeX
+    repairs: Tuple[str, ...]   # defects fixed locally
+    problems: Tuple[str, ...]  # defects that could not be fixed; empty if KaTeX can render the LaTeX
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+class InvalidLatex(ValueError):
+    pass
+
+# Open groups are (kind, environment name) frames; these close each kind
+_CLOSERS = {"{": "}", "text": "}", "$": "$", "left": "\\right."}
+
+def _closer(frame) -> str:
+    kind, name = frame
+    return f"\\end{{{name}}}" if kind == "env" else _CLOSERS[kind]
+
+def _strip_delimiters(latex: str, repairs: list) -> str:
+    fenced = _fence_re.match(latex)
+    if fenced:
+        latex = fenced.group(1)
+        repairs.append("code fence")
+    for opening, closing in _math_delimiters:
+        if latex.startswith(opening) and latex.endswith(closing) and len(latex) >= len(opening) + len(closing):
+            inner = latex[len(opening):len(latex) - len(closing)]
+            # "$a$ and $b$" is text with math in it, not math wrapped in $
+            if "$" in inner:
+                return latex
+            repairs.append("math delimiters")
+            return inner.strip()
+    return latex
+
+def check_latex(latex: str, alignment: bool = False) -> LatexCheck:
+    """Validate model output against the KaTeX subset in one pass, repairing what can be repaired.
+
+    Structural defects are fixed locally: code fences and $...$ wrappers are removed, stray
+    closing braces, \\end and \\right are dropped, unclosed groups, environments and \\left
+    are closed, stray $ in math is dropped and bare %, # (and & outside an alignment) are
+    escaped. Commands and environments KaTeX does not know are reported as problems.
+    alignment=True treats the input as a row of an align* environment, as block lines are.
+
+    The returned LaTeX is canonical: whitespace is dropped in math mode except between letters
+    and digits, single-character scripts lose their braces and aliases such as \\le are spelled
+    one way, so equivalent outputs share a cache entry.
+    """
+    repairs = []
+    problems = []
+    latex = _strip_delimiters(latex.strip(), repairs)
+
+    out = []
+    frames = []
+    alignments = int(alignment)  # open environments in which & is a column separator
+    text_mode = False            # in a \text argument, outside any $...$ within it
+    text_argument = False        # the last command takes a text argument that has not started yet
+    after_word = False           # the last token is a control word, so a letter must be spaced from it
+    spaced = False               # whitespace in math mode, kept only between letters and digits
+
+    def emit(token):
+        nonlocal after_word, spaced
+        if after_word and token[0].isalpha() or spaced and token[0].isalnum() and out[-1][-1].isalnum():
+            out.append(" ")
+        out.append(token)
+        after_word = spaced = False
+
+    def close(kinds, name=None) -> bool:
+        """Close the innermost frame of one of kinds, closing the frames opened inside it first."""
+        nonlocal alignments
+        for depth in range(len(frames) - 1, -1, -1):
+            if frames[depth][0] in kinds and (name is None or frames[depth][1] == name):
+                break
+        else:
+            return False
+        while len(frames) > depth:
+            frame = frames.pop()
+            if frame[0] == "env" and frame[1] in ALIGNMENT_ENVIRONMENTS:
+                alignments -= 1
+            if len(frames) > depth:
+                repairs.append(f"unclosed {frame[1] or frame[0]}")
+                emit(_closer(frame))
+        return True
+
+    def innermost_mode():
+        for kind, _ in reversed(frames):
+            if kind in ("text", "$"):
+                return kind
+        return None
+
+    for match in _token_re.finditer(latex):
+        token = match.group()
+        first = token[0]
+
+        if first.isspace():
+            if text_mode and out and out[-1] != " ":
+                out.append(" ")
+                after_word = False
+            else:
+                spaced = bool(out)
+            continue
+
+        if token != "{":
+            text_argument = False
+
+        environment = match.group(1)
+        if environment is not None:
+            environment = environment.strip()
+            if token.startswith("\\begin"):
+                if environment not in KATEX_ENVIRONMENTS:
+                    problems.append(f"unknown environment {environment}")
+                frames.append(("env", environment))
+                alignments += environment in ALIGNMENT_ENVIRONMENTS
+                emit(f"\\begin{{{environment}}}")
+            elif close(("env",), environment):
+                emit(f"\\end{{{environment}}}")
+            else:
+                repairs.append(f"stray \\end{{{environment}}}")
+        elif first == "\\":
+            if len(token) == 1:
+                repairs.append("trailing backslash")
+                continue
+            if not token[1].isalpha():
+                emit(token)
+                continue
+            command = COMMAND_ALIASES.get(token[1:], token[1:])
+            if command not in KATEX_COMMANDS:
+                replacement = COMMAND_REPAIRS.get(command)
+                if replacement is None:
+                    problems.append(f"unknown command \\{command}")
+                else:
+                    repairs.append(f"\\{command}")
+                    command = replacement[1:]
+            if command == "left":
+                frames.append(("left", None))
+            elif command == "right" and not close(("left",)):
+                # Keep the delimiter, drop the unmatched \right
+                repairs.append("unmatched \\right")
+                continue
+            emit("\\" + command)
+            after_word = command[-1].isalpha()
+            text_argument = command in TEXT_COMMANDS
+        elif first == "{":
+            frames.append(("text" if text_argument else "{", None))
+            emit("{")
+        elif first == "}":
+            if close(("{", "text")):
+                emit("}")
+            else:
+                repairs.append("stray }")
+        elif first == "$":
+            mode = innermost_mode()
+            if mode == "$":
+                close(("$",))
+                emit("$")
+            elif mode == "text":
+                frames.append(("$", None))
+                emit("$")
+            else:
+                repairs.append("stray $")
+        elif first in "%#" or first == "&" and not alignments:
+            repairs.append(f"bare {first}")
+            emit("\\" + first)
+        else:
+            emit(token)
+        text_mode = innermost_mode() == "text"
+
+    if out and out[-1] in ("\\left", "\\right", "\\middle"):
+        repairs.append("missing delimiter")
+        emit(".")
+    while frames:
+        frame = frames.pop()
+        repairs.append(f"unclosed {frame[1] or frame[0]}")
+        emit(_closer(frame))
+
+    # x^{2}y becomes x^2 y: without its braces the script must stay apart from what follows
+    canonical = _braced_script_re.sub(lambda m: m.group(1) + m.group(2) + (" " if m.group(3) else ""), "".join(out).strip())
+    if not canonical:
+        problems.append("empty output")
+    return LatexCheck(canonical, tuple(repairs), tuple(problems))
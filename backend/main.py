@@ -1,47 +1,578 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 import re
 import logging
+import asyncio
+import functools
+import json
+import math
+import random
+import time
+from gemini_sdk import genai
+from structured_logging import PayloadLogger, configure_logging, parse_sample_rates
+from conversion_cache import ConversionCache, make_cache_key, normalize_text
+from single_flight import SingleFlight
+from conversion_channel import ConversionChannel
+from latex_rules import LocalLatexConverter
+from table_generator import LocalTableGenerator
+from table_parser import TableRow, TableRowStreamParser, parse_table_response
+from model_registry import ModelRegistry
+from model_router import ModelRouter
+from latex_validator import InvalidLatex, LatexCheck, check_latex
+from metrics import MetricsMiddleware, MetricsRegistry
+from admission import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, AdmissionRejected, ClientRateLimiter, PriorityLimiter, UpstreamOverloaded
+)
+from resilience import CircuitBreaker, CircuitOpen, Deadline, Hedger
+from draft_prefetch import DraftPrefetcher, looks_unfinished
+from document_store import DocumentNotFound, DocumentStore, StepsCompacted, VersionConflict
+from fuzzy_cache import FuzzyLatexIndex
+from latex_export import LatexExporter, PdfBuildFailed, PdfBuilder, find_latex_engine
+from image_store import ORIGINAL, ImageRejected, ImageStore
+from contextlib import asynccontextmanager
+from starlette.requests import HTTPConnection
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: LOG_FORMAT=json writes one JSON object per line. Records are formatted and
+# written by a background thread (LOG_QUEUE=0 writes them synchronously instead)
+log_handler = configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    log_format=os.getenv("LOG_FORMAT", "text"),
+    use_queue=os.getenv("LOG_QUEUE", "1") != "0"
+)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Text Editor API", version="1.0.0")
+# Model responses are logged for LOG_PAYLOAD_SAMPLE_RATE of requests, or per endpoint with
+# LOG_PAYLOAD_SAMPLE_RATES="convert-table=0.01,convert-latex=0.1", cut to LOG_PAYLOAD_MAX_CHARS
+log_payload = PayloadLogger(
+    logger,
+    default_rate=float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1")),
+    sample_rates=parse_sample_rates(os.getenv("LOG_PAYLOAD_SAMPLE_RATES", "")),
+    max_chars=int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+)
+
+async def warm_up_upstream():
+    # Import the Gemini SDK in a thread, then build the shared models and open the upstream connection
+    started = time.perf_counter()
+    await asyncio.to_thread(genai.load)
+    logger.info("Gemini SDK loaded in %.0f ms", (time.perf_counter() - started) * 1000)
+    if GEMINI_API_KEY and GEMINI_API_KEY != "YOUR_GEMINI_API_KEY_HERE" and os.getenv("GEMINI_WARMUP", "1") != "0":
+        await model_registry.warm_up([latex_model(), latex_block_model(), table_model()])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: local rules, the cache and documents are served right away,
+    # and a conversion that needs Gemini before the SDK is loaded waits for the import
+    warm_up = asyncio.ensure_future(warm_up_upstream())
+    yield
+    warm_up.cancel()
+    image_store.close()
+    conversion_cache.close()
+
+app = FastAPI(title="Text Editor API", version="1.0.0", lifespan=lifespan)
 
-# Configure CORS
+# Prometheus-style metrics, served at /metrics
+metrics = MetricsRegistry(namespace="editor")
+
+# Configure CORS (also checked for /ws, which CORS does not cover)
+CORS_ORIGINS = ["http://localhost:3000"]  # React dev server
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # React dev server
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Added last so it wraps CORS and sees every request
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
 # Configure Google Gemini
 # Replace "YOUR_GEMINI_API_KEY_HERE" with your actual API key from https://aistudio.google.com/app/apikey
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY_HERE")
 genai.configure(api_key=GEMINI_API_KEY)
 
+# Worker processes serving this app (see __main__ below); uvicorn and gunicorn read the same variable
+WORKERS = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+def per_worker(limit: float) -> float:
+    """This process's share of a server-wide limit (upstream calls); connections spread evenly over the workers."""
+    return limit / WORKERS
+
+# Upstream call limits: at most GEMINI_MAX_CONCURRENCY Gemini calls run at once (across all workers),
+# each bounded by a timeout so a stalled call cannot hold a slot forever
+GEMINI_MAX_CONCURRENCY = max(int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")) // WORKERS, 1)
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+
+# Callers beyond the concurrency limit queue by priority (inline conversions first).
+# A full queue is shed with 503 + Retry-After; a caller that waits too long, an exhausted
+# GEMINI_REQUESTS_PER_SECOND budget or a pause after an upstream 429 degrades to the local fallback
+upstream_limiter = PriorityLimiter(
+    max_concurrency=GEMINI_MAX_CONCURRENCY,
+    max_queue=max(int(os.getenv("GEMINI_MAX_QUEUE", "64")) // WORKERS, 1),
+    max_wait={
+        PRIORITY_INTERACTIVE: float(os.getenv("GEMINI_QUEUE_WAIT_INTERACTIVE_SECONDS", "2")),
+        PRIORITY_BULK: float(os.getenv("GEMINI_QUEUE_WAIT_BULK_SECONDS", "15")),
+    },
+    rate_per_second=per_worker(float(os.getenv("GEMINI_REQUESTS_PER_SECOND", "0"))),
+    burst=per_worker(float(os.getenv("GEMINI_REQUESTS_BURST", "0")))
+)
+GEMINI_RATE_LIMIT_PAUSE_SECONDS = float(os.getenv("GEMINI_RATE_LIMIT_PAUSE_SECONDS", "10"))
+
+# Total time budget per request across queueing, the fast tier and any escalation;
+# a request that runs out is answered with its fallback
+ENDPOINT_DEADLINE_SECONDS = {
+    "convert-latex": float(os.getenv("DEADLINE_LATEX_SECONDS", "8")),
+    "convert-latex-block": float(os.getenv("DEADLINE_BLOCK_SECONDS", "20")),
+    "convert-table": float(os.getenv("DEADLINE_TABLE_SECONDS", "25")),
+}
+
+# After CIRCUIT_FAILURE_THRESHOLD consecutive upstream failures or timeouts, skip Gemini and
+# serve fallbacks immediately for CIRCUIT_RESET_SECONDS, then let one probe call through
+circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+)
+
+# Inline conversions send a duplicate call if the first is slower than this (0 disables hedging)
+inline_hedger = Hedger(delay=float(os.getenv("GEMINI_HEDGE_AFTER_SECONDS", "0")))
+
+# Inline drafts are converted speculatively once the user pauses typing for DRAFT_DEBOUNCE_SECONDS,
+# so the final /api/convert-latex request usually finds its answer cached or already in flight
+draft_prefetcher = DraftPrefetcher(
+    debounce_seconds=float(os.getenv("DRAFT_DEBOUNCE_SECONDS", "0.4")),
+    max_sessions=int(os.getenv("DRAFT_MAX_SESSIONS", "1000")),
+    max_sessions_per_client=int(os.getenv("DRAFT_MAX_SESSIONS_PER_CLIENT", "16"))
+)
+DRAFT_MIN_CHARS = 3
+
+# API keys (comma-separated) that get a bucket of their own; other X-API-Key values are ignored
+CLIENT_API_KEYS = frozenset(key.strip() for key in os.getenv("CLIENT_API_KEYS", "").split(",") if key.strip())
+
+# Per-client token buckets: every request is charged to its address, and a request with one of
+# CLIENT_API_KEYS to that key's bucket as well. Each worker keeps its own buckets at the full
+# rate: a client's connections are not spread evenly enough to split them, so with several
+# workers a client may get up to WORKERS times the rate
+client_rate_limiter = ClientRateLimiter(
+    rate_per_second=float(os.getenv("CLIENT_REQUESTS_PER_MINUTE", "120")) / 60,
+    burst=max(float(os.getenv("CLIENT_REQUESTS_BURST", "30")), 1)
+)
+# Drafts get buckets of their own: the editor sends one every few keystrokes, far more often
+# than conversions, but there is no reason for anyone to send them faster than they can type
+draft_rate_limiter = ClientRateLimiter(
+    rate_per_second=float(os.getenv("DRAFT_REQUESTS_PER_MINUTE", "600")) / 60,
+    burst=max(float(os.getenv("DRAFT_REQUESTS_BURST", "60")), 1)
+)
+
+GEMINI_MODEL_NAME = "gemini-2.5-pro"
+# Cheaper model tried first for short, simple inputs; set GEMINI_FAST_MODEL to an empty string to disable
+GEMINI_FAST_MODEL_NAME = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash")
+
+# Shared conversion cache; set CONVERSION_CACHE_DB to a file path to keep entries across restarts.
+# With several workers it defaults to conversion_cache.db next to this file (not the working
+# directory), through which the workers share their conversions
+conversion_cache = ConversionCache(
+    max_entries=int(os.getenv("CONVERSION_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("CONVERSION_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    db_path=os.getenv("CONVERSION_CACHE_DB") or (
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversion_cache.db") if WORKERS > 1 else None
+    )
+)
+
+# Inline inputs that canonicalize to a converted one ("int x squared dx" for "integral of x^2 dx"),
+# or differ from it only in connectives, reuse its LaTeX. FUZZY_CACHE_VERIFY_RATE of those hits
+# are also converted upstream in the background to measure the index's precision
+fuzzy_latex_index = FuzzyLatexIndex(
+    max_entries=int(os.getenv("FUZZY_CACHE_SIZE", "200000")),
+    threshold=float(os.getenv("FUZZY_CACHE_THRESHOLD", "0.35"))
+)
+FUZZY_CACHE_VERIFY_RATE = float(os.getenv("FUZZY_CACHE_VERIFY_RATE", "0.02"))
+fuzzy_verifications = set()  # background tasks, referenced so they are not garbage collected
+
+# Identical conversions that arrive while one is already running share its upstream call
+inflight_conversions = SingleFlight()
+
+# Rule-based converter that answers common phrases before they reach the model
+local_converter = LocalLatexConverter()
+
+# Builds dimension-only and arithmetic tables (multiplication, powers, truth tables) without the model
+local_table_generator = LocalTableGenerator()
+
+# Models are built once per configuration and shared across requests
+model_registry = ModelRegistry()
+
+# Documents are saved as ProseMirror steps and compacted into snapshots the client sends.
+# Searches rank at most SEARCH_MAX_RANKED_BLOCKS matching blocks, newest documents first
+document_store = DocumentStore(
+    db_path=os.getenv("DOCUMENTS_DB", "documents.db"),
+    compact_after_steps=int(os.getenv("DOCUMENT_COMPACT_AFTER_STEPS", "200")),
+    max_ranked_blocks=int(os.getenv("SEARCH_MAX_RANKED_BLOCKS", "1000"))
+)
+
+# Exported documents are rendered one top-level node at a time; unchanged nodes reuse their fragment
+latex_exporter = LatexExporter(ConversionCache(max_entries=int(os.getenv("EXPORT_FRAGMENT_CACHE_SIZE", "20000"))))
+
+# PDF export compiles with tectonic or pdflatex (LATEX_ENGINE picks one, "none" disables it),
+# at most PDF_BUILD_WORKERS builds at a time with up to PDF_BUILD_QUEUE more waiting
+pdf_builder = PdfBuilder(
+    engine=find_latex_engine(os.getenv("LATEX_ENGINE", "")),
+    limiter=PriorityLimiter(
+        max_concurrency=int(os.getenv("PDF_BUILD_WORKERS", "2")),
+        max_queue=int(os.getenv("PDF_BUILD_QUEUE", "8")),
+        max_wait={PRIORITY_BULK: float(os.getenv("PDF_BUILD_QUEUE_WAIT_SECONDS", "30"))}
+    ),
+    timeout_seconds=float(os.getenv("PDF_BUILD_TIMEOUT_SECONDS", "60")),
+    cache_size=int(os.getenv("PDF_CACHE_SIZE", "32"))
+)
+
+# Uploaded images are stored under IMAGES_DIR by content hash. New ones are resized to
+# IMAGE_VARIANT_WIDTHS in IMAGE_WORKERS processes, with up to IMAGE_QUEUE more waiting
+image_store = ImageStore(
+    root=os.getenv("IMAGES_DIR", "images"),
+    limiter=PriorityLimiter(
+        max_concurrency=int(os.getenv("IMAGE_WORKERS", "2")),
+        max_queue=int(os.getenv("IMAGE_QUEUE", "16")),
+        max_wait={PRIORITY_INTERACTIVE: float(os.getenv("IMAGE_QUEUE_WAIT_SECONDS", "30"))}
+    ),
+    workers=int(os.getenv("IMAGE_WORKERS", "2")),
+    widths=tuple(int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",")),
+    max_bytes=int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+)
+
+stage_seconds = metrics.histogram(
+    "stage_duration_seconds", "Time spent in each stage of a conversion", ("endpoint", "stage")
+)
+conversion_lookups = metrics.counter(
+    "conversion_lookups_total", "Conversions by where they were answered: local rules, cache or upstream", ("endpoint", "source")
+)
+fallbacks = metrics.counter("fallbacks_total", "Responses served from a fallback", ("endpoint", "reason"))
+upstream_seconds = metrics.histogram(
+    "upstream_request_duration_seconds", "Gemini call latency, including time waiting for a slot", ("model", "outcome")
+)
+upstream_tokens = metrics.counter("upstream_tokens_total", "Tokens reported by Gemini usage metadata", ("model", "direction"))
+upstream_in_flight = metrics.gauge("upstream_requests_in_flight", "Gemini calls currently running or waiting for a slot")
+latex_checks = metrics.counter(
+    "latex_checks_total", "Model LaTeX by check outcome: valid, repaired locally, valid after a retry or invalid", ("endpoint", "outcome")
+)
+admission_rejections = metrics.counter(
+    "admission_rejections_total", "Requests refused by rate limiting or upstream admission control", ("reason",)
+)
+
+metrics.add_collector("conversion_cache", "Conversion cache statistics", lambda: conversion_cache.stats())
+metrics.add_collector("single_flight", "Request coalescing statistics", lambda: inflight_conversions.stats())
+metrics.add_collector("local_rules", "Local LaTeX rule and table generator statistics",
+                      lambda: {**local_converter.stats(), **local_table_generator.stats()})
+metrics.add_collector("logging", "Log records dropped on a full queue and payload sampling",
+                      lambda: {"dropped": log_handler.dropped if log_handler else 0, **log_payload.stats()})
+metrics.add_collector("fuzzy_cache", "Fuzzy conversion cache statistics", lambda: fuzzy_latex_index.stats())
+metrics.add_collector("model_registry", "Model construction statistics", lambda: model_registry.stats())
+metrics.add_collector("routing", "Model tier routing statistics", lambda: model_router.stats())
+metrics.add_collector("admission", "Upstream admission and client rate limiting statistics",
+                      lambda: {**upstream_limiter.stats(), **client_rate_limiter.stats()})
+metrics.add_collector("circuit_breaker", "Upstream circuit breaker (state_code: 0 closed, 1 half-open, 2 open)",
+                      lambda: circuit_breaker.stats())
+metrics.add_collector("hedging", "Hedged inline conversion statistics", lambda: inline_hedger.stats())
+document_save_seconds = metrics.histogram("document_save_seconds", "Document save latency by kind", ("kind",))
+document_search_seconds = metrics.histogram("document_search_seconds", "Document search latency")
+document_save_bytes = metrics.histogram(
+    "document_save_bytes", "Bytes written per document save by kind", ("kind",),
+    buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+metrics.add_collector("document_store", "Document store statistics", lambda: document_store.stats())
+metrics.add_collector("draft_prefetch", "Speculative draft conversion statistics", lambda: draft_prefetcher.stats())
+metrics.add_collector("export", "LaTeX and PDF export statistics",
+                      lambda: {**latex_exporter.stats(), **pdf_builder.stats()})
+metrics.add_collector("images", "Image upload and processing statistics", lambda: image_store.stats())
+
+def latex_model(model_name=GEMINI_MODEL_NAME):
+    # Low temperature for consistent mathematical output
+    with stage_seconds.time("convert-latex", "model"):
+        return model_registry.get(model_name, LATEX_CONVERSION_PROMPT, temperature=0.1, max_output_tokens=200)
+
+def packed_latex_model(count: int):
+    return model_registry.get(GEMINI_MODEL_NAME, LATEX_PACKED_CONVERSION_PROMPT, temperature=0.1, max_output_tokens=200 * count)
+
+def latex_block_model(model_name=GEMINI_MODEL_NAME):
+    # More tokens for longer blocks
+    with stage_seconds.time("convert-latex-block", "model"):
+        return model_registry.get(model_name, LATEX_BLOCK_CONVERSION_PROMPT, temperature=0.1, max_output_tokens=800)
+
+def table_model(model_name=GEMINI_MODEL_NAME):
+    # Force a JSON response; the table prompt is sent as content, not as a system instruction
+    with stage_seconds.time("convert-table", "model"):
+        return model_registry.get(model_name, None, temperature=0.1, max_output_tokens=4000, response_mime_type="application/json")
+
+# Per-endpoint input length limits for the fast tier
+model_router = ModelRouter(
+    fast_model=GEMINI_FAST_MODEL_NAME,
+    strong_model=GEMINI_MODEL_NAME,
+    max_chars={
+        "convert-latex": int(os.getenv("ROUTER_FAST_MAX_CHARS_LATEX", "80")),
+        "convert-latex-block": int(os.getenv("ROUTER_FAST_MAX_CHARS_BLOCK", "200")),
+        "convert-table": int(os.getenv("ROUTER_FAST_MAX_CHARS_TABLE", "80")),
+    },
+    max_complexity=int(os.getenv("ROUTER_FAST_MAX_COMPLEXITY", "1"))
+)
+
+def upstream_error_class(e: BaseException) -> str:
+    """Short label for a failed Gemini call, used in metrics."""
+    if isinstance(e, genai.types.BlockedPromptException):
+        return "blocked"
+    if isinstance(e, genai.types.StopCandidateException):
+        return "stopped"
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(e, CircuitOpen):
+        return "circuit_open"
+    if isinstance(e, UpstreamOverloaded):
+        return "shed_queue_full"
+    if isinstance(e, AdmissionRejected):
+        return "shed_budget"
+    if "API_KEY_INVALID" in str(e):
+        return "auth_401"
+    if is_rate_limit_error(e):
+        return "rate_limited_429"
+    return "other"
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    return "RATE_LIMIT_EXCEEDED" in str(e) or type(e).__name__ == "ResourceExhausted"
+
+def note_upstream_failure(e: BaseException):
+    if isinstance(e, CircuitOpen):
+        return
+    # Stop sending while the quota recovers, so other requests degrade locally instead of piling on
+    if is_rate_limit_error(e):
+        upstream_limiter.pause(GEMINI_RATE_LIMIT_PAUSE_SECONDS)
+        circuit_breaker.record_ignored()
+    elif isinstance(e, (genai.types.BlockedPromptException, genai.types.StopCandidateException,
+                        AdmissionRejected, asyncio.CancelledError, GeneratorExit)):
+        # Content-specific or never sent: says nothing about upstream health
+        circuit_breaker.record_ignored()
+    else:
+        circuit_breaker.record_failure()
+
+def call_timeout(deadline: Deadline) -> float:
+    """Timeout for one upstream attempt: what is left of the request's budget, capped per call."""
+    return min(deadline.remaining(), GEMINI_TIMEOUT_SECONDS)
+
+def record_usage(model_name: str, usage_metadata):
+    if usage_metadata is None:
+        return
+    upstream_tokens.inc(model_name, "prompt", amount=usage_metadata.prompt_token_count)
+    upstream_tokens.inc(model_name, "output", amount=usage_metadata.candidates_token_count)
+
+async def generate_content(model, contents, timeout=GEMINI_TIMEOUT_SECONDS, priority=PRIORITY_BULK):
+    """Call Gemini through the async API so the event loop keeps serving other requests.
+
+    timeout is seconds, or the request's Deadline: its timeout is then taken once a slot is
+    acquired, so time spent queueing comes out of the same budget.
+    """
+    outcome = "ok"
+    started = time.perf_counter()
+    upstream_in_flight.inc()
+    try:
+        circuit_breaker.allow()
+        async with upstream_limiter.slot(priority):
+            if isinstance(timeout, Deadline):
+                timeout = call_timeout(timeout)
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, request_options={"timeout": timeout}),
+                timeout=timeout
+            )
+        circuit_breaker.record_success()
+        record_usage(model.model_name, getattr(response, "usage_metadata", None))
+        return response
+    except BaseException as e:
+        outcome = upstream_error_class(e)
+        note_upstream_failure(e)
+        raise
+    finally:
+        upstream_in_flight.dec()
+        upstream_seconds.observe(time.perf_counter() - started, model.model_name, outcome)
+
+async def generate_text(model, contents, timeout=GEMINI_TIMEOUT_SECONDS, priority=PRIORITY_BULK) -> str:
+    response = await generate_content(model, contents, timeout, priority)
+    return response.text
+
+async def stream_content(model, contents, timeout=GEMINI_TIMEOUT_SECONDS, priority=PRIORITY_BULK):
+    """Yield text chunks from a streaming Gemini call as soon as the model produces them.
+
+    timeout is seconds or the request's Deadline, and bounds the whole stream, checked between
+    chunks, including the time the caller takes to consume them. A separate task reads upstream
+    and gives up the limiter slot as soon as the model has finished, however slowly the caller reads.
+    """
+    deadline = timeout if isinstance(timeout, Deadline) else Deadline(timeout)
+    chunks = asyncio.Queue()
+    reader = asyncio.ensure_future(read_stream(model, contents, deadline, priority, chunks))
+    try:
+        while True:
+            remaining = deadline.remaining()
+            chunk = await asyncio.wait_for(chunks.get(), remaining)
+            if chunk is None:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        reader.cancel()
+
+async def read_stream(model, contents, deadline: Deadline, priority, chunks: asyncio.Queue):
+    """Put the text chunks of a streaming Gemini call on chunks, then None, or the exception it failed with."""
+    outcome = "ok"
+    usage_metadata = None
+    started = time.perf_counter()
+    upstream_in_flight.inc()
+    try:
+        circuit_breaker.allow()
+        async with upstream_limiter.slot(priority):
+            timeout = call_timeout(deadline)
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, stream=True, request_options={"timeout": timeout}),
+                timeout=timeout
+            )
+            response_chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(response_chunks.__anext__(), deadline.remaining())
+                except StopAsyncIteration:
+                    break
+                # Usage is cumulative; the last chunk carries the totals
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only a finish reason)
+                    continue
+                if text:
+                    chunks.put_nowait(text)
+        circuit_breaker.record_success()
+        record_usage(model.model_name, usage_metadata)
+        chunks.put_nowait(None)
+    except BaseException as e:
+        outcome = upstream_error_class(e)
+        note_upstream_failure(e)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        # Handed to the consumer rather than raised, so the task never ends with an unretrieved error
+        chunks.put_nowait(e)
+    finally:
+        upstream_in_flight.dec()
+        upstream_seconds.observe(time.perf_counter() - started, model.model_name, outcome)
+
+# Disable proxy buffering so events reach the client as soon as they are written
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def upstream_fallback_reason(e: Exception) -> str:
+    if isinstance(e, CircuitOpen):
+        return "circuit_open"
+    if isinstance(e, AdmissionRejected):
+        return "upstream_busy"
+    if isinstance(e, asyncio.TimeoutError):
+        return "deadline"
+    if isinstance(e, InvalidLatex):
+        return "invalid_latex"
+    return "upstream_error"
+
+def upstream_http_error(e: Exception):
+    """Map a Gemini exception to the HTTPException the endpoints raise, or None to use the fallback."""
+    if isinstance(e, genai.types.BlockedPromptException):
+        return HTTPException(status_code=400, detail="Content was blocked by safety filters")
+    if isinstance(e, genai.types.StopCandidateException):
+        return HTTPException(status_code=400, detail="Generation was stopped")
+    if isinstance(e, UpstreamOverloaded):
+        return HTTPException(status_code=503, detail="Server is busy. Please try again later.",
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if "API_KEY_INVALID" in str(e):
+        return HTTPException(status_code=401, detail="Gemini API authentication failed")
+    if is_rate_limit_error(e):
+        return HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.",
+                             headers={"Retry-After": str(math.ceil(GEMINI_RATE_LIMIT_PAUSE_SECONDS))})
+    return None
+
+def client_address(request: HTTPConnection) -> str:
+    return f"addr:{request.client.host if request.client else 'unknown'}"
+
+def client_identity(request: HTTPConnection) -> str:
+    """The client's API key if it is one of CLIENT_API_KEYS, otherwise its address."""
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in CLIENT_API_KEYS:
+        return f"key:{api_key}"
+    return client_address(request)
+
+def client_buckets(request: HTTPConnection) -> tuple:
+    """Rate-limit buckets a request is charged to: its address, and its API key's if it has a known one."""
+    address, identity = client_address(request), client_identity(request)
+    return (address,) if identity == address else (address, identity)
+
+def client_rate_limit_error(limiter: ClientRateLimiter, buckets: tuple, reason: str) -> Optional[HTTPException]:
+    """The 429 to answer if the request is over its limit in any of its buckets, else None."""
+    retry_after = limiter.check(*buckets)
+    if not retry_after:
+        return None
+    admission_rejections.inc(reason)
+    return HTTPException(status_code=429, detail="Too many requests. Please slow down.",
+                         headers={"Retry-After": str(math.ceil(retry_after))})
+
+async def enforce_client_rate_limit(request: Request):
+    """Route dependency: reject clients that exceed their token bucket before any work is done."""
+    error = client_rate_limit_error(client_rate_limiter, client_buckets(request), "client_rate_limit")
+    if error is not None:
+        raise error
+
+async def enforce_draft_rate_limit(request: Request):
+    """Route dependency: the same check against the separate, more generous draft buckets."""
+    error = client_rate_limit_error(draft_rate_limiter, client_buckets(request), "draft_rate_limit")
+    if error is not None:
+        raise error
+
+rate_limited = [Depends(enforce_client_rate_limit)]
+
 class ConvertLatexRequest(BaseModel):
     text: str
+    sessionId: Optional[str] = None  # input the text was drafted in, see /api/convert-latex/draft
 
 class ConvertLatexResponse(BaseModel):
     latex: str
     original_text: str
 
+class ConvertLatexDraftRequest(BaseModel):
+    sessionId: str
+    text: str
+
+class ConvertLatexDraftResponse(BaseModel):
+    status: str  # "ready" (latex is set), "scheduled" or "skipped"
+    latex: Optional[str] = None
+
+class ConvertLatexBatchRequest(BaseModel):
+    texts: List[str]
+    pack: bool = False  # pack several short expressions into one model prompt
+
+class ConvertLatexBatchItem(BaseModel):
+    status: int
+    result: Optional[ConvertLatexResponse] = None
+    error: Optional[str] = None
+
+class ConvertLatexBatchResponse(BaseModel):
+    results: List[ConvertLatexBatchItem]
+
 class ConvertTableRequest(BaseModel):
     prompt: str
 
 class ConvertTableResponse(BaseModel):
-    tableData: list
+    tableData: List[TableRow]
     originalPrompt: str
 
 class ConvertLatexBlockRequest(BaseModel):
@@ -98,6 +629,13 @@ You are a LaTeX specialist that converts English mathematical and logical text i
 When you are given an equation, CONVERT that equation into LaTeX code. Do not evaluate the expression, and make sure to preserve all parts of the equation, using your judgement to evaluate what to convert to what in terms of LaTeX code. Return ONLY the LaTeX code.
 """
 
+# Sent in place of the input for the one retry when the model's LaTeX cannot be repaired locally
+LATEX_RETRY_PROMPT = """{text}
+
+Your previous answer was:
+{latex}
+KaTeX cannot render it: {problems}. Use only commands and environments KaTeX supports and return ONLY the corrected LaTeX code."""
+
 @app.get("/")
 async def root():
     return {"message": "Text Editor API is running"}
@@ -106,46 +644,148 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
-@app.post("/api/convert-latex", response_model=ConvertLatexResponse)
-async def convert_latex(request: ConvertLatexRequest):
-    """Convert natural language mathematical expressions to LaTeX."""
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {
+        **conversion_cache.stats(),
+        **inflight_conversions.stats(),
+        **fuzzy_latex_index.stats(),
+        **local_converter.stats(),
+        **local_table_generator.stats(),
+        **model_registry.stats(),
+        "routing": model_router.stats(),
+        "admission": {**upstream_limiter.stats(), **client_rate_limiter.stats()},
+        "circuitBreaker": circuit_breaker.stats(),
+        "hedging": inline_hedger.stats(),
+        "draftPrefetch": draft_prefetcher.stats(),
+        "documents": document_store.stats(),
+        "export": {**latex_exporter.stats(), **pdf_builder.stats()},
+        "images": image_store.stats(),
+    }
 
-    if not request.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty")
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Conversions are keyed on the models their route can answer with, not only the strong model
+def latex_cache_key(text: str) -> str:
+    return make_cache_key("convert-latex", model_router.cache_scope("convert-latex", text), LATEX_CONVERSION_PROMPT, text)
+
+async def lookup_latex(text: str):
+    """Return LaTeX for text from the local rules or the cache, or None if the model is needed."""
+    # Serve common phrases and input that is already LaTeX without calling the model
+    with stage_seconds.time("convert-latex", "lookup"):
+        local = local_converter.convert(text)
+        if local is not None and local.confident:
+            conversion_lookups.inc("convert-latex", "local")
+            return local.latex
+
+        cached_latex = await conversion_cache.fetch(latex_cache_key(text))
+        if cached_latex is None:
+            match = fuzzy_latex_index.lookup(text)
+            if match is not None:
+                conversion_lookups.inc("convert-latex", "fuzzy")
+                if random.random() < FUZZY_CACHE_VERIFY_RATE:
+                    task = asyncio.ensure_future(verify_fuzzy_match(text, match.latex))
+                    fuzzy_verifications.add(task)
+                    task.add_done_callback(fuzzy_verifications.discard)
+                return match.latex
+    conversion_lookups.inc("convert-latex", "cache" if cached_latex is not None else "upstream")
+    return cached_latex
+
+def remember_latex(text: str, latex_code: str):
+    conversion_cache.set(latex_cache_key(text), latex_code)
+    fuzzy_latex_index.add(text, latex_code)
+
+async def generate_checked_latex(endpoint: str, text: str, call, clean=str.strip, alignment: bool = False) -> LatexCheck:
+    """Generate LaTeX for text on the routed model tier and check it with check_latex.
+
+    call(model_name, contents) returns the model's text. Output with only structural defects
+    is repaired locally and is not escalated. Output KaTeX cannot render (unknown commands or
+    environments) escalates from the fast tier like any invalid output, and is then retried
+    once on the strong model with its problems spelled out.
+    """
+    def check(response_text):
+        with stage_seconds.time(endpoint, "validate"):
+            return check_latex(clean(response_text), alignment)
+
+    response_text = await model_router.generate(
+        endpoint, text, lambda model_name: call(model_name, text), validate=lambda result: check(result).ok
+    )
+    log_payload(endpoint, "Gemini API Response", response_text)
+    checked = check(response_text)
+    if checked.ok:
+        latex_checks.inc(endpoint, "repaired" if checked.repairs else "valid")
+        return checked
+
+    problems = "; ".join(checked.problems)
+    logger.warning("Retrying %s once, KaTeX cannot render the model's LaTeX: %s", endpoint, problems)
+    response_text = await call(model_router.strong_model, LATEX_RETRY_PROMPT.format(text=text, latex=checked.latex, problems=problems))
+    log_payload(endpoint, "Gemini API Response to retry", response_text)
+    checked = check(response_text)
+    latex_checks.inc(endpoint, "retried" if checked.ok else "invalid")
+    return checked
+
+async def verify_fuzzy_match(text: str, latex: str):
+    """Convert a fuzzy hit upstream when it is idle and record whether the answers agree."""
+    if upstream_limiter.waiting or upstream_limiter.active >= upstream_limiter.max_concurrency:
+        return
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        return
+    try:
+        response = await convert_latex_upstream(text, priority=PRIORITY_BULK)
+    except HTTPException:
+        return
+    agreed = "".join(response.latex.split()) == "".join(latex.split())
+    fuzzy_latex_index.record_verification(agreed)
+    if not agreed:
+        logger.warning("Fuzzy cache answered '%s' with '%s', upstream says '%s'", text, latex, response.latex)
+
+async def convert_latex_upstream(text: str, priority: int = PRIORITY_INTERACTIVE, speculative: bool = False) -> ConvertLatexResponse:
+    """Convert text with Gemini, mapping upstream errors to HTTP errors or the fallback.
+
+    A speculative call is cancelled if its caller is cancelled while nobody else waits for it.
+    """
+    cache_key = latex_cache_key(text)
 
     # Check if Gemini API key is configured
     if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
         logger.warning("Gemini API key not configured, using fallback patterns")
+        fallbacks.inc("convert-latex", "no_api_key")
         # Return original text as fallback
         return ConvertLatexResponse(
-            latex=request.text,
-            original_text=request.text
+            latex=text,
+            original_text=text
         )
 
+    # Model objects and the except clauses below touch the SDK; never import it on the event loop
+    await genai.ready()
     try:
-        # Use Gemini to convert natural language to LaTeX
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro",  # Stable Gemini 1.5 Flash model
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,  # Low temperature for consistent mathematical output
-                max_output_tokens=200,
-            ),
-            system_instruction=LATEX_CONVERSION_PROMPT
-        )
+        # Use Gemini to convert natural language to LaTeX, starting on the fast tier for simple input
+        deadline = Deadline(ENDPOINT_DEADLINE_SECONDS["convert-latex"])
+        with stage_seconds.time("convert-latex", "upstream"):
+            checked = await inflight_conversions.do(cache_key, lambda: generate_checked_latex(
+                "convert-latex", text,
+                lambda model_name, contents: inline_hedger.run(lambda: generate_text(
+                    latex_model(model_name), contents, timeout=deadline, priority=priority
+                ))
+            ), cancel_when_abandoned=speculative)
+        if not checked.ok:
+            raise InvalidLatex("; ".join(checked.problems))
 
-        response = model.generate_content(request.text)
-        logger.info(f"Gemini API Response: {response.text}")
-
-        latex_code = response.text.strip()
-        
-        if not latex_code or latex_code == request.text:
-            latex_code = request.text
+        latex_code = checked.latex
         
-        logger.info(f"Converted '{request.text}' to '{latex_code}'")
+        logger.debug("Converted '%s' to '%s'", text, latex_code)
+        if latex_code == text:
+            fallbacks.inc("convert-latex", "empty_response")
+            conversion_cache.set(cache_key, latex_code)
+        else:
+            remember_latex(text, latex_code)
         
         return ConvertLatexResponse(
             latex=latex_code,
-            original_text=request.text
+            original_text=text
         )
         
     except genai.types.BlockedPromptException:
@@ -157,19 +797,174 @@ async def convert_latex(request: ConvertLatexRequest):
         raise HTTPException(status_code=400, detail="Generation was stopped")
     
     except Exception as e:
-        logger.error(f"Error converting LaTeX: {str(e)}")
-        # Check for specific Gemini errors
-        if "API_KEY_INVALID" in str(e):
-            raise HTTPException(status_code=401, detail="Gemini API authentication failed")
-        elif "RATE_LIMIT_EXCEEDED" in str(e):
-            raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
+        logger.error("Error converting LaTeX: %s", e)
+        # Check for specific Gemini errors and overload
+        error = upstream_http_error(e)
+        if error is not None:
+            raise error
         
         # Return original text as fallback
+        fallbacks.inc("convert-latex", upstream_fallback_reason(e))
+        return ConvertLatexResponse(
+            latex=text,
+            original_text=text
+        )
+
+@app.post("/api/convert-latex", response_model=ConvertLatexResponse, dependencies=rate_limited)
+async def convert_latex(request: ConvertLatexRequest, client: str = Depends(client_identity)):
+    """Convert natural language mathematical expressions to LaTeX."""
+
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+
+    if request.sessionId:
+        # Stops speculation on earlier drafts; a matching one is already cached or in flight
+        draft_prefetcher.commit(client, request.sessionId, request.text)
+
+    cached_latex = await lookup_latex(request.text)
+    if cached_latex is not None:
         return ConvertLatexResponse(
-            latex=request.text,
+            latex=cached_latex,
             original_text=request.text
         )
 
+    return await convert_latex_upstream(request.text)
+
+async def prefetch_latex(text: str, client: str) -> bool:
+    """Speculatively convert a draft; returns False if it was not sent upstream."""
+    # Never queue speculative work behind real requests, and charge it to the client's budget
+    if upstream_limiter.waiting or upstream_limiter.active >= upstream_limiter.max_concurrency:
+        return False
+    if client_rate_limiter.check(client):
+        return False
+    await convert_latex_upstream(text, priority=PRIORITY_BULK, speculative=True)
+    return True
+
+async def convert_latex_draft(request: ConvertLatexDraftRequest, client: str) -> ConvertLatexDraftResponse:
+    text = request.text
+    session = request.sessionId
+    if len(text.strip()) < DRAFT_MIN_CHARS:
+        draft_prefetcher.draft(client, session, text)
+        return ConvertLatexDraftResponse(status="skipped")
+
+    # Local rules and the cache answer at once, without speculation
+    latex = await lookup_latex(text)
+    if latex is not None:
+        draft_prefetcher.draft(client, session, text)
+        return ConvertLatexDraftResponse(status="ready", latex=latex)
+
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE" or looks_unfinished(text):
+        draft_prefetcher.draft(client, session, text)
+        return ConvertLatexDraftResponse(status="skipped")
+
+    draft_prefetcher.draft(client, session, text, lambda: prefetch_latex(text, client))
+    return ConvertLatexDraftResponse(status="scheduled")
+
+@app.post("/api/convert-latex/draft", response_model=ConvertLatexDraftResponse,
+          dependencies=[Depends(enforce_draft_rate_limit)])
+async def convert_latex_draft_endpoint(request: ConvertLatexDraftRequest, client: str = Depends(client_identity)):
+    """Report the text of an inline expression while it is being typed.
+
+    Returns the LaTeX right away if local rules or the cache know it. Otherwise, once the
+    session has been idle for DRAFT_DEBOUNCE_SECONDS, the draft is converted speculatively;
+    a newer draft cancels that call. Send the final text to /api/convert-latex with the same
+    sessionId. Drafts have their own rate limit (DRAFT_REQUESTS_PER_MINUTE); speculative calls
+    also count against the client rate limit.
+    """
+    return await convert_latex_draft(request, client)
+
+# Batch conversion limits
+BATCH_MAX_ITEMS = 500
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_PACK_SIZE = 10  # expressions per packed prompt
+BATCH_PACK_MAX_CHARS = 80  # only short expressions are packed together
+
+LATEX_PACKED_CONVERSION_PROMPT = LATEX_CONVERSION_PROMPT + """
+You will be given several numbered equations, one per line. Convert each one independently and return exactly one line per equation in the form "<number>: <LaTeX code>", in the same order, with nothing else.
+"""
+
+_packed_line_re = re.compile(r"^\s*(\d+)\s*[:.)]\s*(.+)$")
+
+async def convert_latex_packed(texts: list) -> dict:
+    """Convert several short expressions with one model call.
+
+    Returns a text -> LaTeX mapping for the expressions whose lines parsed; anything
+    missing (or every expression, if the call fails) is left for individual conversion.
+    """
+    prompt = "\n".join(f"{i}: {text}" for i, text in enumerate(texts, 1))
+
+    await genai.ready()
+    try:
+        model = packed_latex_model(len(texts))
+        response = await generate_content(model, prompt)
+        response_text = response.text
+    except Exception as e:
+        logger.error("Packed LaTeX conversion failed, converting individually: %s", e)
+        return {}
+
+    converted = {}
+    for line in response_text.strip().split("\n"):
+        match = _packed_line_re.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        checked = check_latex(match.group(2))
+        # Lines that cannot be repaired are left for individual conversion
+        if 0 <= index < len(texts) and checked.ok:
+            converted[texts[index]] = checked.latex
+            remember_latex(texts[index], checked.latex)
+
+    logger.info("Packed conversion returned %s/%s expressions", len(converted), len(texts))
+    return converted
+
+@app.post("/api/convert-latex/batch", response_model=ConvertLatexBatchResponse, dependencies=rate_limited)
+async def convert_latex_batch(request: ConvertLatexBatchRequest):
+    """Convert many expressions in one round trip, returning per-item results in order."""
+
+    if len(request.texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} texts per batch")
+
+    # Convert each distinct (normalized) input once
+    outcomes = {}
+    pending = []
+    for text in dict.fromkeys(normalize_text(text) for text in request.texts):
+        if not text:
+            outcomes[text] = (400, None, "Text cannot be empty")
+            continue
+        cached_latex = await lookup_latex(text)
+        if cached_latex is not None:
+            outcomes[text] = (200, cached_latex, None)
+        else:
+            pending.append(text)
+
+    if request.pack:
+        short_texts = [text for text in pending if len(text) <= BATCH_PACK_MAX_CHARS]
+        groups = [short_texts[i:i + BATCH_PACK_SIZE] for i in range(0, len(short_texts), BATCH_PACK_SIZE)]
+        for packed in await asyncio.gather(*(convert_latex_packed(group) for group in groups)):
+            for text, latex_code in packed.items():
+                outcomes[text] = (200, latex_code, None)
+        pending = [text for text in pending if text not in outcomes]
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def convert_one(text):
+        try:
+            async with semaphore:
+                result = await convert_latex_upstream(text, priority=PRIORITY_BULK)
+            outcomes[text] = (200, result.latex, None)
+        except HTTPException as e:
+            outcomes[text] = (e.status_code, None, e.detail)
+
+    await asyncio.gather(*(convert_one(text) for text in pending))
+
+    results = []
+    for text in request.texts:
+        status, latex_code, error = outcomes[normalize_text(text)]
+        result = ConvertLatexResponse(latex=latex_code, original_text=text) if latex_code is not None else None
+        results.append(ConvertLatexBatchItem(status=status, result=result, error=error))
+
+    return ConvertLatexBatchResponse(results=results)
+
 LATEX_BLOCK_CONVERSION_PROMPT = """You are a LaTeX specialist that converts English mathematical and logical text into well-formatted LaTeX for academic documents.
 
 Your task is to convert multi-line English text into LaTeX format suitable for display in mathematical documents.
@@ -218,103 +1013,233 @@ Output: p \\wedge q \\rightarrow r \\\\ \\therefore (p \\wedge q) \\rightarrow r
 
 Return ONLY the LaTeX code, no surrounding text or markdown."""
 
-@app.post("/api/convert-latex-block", response_model=ConvertLatexBlockResponse)
+def strip_latex_fences(response_text: str) -> str:
+    """Remove markdown code fences the model sometimes wraps LaTeX in."""
+    latex_code = response_text.strip()
+    # Clean up the response
+    if latex_code.startswith('```latex'):
+        latex_code = latex_code.replace('```latex', '').replace('```', '').strip()
+    elif latex_code.startswith('```'):
+        latex_code = latex_code.replace('```', '').strip()
+    return latex_code
+
+def extract_math_lines(english_text: str) -> list:
+    """Split a block into lines, keeping only the math part of "math - annotation" lines."""
+    # Parse dash-separated content to preserve annotations
+    input_text = english_text.strip()
+
+    # Check if the input contains dash-separated lines (math - annotation format)
+    lines = input_text.split('\n')
+    math_only_lines = []
+
+    for line in lines:
+        line = line.strip()
+        if ' - ' in line:
+            # Extract only the mathematical part (before the dash)
+            # Use split with maxsplit=1 to handle multiple dashes correctly
+            parts = line.split(' - ', 1)
+            math_part = parts[0].strip()
+            if math_part:
+                math_only_lines.append(math_part)
+        else:
+            # No annotation, use the whole line
+            if line:
+                math_only_lines.append(line)
+
+    return math_only_lines
+
+_align_wrapper_re = re.compile(r"^\\begin\{(align\*?|aligned|gather\*?)\}(.*)\\end\{\1\}$", re.DOTALL)
+
+def latex_block_line_cache_key(math_line: str) -> str:
+    return make_cache_key("convert-latex-block-line", model_router.cache_scope("convert-latex-block", math_line), LATEX_BLOCK_CONVERSION_PROMPT, math_line)
+
+async def lookup_latex_block_line(math_line: str):
+    """Return LaTeX for one block line from the local rules or the cache, or None if the model is needed."""
+    local = local_converter.convert(math_line)
+    if local is not None and local.confident:
+        conversion_lookups.inc("convert-latex-block", "local")
+        return local.latex
+
+    cached_latex = await conversion_cache.fetch(latex_block_line_cache_key(math_line))
+    conversion_lookups.inc("convert-latex-block", "cache" if cached_latex is not None else "upstream")
+    return cached_latex
+
+def clean_latex_block_line(response_text: str) -> str:
+    """Reduce the model's output for a single line to bare LaTeX that can be joined with \\\\."""
+    latex_code = strip_latex_fences(response_text)
+    # A single line does not need the align environment the block prompt asks for
+    wrapped = _align_wrapper_re.match(latex_code)
+    if wrapped:
+        latex_code = wrapped.group(2).strip()
+    while latex_code.endswith("\\\\"):
+        latex_code = latex_code[:-2].rstrip()
+    return latex_code
+
+def assemble_latex_block(latex_lines: list) -> str:
+    """Join converted lines in input order; the frontend wraps multi-line output in align*."""
+    return " \\\\ ".join(latex_lines)
+
+async def convert_latex_block_line(math_line: str) -> str:
+    """Convert one line of a block with Gemini and cache it on its own."""
+    cache_key = latex_block_line_cache_key(math_line)
+    await genai.ready()
+    deadline = Deadline(ENDPOINT_DEADLINE_SECONDS["convert-latex-block"])
+    with stage_seconds.time("convert-latex-block", "upstream"):
+        checked = await inflight_conversions.do(cache_key, lambda: generate_checked_latex(
+            "convert-latex-block", math_line,
+            lambda model_name, contents: generate_text(latex_block_model(model_name), contents, timeout=deadline),
+            clean=clean_latex_block_line, alignment=True
+        ))
+    if not checked.ok:
+        raise InvalidLatex("; ".join(checked.problems))
+
+    conversion_cache.set(cache_key, checked.latex)
+    return checked.latex
+
+async def resolve_latex_block_lines(math_only_lines: list) -> list:
+    """LaTeX for each line that is already known, None for lines that still need the model."""
+    with stage_seconds.time("convert-latex-block", "lookup"):
+        return list(await asyncio.gather(*(lookup_latex_block_line(line) for line in math_only_lines)))
+
+def latex_block_line_fallback(math_line: str, reason: str) -> str:
+    fallbacks.inc("convert-latex-block", reason)
+    return f"\\text{{{math_line}}}"
+
+@app.post("/api/convert-latex-block", response_model=ConvertLatexBlockResponse, dependencies=rate_limited)
 async def convert_latex_block(request: ConvertLatexBlockRequest):
     """Convert English text to LaTeX for large mathematical blocks."""
 
     if not request.englishText.strip():
         raise HTTPException(status_code=400, detail="English text cannot be empty")
 
-    # Check if Gemini API key is configured
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
-        logger.warning("Gemini API key not configured, using fallback LaTeX template")
-        fallback_latex = f"\\text{{{request.englishText}}}"
+    math_only_lines = extract_math_lines(request.englishText)
+    if not math_only_lines:
         return ConvertLatexBlockResponse(
-            latexCode=fallback_latex,
+            latexCode=f"\\text{{{request.englishText}}}",
             originalText=request.englishText
         )
 
-    try:
-        # Parse dash-separated content to preserve annotations
-        input_text = request.englishText.strip()
-
-        # Check if the input contains dash-separated lines (math - annotation format)
-        lines = input_text.split('\n')
-        math_only_lines = []
-
-        for line in lines:
-            line = line.strip()
-            if ' - ' in line:
-                # Extract only the mathematical part (before the dash)
-                # Use split with maxsplit=1 to handle multiple dashes correctly
-                parts = line.split(' - ', 1)
-                math_part = parts[0].strip()
-                if math_part:
-                    math_only_lines.append(math_part)
-            else:
-                # No annotation, use the whole line
-                if line:
-                    math_only_lines.append(line)
-
-        # Join the mathematical parts for AI processing
-        text_for_ai = '\n'.join(math_only_lines)
-
-        # Use Gemini to convert English to LaTeX
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,  # Low temperature for consistent output
-                max_output_tokens=800,  # More tokens for longer blocks
-            ),
-            system_instruction=LATEX_BLOCK_CONVERSION_PROMPT
-        )
-
-        response = model.generate_content(text_for_ai)
-        logger.info(f"Gemini API Response: {response.text}")
-        latex_code = response.text.strip()        
-        # Clean up the response
-        if latex_code.startswith('```latex'):
-            latex_code = latex_code.replace('```latex', '').replace('```', '').strip()
-        elif latex_code.startswith('```'):
-            latex_code = latex_code.replace('```', '').strip()
-        
-        # Basic validation
-        if not latex_code or len(latex_code.strip()) < 3:
-            raise ValueError("Generated LaTeX is too short or empty")
-        
-        logger.info(f"Converted LaTeX block: '{text_for_ai[:50]}...' to '{latex_code[:100]}...'")
-        
+    # Lines are converted and cached independently, so editing one line of a long
+    # block only sends that line upstream
+    latex_lines = await resolve_latex_block_lines(math_only_lines)
+    missing = [index for index, latex in enumerate(latex_lines) if latex is None]
+    if not missing:
         return ConvertLatexBlockResponse(
-            latexCode=latex_code,
-            originalText=request.englishText  # Return the original with annotations
+            latexCode=assemble_latex_block(latex_lines),
+            originalText=request.englishText
         )
-        
-    except genai.types.BlockedPromptException:
-        logger.error("Gemini blocked the LaTeX block prompt")
-        raise HTTPException(status_code=400, detail="Content was blocked by safety filters")
-    
-    except genai.types.StopCandidateException:
-        logger.error("Gemini stopped LaTeX block generation")
-        raise HTTPException(status_code=400, detail="Generation was stopped")
-    
-    except Exception as e:
-        logger.error(f"Error converting LaTeX block: {str(e)}")
-        
-        # Check for specific Gemini errors
-        if "API_KEY_INVALID" in str(e):
-            raise HTTPException(status_code=401, detail="Gemini API authentication failed")
-        elif "RATE_LIMIT_EXCEEDED" in str(e):
-            raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
-        
-        # Fallback to a simple LaTeX representation
-        fallback_latex = f"\\text{{{request.englishText}}}"
-        logger.info(f"Using fallback LaTeX for: {request.englishText}")
-        
+
+    # Check if Gemini API key is configured
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        logger.warning("Gemini API key not configured, using fallback LaTeX template")
+        for index in missing:
+            latex_lines[index] = latex_block_line_fallback(math_only_lines[index], "no_api_key")
         return ConvertLatexBlockResponse(
-            latexCode=fallback_latex,
+            latexCode=assemble_latex_block(latex_lines),
             originalText=request.englishText
         )
 
+    # Changed lines go upstream in parallel; the shared semaphore still bounds concurrency
+    results = await asyncio.gather(
+        *(convert_latex_block_line(math_only_lines[index]) for index in missing),
+        return_exceptions=True
+    )
+
+    for index, result in zip(missing, results):
+        if isinstance(result, Exception):
+            error = upstream_http_error(result)
+            if error is not None:
+                logger.error("LaTeX block conversion failed: %s", error.detail)
+                raise error
+            logger.error("Error converting LaTeX block line '%s': %s", math_only_lines[index], result)
+            result = latex_block_line_fallback(math_only_lines[index], upstream_fallback_reason(result))
+        latex_lines[index] = result
+
+    logger.info("Converted LaTeX block with %s of %s lines sent upstream", len(missing), len(latex_lines))
+    return ConvertLatexBlockResponse(
+        latexCode=assemble_latex_block(latex_lines),
+        originalText=request.englishText  # Return the original with annotations
+    )
+
+async def latex_block_events(english_text: str):
+    """Yield ("line", {"index", "latexCode"}) for each line of a block as soon as it is known, then ("done", ...).
+
+    Lines already cached come first, then changed lines as their upstream calls finish.
+    Ends with ("error", {"status", "detail"}) instead if upstream fails in a way the
+    REST endpoint would report as an HTTP error.
+    """
+    math_only_lines = extract_math_lines(english_text)
+    if not math_only_lines:
+        yield "done", {"latexCode": f"\\text{{{english_text}}}", "originalText": english_text}
+        return
+
+    latex_lines = await resolve_latex_block_lines(math_only_lines)
+    missing = [index for index, latex in enumerate(latex_lines) if latex is None]
+
+    for index, latex in enumerate(latex_lines):
+        if latex is not None:
+            yield "line", {"index": index, "latexCode": latex}
+
+    if missing and (not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE"):
+        logger.warning("Gemini API key not configured, using fallback LaTeX template")
+        for index in missing:
+            latex_lines[index] = latex_block_line_fallback(math_only_lines[index], "no_api_key")
+            yield "line", {"index": index, "latexCode": latex_lines[index]}
+        missing.clear()
+
+    started = time.perf_counter()
+    first_line = True
+
+    async def convert(index):
+        try:
+            return index, await convert_latex_block_line(math_only_lines[index])
+        except Exception as e:
+            return index, e
+
+    tasks = [asyncio.ensure_future(convert(index)) for index in missing]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            if isinstance(result, Exception):
+                error = upstream_http_error(result)
+                if error is not None:
+                    logger.error("Streaming LaTeX block conversion failed: %s", error.detail)
+                    yield "error", {"status": error.status_code, "detail": error.detail}
+                    return
+                logger.error("Error streaming LaTeX block line '%s': %s", math_only_lines[index], result)
+                result = latex_block_line_fallback(math_only_lines[index], upstream_fallback_reason(result))
+            if first_line:
+                logger.info("First LaTeX block line after %.0f ms", (time.perf_counter() - started) * 1000)
+                first_line = False
+            latex_lines[index] = result
+            yield "line", {"index": index, "latexCode": result}
+    finally:
+        # Stop upstream work the client will never see (disconnect, cancel or error event)
+        for task in tasks:
+            task.cancel()
+
+    yield "done", {"latexCode": assemble_latex_block(latex_lines), "originalText": english_text}
+
+async def sse_stream(events):
+    async for event, data in events:
+        yield sse_event(event, data)
+
+@app.post("/api/convert-latex-block/stream", dependencies=rate_limited)
+async def convert_latex_block_stream(request: ConvertLatexBlockRequest):
+    """Stream a LaTeX block conversion as Server-Sent Events.
+
+    Emits a "line" event ({"index", "latexCode"}) for each line as soon as it is known, lines
+    already cached first and then changed lines as their upstream calls finish. Ends with a
+    "done" event with the ConvertLatexBlockResponse fields, or an "error" event with the HTTP
+    status and detail.
+    """
+
+    if not request.englishText.strip():
+        raise HTTPException(status_code=400, detail="English text cannot be empty")
+
+    return StreamingResponse(sse_stream(latex_block_events(request.englishText)),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
 # @app.post("/api/convert-table", response_model=ConvertTableResponse)
 # async def convert_table(request: ConvertTableRequest):
 #     fallback = [
@@ -430,30 +1355,9 @@ async def convert_latex_block(request: ConvertLatexBlockRequest):
 #     uvicorn.run(app, host="0.0.0.0", port=8000) 
 
 
-@app.post("/api/convert-table", response_model=ConvertTableResponse)
-async def convert_table(request: ConvertTableRequest):
-    fallback = [
-        {"cells": [{"content": "", "isHeader": True}, {"content": "", "isHeader": True}, {"content": "", "isHeader": True}]},
-        {"cells": [{"content": "", "isHeader": False}, {"content": "", "isHeader": False}, {"content": "", "isHeader": False}]},
-        {"cells": [{"content": "", "isHeader": False}, {"content": "", "isHeader": False}, {"content": "", "isHeader": False}]}
-    ]
-    
-    """Convert natural language table descriptions to structured table data."""
-    if not request.prompt.strip():
-        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
-    
-    # Check if Gemini API key is configured
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
-        logger.warning("Gemini API key not configured, using fallback table structure")
-        return ConvertTableResponse(
-            tableData=fallback,
-            originalPrompt=request.prompt
-        )
-    
-    try:
-        # Improved prompt with better structure and examples
-        table_prompt = f"""
-You are a table generator. Create a table based on this description: "{request.prompt}"
+# Improved prompt with better structure and examples
+TABLE_CONVERSION_PROMPT = """
+You are a table generator. Create a table based on this description: "{prompt}"
 
 Analyze the user's request carefully:
 - If they specify content (like "multiplication table", "price list with items A, B, C"), populate those cells
@@ -484,158 +1388,135 @@ Rules:
 7. Use empty strings ("") when no specific content is requested
 8. Return ONLY the JSON, no other text
 """
-        
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                max_output_tokens=4000,  # Increased token limit
-                response_mime_type="application/json"  # Force JSON response
-            )
+
+def table_response_is_valid(response_text: str) -> bool:
+    """True only if the whole table parsed cleanly, without salvaged or padded rows."""
+    try:
+        return parse_table_response(response_text).complete
+    except ValueError:
+        return False
+
+def build_fallback_table(prompt: str) -> list:
+    """Build an empty table with dimensions inferred from the prompt (3x3 by default)."""
+    # Simple heuristic: look for common table indicators
+    prompt_lower = prompt.lower()
+    
+    # Determine rough dimensions
+    cols = 3  # default
+    rows = 3  # default
+    
+    if any(word in prompt_lower for word in ['column', 'col']):
+        # Try to extract number of columns
+        col_match = re.search(r'(\d+)[\s-]*col', prompt_lower)
+        if col_match:
+            cols = min(int(col_match.group(1)), 10)  # Cap at 10
+    
+    if any(word in prompt_lower for word in ['row', 'line']):
+        # Try to extract number of rows
+        row_match = re.search(r'(\d+)[\s-]*row', prompt_lower)
+        if row_match:
+            rows = min(int(row_match.group(1)), 10)  # Cap at 10
+    
+    # Create table with inferred dimensions
+    intelligent_fallback = []
+    for r in range(rows):
+        row_cells = []
+        for c in range(cols):
+            row_cells.append({
+                "content": "",
+                "isHeader": r == 0
+            })
+        intelligent_fallback.append({"cells": row_cells})
+    
+    return intelligent_fallback
+
+def table_cache_key(prompt: str) -> str:
+    return make_cache_key("convert-table", model_router.cache_scope("convert-table", prompt), TABLE_CONVERSION_PROMPT, prompt)
+
+async def lookup_table(prompt: str, cache_key: str):
+    """Return tableData from the local generator or the cache, or None if the model is needed."""
+    with stage_seconds.time("convert-table", "lookup"):
+        # Structural and arithmetic tables are generated exactly, without the model
+        local_table = local_table_generator.generate(prompt)
+        if local_table is not None:
+            conversion_lookups.inc("convert-table", "local")
+            return local_table
+
+        cached_table = await conversion_cache.fetch(cache_key)
+    conversion_lookups.inc("convert-table", "cache" if cached_table is not None else "upstream")
+    return cached_table
+
+@app.post("/api/convert-table", response_model=ConvertTableResponse, dependencies=rate_limited)
+async def convert_table(request: ConvertTableRequest):
+    fallback = [
+        {"cells": [{"content": "", "isHeader": True}, {"content": "", "isHeader": True}, {"content": "", "isHeader": True}]},
+        {"cells": [{"content": "", "isHeader": False}, {"content": "", "isHeader": False}, {"content": "", "isHeader": False}]},
+        {"cells": [{"content": "", "isHeader": False}, {"content": "", "isHeader": False}, {"content": "", "isHeader": False}]}
+    ]
+    
+    """Convert natural language table descriptions to structured table data."""
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+    
+    cache_key = table_cache_key(request.prompt)
+    cached_table = await lookup_table(request.prompt, cache_key)
+    if cached_table is not None:
+        return ConvertTableResponse(
+            tableData=cached_table,
+            originalPrompt=request.prompt
+        )
+    
+    # Check if Gemini API key is configured
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        logger.warning("Gemini API key not configured, using fallback table structure")
+        fallbacks.inc("convert-table", "no_api_key")
+        return ConvertTableResponse(
+            tableData=fallback,
+            originalPrompt=request.prompt
         )
+    
+    await genai.ready()
+    try:
+        table_prompt = TABLE_CONVERSION_PROMPT.format(prompt=request.prompt)
         
-        response = model.generate_content(table_prompt)
-        logger.info(f"Gemini API Response: {response.text}")
-        logger.info(f"Response length: {len(response.text)}")
-        logger.info(f"Response ends with: '{response.text[-50:]}'")  # Last 50 chars
+        # Start on the fast tier for simple prompts; escalate if its JSON does not validate
+        deadline = Deadline(ENDPOINT_DEADLINE_SECONDS["convert-table"])
+        with stage_seconds.time("convert-table", "upstream"):
+            response_text = await inflight_conversions.do(cache_key, lambda: model_router.generate(
+                "convert-table", request.prompt,
+                lambda model_name: generate_text(table_model(model_name), table_prompt, timeout=deadline),
+                validate=table_response_is_valid
+            ))
+        log_payload("convert-table", "Gemini API Response", response_text)
         
         try:
-            # More robust JSON cleaning
-            response_text = response.text.strip()
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            # Additional cleaning for common JSON issues
-            response_text = response_text.replace('\n', ' ')  # Remove newlines
-            response_text = response_text.replace('\t', ' ')  # Remove tabs
-            
-            # Check if response appears truncated
-            if not response_text.rstrip().endswith('}'):
-                logger.warning("Response appears truncated, attempting to fix...")
-                # Try to close incomplete JSON structure
-                open_braces = response_text.count('{')
-                close_braces = response_text.count('}')
-                open_brackets = response_text.count('[')
-                close_brackets = response_text.count(']')
-                
-                # Add missing closing characters
-                while close_brackets < open_brackets:
-                    response_text += ']'
-                    close_brackets += 1
-                while close_braces < open_braces:
-                    response_text += '}'
-                    close_braces += 1
-                
-                logger.info(f"Attempted to fix truncated JSON: {response_text[-100:]}")
-            
-            # Try to find JSON object boundaries if there's extra text
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
+            with stage_seconds.time("convert-table", "parse"):
+                table_data, complete = parse_table_response(response_text)
             
-            if json_start >= 0 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            import json
-            result = json.loads(response_text)
-            logger.info(f"JSON parsed successfully!")
-            table_data = result.get("tableData", [])
-            
-            # Enhanced validation
-            if not table_data or not isinstance(table_data, list):
-                raise ValueError("Invalid table data structure")
-            
-            if not table_data:
-                raise ValueError("Empty table data")
-            
-            # Validate each row structure
-            first_row_length = len(table_data[0].get("cells", []))
-            if first_row_length == 0:
-                raise ValueError("First row has no cells")
-                
-            for i, row in enumerate(table_data):
-                if not isinstance(row, dict) or "cells" not in row:
-                    raise ValueError(f"Row {i} is missing cells")
-                
-                cells = row["cells"]
-                if not isinstance(cells, list):
-                    raise ValueError(f"Row {i} cells is not a list")
-                    
-                if len(cells) != first_row_length:
-                    raise ValueError(f"Row {i} has inconsistent length: expected {first_row_length}, got {len(cells)}")
-                
-                # Validate each cell
-                for j, cell in enumerate(cells):
-                    if not isinstance(cell, dict):
-                        raise ValueError(f"Cell [{i}][{j}] is not a dictionary")
-                    if "content" not in cell or "isHeader" not in cell:
-                        raise ValueError(f"Cell [{i}][{j}] is missing required fields")
-                    if not isinstance(cell["content"], str):
-                        cell["content"] = str(cell["content"])  # Convert to string
-                    if not isinstance(cell["isHeader"], bool):
-                        raise ValueError(f"Cell [{i}][{j}] isHeader must be boolean")
-            
-            logger.info(f"Successfully converted table prompt: '{request.prompt}'")
+            logger.info("Successfully converted table prompt: '%s'", request.prompt)
+            # Salvaged or padded rows are returned but not cached, like an unfinished stream
+            if complete:
+                conversion_cache.set(cache_key, table_data)
             
             return ConvertTableResponse(
                 tableData=table_data,
                 originalPrompt=request.prompt
             )
             
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"Failed to parse table JSON: {e}")
-            logger.error(f"Cleaned response text: {response_text[:500]}")  # Log more context
-            logger.error(f"Full Gemini response: {response.text}")
+        except ValueError as e:
+            logger.error("Failed to parse table JSON: %s", e)
+            log_payload("convert-table", "Full Gemini response", response_text, always=True, level=logging.ERROR)
+            fallbacks.inc("convert-table", "parse_error")
             
             # Try to create a simple table based on prompt analysis
             try:
-                # Simple heuristic: look for common table indicators
-                prompt_lower = request.prompt.lower()
-                
-                # Determine rough dimensions
-                cols = 3  # default
-                rows = 3  # default
-                
-                if any(word in prompt_lower for word in ['column', 'col']):
-                    # Try to extract number of columns
-                    import re
-                    col_match = re.search(r'(\d+)[\s-]*col', prompt_lower)
-                    if col_match:
-                        cols = min(int(col_match.group(1)), 10)  # Cap at 10
-                
-                if any(word in prompt_lower for word in ['row', 'line']):
-                    # Try to extract number of rows
-                    row_match = re.search(r'(\d+)[\s-]*row', prompt_lower)
-                    if row_match:
-                        rows = min(int(row_match.group(1)), 10)  # Cap at 10
-                
-                # Create table with inferred dimensions
-                intelligent_fallback = []
-                for r in range(rows):
-                    row_cells = []
-                    for c in range(cols):
-                        row_cells.append({
-                            "content": "",
-                            "isHeader": r == 0
-                        })
-                    intelligent_fallback.append({"cells": row_cells})
-                
                 return ConvertTableResponse(
-                    tableData=intelligent_fallback,
+                    tableData=build_fallback_table(request.prompt),
                     originalPrompt=request.prompt
                 )
                 
             except Exception as fallback_error:
-                logger.error(f"Intelligent fallback failed: {fallback_error}")
+                logger.error("Intelligent fallback failed: %s", fallback_error)
                 return ConvertTableResponse(
                     tableData=fallback,
                     originalPrompt=request.prompt
@@ -649,13 +1530,382 @@ Rules:
         logger.error("Gemini stopped table generation")
         raise HTTPException(status_code=400, detail="Generation was stopped")
     
+    except UpstreamOverloaded as e:
+        logger.error("Upstream queue full, shedding table request")
+        raise upstream_http_error(e)
+    
     except Exception as e:
-        logger.error(f"Error converting table: {e}")
+        logger.error("Error converting table: %s", e)
+        fallbacks.inc("convert-table", upstream_fallback_reason(e))
         return ConvertTableResponse(
             tableData=fallback,
             originalPrompt=request.prompt
         )
 
+async def table_events(prompt: str):
+    """Yield ("row", {"index", "cells"}) as soon as each row is complete in the model output, then ("done", ...).
+
+    Ends with ("error", {"status", "detail"}) instead if upstream fails in a way the
+    REST endpoint would report as an HTTP error.
+    """
+    cache_key = table_cache_key(prompt)
+    cached_table = await lookup_table(prompt, cache_key)
+    if cached_table is not None:
+        yield "done", {"tableData": cached_table, "originalPrompt": prompt}
+        return
+
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        logger.warning("Gemini API key not configured, using fallback table structure")
+        fallbacks.inc("convert-table", "no_api_key")
+        yield "done", {"tableData": build_fallback_table(prompt), "originalPrompt": prompt}
+        return
+
+    await genai.ready()
+    deadline = Deadline(ENDPOINT_DEADLINE_SECONDS["convert-table"])
+    started = time.perf_counter()
+    parser = TableRowStreamParser()
+    completed = False
+    try:
+        model = table_model()
+
+        table_prompt = TABLE_CONVERSION_PROMPT.format(prompt=prompt)
+        async for text in stream_content(model, table_prompt, timeout=deadline):
+            for row in parser.feed(text):
+                if len(parser.rows) == 1:
+                    logger.info("First table row after %.0f ms", (time.perf_counter() - started) * 1000)
+                yield "row", {"index": len(parser.rows) - 1, **row.model_dump()}
+        completed = True
+
+    except Exception as e:
+        error = upstream_http_error(e)
+        if error is not None:
+            logger.error("Streaming table conversion failed: %s", error.detail)
+            yield "error", {"status": error.status_code, "detail": error.detail}
+            return
+        # Keep whatever rows were completed before the failure
+        logger.error("Error streaming table: %s", e)
+
+    if parser.rows:
+        table_data = [row.model_dump() for row in parser.rows]
+        if completed and parser.finished and not parser.skipped:
+            conversion_cache.set(cache_key, table_data)
+    else:
+        fallbacks.inc("convert-table", "upstream_error" if not completed else "parse_error")
+        table_data = build_fallback_table(prompt)
+
+    yield "done", {"tableData": table_data, "originalPrompt": prompt}
+
+@app.post("/api/convert-table/stream", dependencies=rate_limited)
+async def convert_table_stream(request: ConvertTableRequest):
+    """Stream a table conversion as Server-Sent Events.
+
+    Emits a "row" event as soon as each {"cells": [...]} row is complete in the model output,
+    then a "done" event with the ConvertTableResponse fields, or an "error" event.
+    """
+
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+
+    return StreamingResponse(sse_stream(table_events(request.prompt)),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+class CreateDocumentRequest(BaseModel):
+    title: str = "Untitled Document"
+    content: Optional[dict] = None  # TipTap JSON ({"type": "doc", "content": [...]})
+
+class RenameDocumentRequest(BaseModel):
+    title: str
+
+class DocumentStepsRequest(BaseModel):
+    version: int  # version the steps were made on top of
+    steps: List[dict]  # Step.toJSON() of each ProseMirror step
+    clientId: Optional[str] = None
+
+class DocumentSnapshotRequest(BaseModel):
+    version: int
+    content: dict
+
+DOCUMENT_PAGE_MAX_BLOCKS = 1000
+
+# Document store calls block on SQLite (large snapshots, busy waits for other workers), so
+# they run in worker threads; metrics are still recorded on the event loop
+
+@app.get("/api/documents")
+async def list_documents():
+    return {"documents": await asyncio.to_thread(document_store.list)}
+
+@app.post("/api/documents")
+async def create_document(request: CreateDocumentRequest):
+    return await asyncio.to_thread(document_store.create, request.title, request.content)
+
+@app.get("/api/documents/{doc_id}")
+async def load_document(doc_id: str, offset: int = 0, limit: int = 200):
+    """Load a document page by page: top-level blocks of its snapshot from offset, at most limit of them.
+
+    The last page ("complete": true) also has the steps made since the snapshot, which the
+    client applies on top of the blocks to reach "version".
+    """
+    if offset < 0 or not 0 < limit <= DOCUMENT_PAGE_MAX_BLOCKS:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {DOCUMENT_PAGE_MAX_BLOCKS}")
+    try:
+        return await asyncio.to_thread(document_store.load, doc_id, offset, limit)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+@app.get("/api/documents/{doc_id}/steps")
+async def document_steps(doc_id: str, since: int):
+    """Steps after version since, for a client whose save was rejected with 409 to rebase on."""
+    try:
+        return await asyncio.to_thread(document_store.steps_since, doc_id, since)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+    except StepsCompacted as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+@app.post("/api/documents/{doc_id}/steps")
+async def save_document_steps(doc_id: str, request: DocumentStepsRequest):
+    """Save edits as the ProseMirror steps made since the client's version.
+
+    Returns the new version, or 409 with the current version if another save came first.
+    "snapshotRequested" asks the client to PUT a snapshot so the step log can be compacted.
+    """
+    try:
+        with document_save_seconds.time("steps"):
+            result = await asyncio.to_thread(
+                document_store.append_steps, doc_id, request.version, request.steps, request.clientId
+            )
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Document has newer steps", "version": e.version})
+    document_save_bytes.observe(result["bytesWritten"], "steps")
+    return result
+
+@app.put("/api/documents/{doc_id}/snapshot")
+async def save_document_snapshot(doc_id: str, request: DocumentSnapshotRequest):
+    """Compact the step log: store the full document as it was at version."""
+    try:
+        with document_save_seconds.time("snapshot"):
+            result = await asyncio.to_thread(document_store.save_snapshot, doc_id, request.version, request.content)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Snapshot is ahead of the saved steps", "version": e.version})
+    document_save_bytes.observe(result["bytesWritten"], "snapshot")
+    return result
+
+@app.patch("/api/documents/{doc_id}")
+async def rename_document(doc_id: str, request: RenameDocumentRequest):
+    try:
+        return await asyncio.to_thread(document_store.rename, doc_id, request.title)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+@app.delete("/api/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    try:
+        await asyncio.to_thread(document_store.delete, doc_id)
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"deleted": doc_id}
+
+SEARCH_MAX_RESULTS = 100
+
+@app.get("/api/search")
+async def search_documents(q: str, limit: int = 20):
+    """Search the text, LaTeX and original English of every stored document.
+
+    Words match as typed (the last one as a prefix); LaTeX such as x^2 or \\frac{1}{2} matches
+    as a formula. Results are documents, best first, with the best matching block's index and
+    a snippet of it as [{"text", "match"}] segments.
+    """
+    if not 0 < limit <= SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_RESULTS}")
+    with document_search_seconds.time():
+        results = await asyncio.to_thread(document_store.search, q, limit)
+    return {"query": q, "results": results}
+
+class ExportRequest(BaseModel):
+    title: str = "Document"
+    content: dict  # editor.getJSON()
+
+def export_filename(title: str, extension: str) -> str:
+    # Same naming as the client-side export, limited to characters safe in a header
+    name = re.sub(r"[^a-z0-9]", "_", title.lower()) or "document"
+    return f'attachment; filename="{name}.{extension}"'
+
+@app.post("/api/export/latex")
+async def export_latex(request: ExportRequest):
+    """Stream the document as a .tex file while it is being rendered."""
+    return StreamingResponse(
+        latex_exporter.stream(request.content, request.title),
+        media_type="application/x-tex",
+        headers={"Content-Disposition": export_filename(request.title, "tex")}
+    )
+
+@app.post("/api/export/pdf")
+async def export_pdf(request: ExportRequest):
+    """Compile the document to PDF with the server's LaTeX engine."""
+    if pdf_builder.engine is None:
+        raise HTTPException(status_code=501, detail="No LaTeX engine is installed on the server")
+
+    with stage_seconds.time("export-pdf", "render"):
+        tex = await asyncio.to_thread(
+            lambda: "".join(latex_exporter.document(request.content, request.title, for_pdf=True))
+        )
+    try:
+        with stage_seconds.time("export-pdf", "build"):
+            pdf = await pdf_builder.build(tex)
+    except AdmissionRejected as e:
+        admission_rejections.inc("pdf_build_queue")
+        raise HTTPException(status_code=503, detail="PDF export is busy. Please try again later.",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="PDF build timed out")
+    except PdfBuildFailed as e:
+        logger.warning("PDF build failed: %s", e)
+        raise HTTPException(status_code=422, detail={"message": str(e), "log": e.log})
+
+    return Response(pdf, media_type="application/pdf", headers={"Content-Disposition": export_filename(request.title, "pdf")})
+
+# Image files never change once stored, so browsers and proxies may keep them for good
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def image_url(image_id: str, variant: str = ORIGINAL) -> str:
+    return f"/api/images/{image_id}" if variant == ORIGINAL else f"/api/images/{image_id}/{variant}"
+
+@app.post("/api/images", dependencies=rate_limited)
+async def upload_image(file: UploadFile = File(...)):
+    """Store an uploaded image and return its URL, size and resized variants.
+
+    The same bytes always get the same id, so an image uploaded twice is stored once.
+    Documents keep only the returned URLs instead of the image data.
+    """
+    data = await file.read(image_store.max_bytes + 1)
+    try:
+        with stage_seconds.time("upload-image", "store"):
+            metadata, deduplicated = await image_store.store(data)
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except AdmissionRejected as e:
+        admission_rejections.inc("image_queue")
+        raise HTTPException(status_code=503, detail="Image processing is busy. Please try again later.",
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+    image_id = metadata["id"]
+    return {
+        "id": image_id,
+        "url": image_url(image_id),
+        "contentType": metadata["contentType"],
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "bytes": metadata["bytes"],
+        "deduplicated": deduplicated,
+        "variants": {name: {**variant, "url": image_url(image_id, name)} for name, variant in metadata["variants"].items()},
+    }
+
+@app.get("/api/images/{image_id}")
+@app.get("/api/images/{image_id}/{variant}")
+async def get_image(image_id: str, request: Request, variant: str = ORIGINAL):
+    """Serve a stored image or one of its variants ("w640", "thumb"), with Range support."""
+    found = image_store.file(image_id, variant)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path, media_type = found
+
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": f'"{image_id}-{variant}"'}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+# Conversions a /ws connection may run at once; more are refused with a 429 error event
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "32"))
+
+ws_connections = metrics.gauge("ws_connections", "Open /ws conversion connections")
+ws_conversions = metrics.counter(
+    "ws_conversions_total", "Conversions run over /ws by type and outcome", ("type", "outcome")
+)
+
+async def ws_convert_latex(request: ConvertLatexRequest, client: str):
+    response = await convert_latex(request, client)
+    yield "done", response.model_dump()
+
+async def ws_convert_latex_draft(request: ConvertLatexDraftRequest, client: str):
+    yield "done", (await convert_latex_draft(request, client)).model_dump()
+
+async def ws_convert_latex_block(request: ConvertLatexBlockRequest, client: str):
+    if not request.englishText.strip():
+        raise HTTPException(status_code=400, detail="English text cannot be empty")
+    async for event in latex_block_events(request.englishText):
+        yield event
+
+async def ws_convert_table(request: ConvertTableRequest, client: str):
+    # The REST path, not the SSE one: local generator, routed tier, single-flight and validated parsing
+    response = await convert_table(request)
+    yield "done", response.model_dump()
+
+# Same conversion core as the REST endpoints, and for blocks the SSE events; handlers take (request, client)
+WS_CONVERSIONS = {
+    "convert-latex": (ConvertLatexRequest, ws_convert_latex),
+    "convert-latex-draft": (ConvertLatexDraftRequest, ws_convert_latex_draft),
+    "convert-latex-block": (ConvertLatexBlockRequest, ws_convert_latex_block),
+    "convert-table": (ConvertTableRequest, ws_convert_table),
+}
+
+@app.websocket("/ws")
+async def conversion_socket(websocket: WebSocket):
+    """Run conversions over one long-lived connection instead of one HTTP request each.
+
+    Send {"id", "type", ...request fields} with type "convert-latex", "convert-latex-draft",
+    "convert-latex-block" or "convert-table", optionally with a "key" so a newer request for the same node cancels the
+    older one, or {"id", "type": "cancel"}. Events arrive as {"id", "event", "data"}: "line"
+    partials for blocks as on the streaming endpoint, then "done" (the REST response body),
+    "error" ({"status", "detail"}) or "cancelled". Each conversion counts against the client rate limit, drafts against the draft limit.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in CORS_ORIGINS:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    client = client_identity(websocket)
+    buckets = client_buckets(websocket)
+
+    def admit(kind):
+        if kind == "convert-latex-draft":
+            return client_rate_limit_error(draft_rate_limiter, buckets, "draft_rate_limit")
+        return client_rate_limit_error(client_rate_limiter, buckets, "client_rate_limit")
+
+    conversions = {
+        kind: (request_model, functools.partial(handler, client=client))
+        for kind, (request_model, handler) in WS_CONVERSIONS.items()
+    }
+    channel = ConversionChannel(websocket, conversions, admit, max_in_flight=WS_MAX_IN_FLIGHT,
+                                on_finish=ws_conversions.inc)
+    ws_connections.inc()
+    try:
+        while not channel.closed:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            try:
+                message = json.loads(frame.get("text") or frame.get("bytes") or "")
+                if not isinstance(message, dict):
+                    raise ValueError("not an object")
+            except ValueError:
+                await channel.send(None, "error", {"status": 400, "detail": "Messages must be JSON objects"})
+                continue
+            await channel.handle(message)
+    finally:
+        ws_connections.dec()
+        await channel.close()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Without its own logging config, uvicorn's records go through the handler configured above
+    log_config = None if os.getenv("LOG_FORMAT", "text") == "json" else uvicorn.config.LOGGING_CONFIG
+    if WORKERS > 1:
+        # Each worker imports this module itself; the SDK import is deferred, so they start quickly
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS, log_config=log_config)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_config=log_config)
\ No newline at end of file
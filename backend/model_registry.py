@@ -0,0 +1,56 @@
+import logging
+import time
+
+from gemini_sdk import genai
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Build each GenerativeModel once per (model name, generation config, system prompt) and reuse it.
+
+    The SDK's async gRPC client is process-wide and created lazily by the first call,
+    so reusing models also keeps one long-lived, multiplexed upstream connection.
+    """
+
+    def __init__(self):
+        self.lookups = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+        self._models = {}
+
+    def get(self, model_name: str, system_instruction: str = None, **generation_config):
+        key = (model_name, tuple(sorted(generation_config.items())), system_instruction)
+        self.lookups += 1
+
+        model = self._models.get(key)
+        if model is None:
+            started = time.perf_counter()
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=genai.types.GenerationConfig(**generation_config),
+                system_instruction=system_instruction
+            )
+            self.build_seconds += time.perf_counter() - started
+            self.builds += 1
+            self._models[key] = model
+
+        return model
+
+    async def warm_up(self, models: list, timeout: float = 10.0):
+        """Open the upstream connection before the first user request by making one cheap call."""
+        if not models:
+            return
+        started = time.perf_counter()
+        try:
+            # count_tokens does not generate anything, but sets up the client, TLS and channel
+            await models[0].count_tokens_async("warm up", request_options={"timeout": timeout})
+            logger.info("Gemini connection warmed up in %.0f ms", (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            logger.warning("Gemini warm-up failed, the first request will connect instead: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "modelLookups": self.lookups,
+            "modelsBuilt": self.builds,
+            "modelBuildMsAvg": self.build_seconds * 1000 / self.builds if self.builds else 0.0,
+        }
@@ -0,0 +1,122 @@
+import logging
+import re
+import time
+
+from admission import AdmissionRejected
+from gemini_sdk import genai
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+# Words that suggest the input needs the stronger model even when it is short
+COMPLEXITY_WORDS = re.compile(
+    r"\b(matrix|matrices|proof|prove|theorem|lemma|cases|piecewise|system of|series|"
+    r"taylor|fourier|laplace|eigen\w*|determinant|integral|derivative|limit|sum|product)\b",
+    re.IGNORECASE
+)
+
+class TierStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, ok):
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if not ok:
+            self.failures += 1
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "avgLatencyMs": self.total_seconds * 1000 / self.calls if self.calls else 0.0,
+            "maxLatencyMs": self.max_seconds * 1000,
+        }
+
+class ModelRouter:
+    """Send simple inputs to a cheap model first and escalate to the strong model when its output fails validation.
+
+    Thresholds are per endpoint: the maximum input length and complexity score that
+    still goes to the fast tier. Safety blocks and calls refused by admission control
+    are never escalated.
+    """
+
+    def __init__(self, fast_model: str, strong_model: str, max_chars: dict, max_complexity: int = 1):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.max_chars = max_chars
+        self.max_complexity = max_complexity
+        self.escalations = 0
+        self.routed = {FAST_TIER: 0, STRONG_TIER: 0}
+        self.tiers = {FAST_TIER: TierStats(), STRONG_TIER: TierStats()}
+
+    def complexity(self, text: str) -> int:
+        lines = [line for line in text.split("\n") if line.strip()]
+        return len(COMPLEXITY_WORDS.findall(text)) + max(len(lines) - 1, 0)
+
+    def choose_tier(self, endpoint: str, text: str) -> str:
+        if not self.fast_model or self.fast_model == self.strong_model:
+            return STRONG_TIER
+        if len(text) > self.max_chars.get(endpoint, 0):
+            return STRONG_TIER
+        if self.complexity(text) > self.max_complexity:
+            return STRONG_TIER
+        return FAST_TIER
+
+    def cache_scope(self, endpoint: str, text: str) -> str:
+        """Name the models that can answer text on endpoint, for cache keys.
+
+        Input routed to the fast tier may be answered by either model (it escalates), so
+        its entries depend on both; changing the fast model leaves strong-tier entries valid.
+        """
+        if self.choose_tier(endpoint, text) == FAST_TIER:
+            return f"{self.fast_model}>{self.strong_model}"
+        return self.strong_model
+
+    async def generate(self, endpoint: str, text: str, call, validate) -> str:
+        """Run call(model_name) on the chosen tier and return its text, escalating once if needed."""
+        tier = self.choose_tier(endpoint, text)
+        self.routed[tier] += 1
+
+        if tier == FAST_TIER:
+            started = time.perf_counter()
+            try:
+                result = await call(self.fast_model)
+                ok = validate(result)
+            except (genai.types.BlockedPromptException, genai.types.StopCandidateException, AdmissionRejected):
+                # Safety blocks and refused admission would fail the same way on the strong tier
+                raise
+            except Exception as e:
+                logger.warning("Fast model failed for %s, escalating: %s", endpoint, e)
+                ok = False
+            self.tiers[FAST_TIER].record(time.perf_counter() - started, ok)
+            if ok:
+                return result
+            self.escalations += 1
+            logger.info("Escalating %s request to %s", endpoint, self.strong_model)
+
+        started = time.perf_counter()
+        try:
+            result = await call(self.strong_model)
+        except Exception:
+            self.tiers[STRONG_TIER].record(time.perf_counter() - started, False)
+            raise
+        self.tiers[STRONG_TIER].record(time.perf_counter() - started, True)
+        return result
+
+    def stats(self) -> dict:
+        fast_routed = self.routed[FAST_TIER]
+        return {
+            "fastModel": self.fast_model,
+            "strongModel": self.strong_model,
+            "routed": dict(self.routed),
+            "escalations": self.escalations,
+            "escalationRate": self.escalations / fast_routed if fast_routed else 0.0,
+            "tiers": {name: stats.to_dict() for name, stats in self.tiers.items()},
+        }
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+class CircuitOpen(AdmissionRejected):
+    """Upstream is failing; the call was not sent so the caller can serve its fallback immediately."""
+
+class CircuitBreaker:
+    """Stop calling upstream after repeated failures and probe it again after a cool-down.
+
+    Closed: calls go through; failure_threshold consecutive failures open the circuit.
+    Open: calls are refused with CircuitOpen until reset_seconds have passed.
+    Half-open: a single probe call is let through; success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may be sent now."""
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen("Upstream circuit is open", remaining)
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Upstream circuit half-open, sending a probe")
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpen("Upstream circuit is half-open, probe in flight", 1.0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info("Upstream circuit closed")
+        self.state = CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opens += 1
+                logger.warning("Upstream circuit opened after %s consecutive failures", self.consecutive_failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def record_ignored(self):
+        """The call ended without telling us anything about upstream health (cancelled, blocked, ...)."""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "stateCode": {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[self.state],
+            "consecutiveFailures": self.consecutive_failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+class Deadline:
+    """Time budget shared by every upstream attempt made for one request."""
+
+    __slots__ = ("expires",)
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("Deadline exceeded")
+        return remaining
+
+class Hedger:
+    """Send a second identical call if the first has not answered within delay seconds; the first success wins.
+
+    Trims the latency tail caused by a slow upstream replica at the cost of extra calls,
+    so it is meant for short, latency-critical requests. A delay of 0 disables hedging.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def run(self, call):
+        if self.delay <= 0:
+            return await call()
+
+        self.calls += 1
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay)
+            if done:
+                return tasks[0].result()
+
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(call()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both attempts failed: report the original one
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedgeDelaySeconds": self.delay,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedgeWins": self.hedge_wins,
+        }
@@ -0,0 +1,152 @@
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from fuzzy_cache import canonical_tokens
+from latex_validator import COMMAND_ALIASES
+
+# Node attributes indexed as text: the English a LaTeX or code node was converted from, a table's prompt
+TEXT_ATTRS = ("originalText", "originalPrompt", "code")
+
+# Snippet highlight markers, split into segments before results leave the store
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+# Operators kept as words, so they survive the FTS tokenizer and "x plus 1" finds x + 1
+_OPERATOR_TERMS = {
+    "^": "sup", "_": "sub", "=": "equals", "+": "plus", "-": "minus",
+    "<": "lt", ">": "gt", "/": "over", "!": "factorial",
+}
+# Commands that only size, space or style what follows
+_LAYOUT_COMMANDS = {
+    "left", "right", "big", "Big", "bigg", "Bigg", "bigl", "bigr", "Bigl", "Bigr", "biggl", "biggr",
+    "displaystyle", "textstyle", "scriptstyle", "quad", "qquad", "limits", "nolimits", "end",
+}
+
+_math_token_re = re.compile(r"""
+    \\(?:text|textrm|textit|textbf|mathrm|operatorname)\s*\{([^{}]*)\}   # words
+  | \\begin\s*\{([A-Za-z]+)\*?\}                                        # environment
+  | \\([A-Za-z]+)                                                       # command
+  | \\.                                                                 # escaped symbol or spacing
+  | ([A-Za-z]+)                                                         # variables
+  | (\d+(?:\.\d+)?)
+  | ([\^_=+\-<>/!])
+""", re.VERBOSE)
+_word_re = re.compile(r"\w+")
+# A query with any of these is read as LaTeX
+_latex_query_re = re.compile(r"[\\^_{}=]")
+
+MAX_QUERY_TERMS = 16
+
+def math_terms(latex: str) -> List[str]:
+    """Search terms of LaTeX source, e.g. \\frac{a}{x^2} -> frac a x sup 2.
+
+    Variables are single letters (ax is a times x), \\text and \\operatorname keep their words,
+    and aliases are folded (\\le is indexed as leq).
+    """
+    terms = []
+    for match in _math_token_re.finditer(latex):
+        words, environment, command, variables, number, operator = match.groups()
+        if words is not None:
+            terms.extend(word.lower() for word in _word_re.findall(words))
+        elif environment:
+            terms.append(environment)
+        elif command:
+            if command not in _LAYOUT_COMMANDS:
+                terms.append(COMMAND_ALIASES.get(command, command))
+        elif variables:
+            terms.extend(variables)
+        elif number:
+            terms.append(number)
+        elif operator:
+            terms.append(_OPERATOR_TERMS[operator])
+    return terms
+
+class IndexedText(NamedTuple):
+    text: str  # document text and the English behind converted nodes
+    math: str  # math_terms of the LaTeX
+    latex: str  # the LaTeX itself, one node per line, shown when only the math matched
+
+def _collect(node, text: list, latex: list):
+    if not isinstance(node, dict):
+        return
+    if isinstance(node.get("text"), str):
+        text.append(node["text"])
+    attrs = node.get("attrs")
+    if isinstance(attrs, dict):
+        for name in TEXT_ATTRS:
+            if isinstance(attrs.get(name), str):
+                text.append(f" {attrs[name]} ")
+        if isinstance(attrs.get("latexCode"), str) and attrs["latexCode"].strip():
+            latex.append(attrs["latexCode"].strip())
+        table_data = attrs.get("tableData")
+        for row in table_data if isinstance(table_data, list) else []:
+            for cell in (row.get("cells") or []) if isinstance(row, dict) else []:
+                if isinstance(cell, dict) and isinstance(cell.get("content"), str):
+                    text.append(f" {cell['content']} ")
+    content = node.get("content")
+    for child in content if isinstance(content, list) else []:
+        _collect(child, text, latex)
+        # Text nodes of a paragraph run together; block boundaries separate words
+        if isinstance(child, dict) and child.get("type") != "text":
+            text.append(" ")
+
+def indexed_text(node: dict) -> IndexedText:
+    """What search indexes of a TipTap node and everything inside it."""
+    text, latex = [], []
+    _collect(node, text, latex)
+    return IndexedText(
+        " ".join("".join(text).split()),
+        " ".join(" ".join(math_terms(source)) for source in latex),
+        "\n".join(latex),
+    )
+
+def steps_text(steps: list) -> IndexedText:
+    """What search indexes of the content ProseMirror steps insert or set.
+
+    Text the steps delete is not subtracted: it stays findable until the next snapshot.
+    """
+    nodes = []
+    for step in steps:
+        content = (step.get("slice") or {}).get("content")
+        if isinstance(content, list):
+            nodes.extend(content)
+        if step.get("stepType") == "attr" and isinstance(step.get("value"), str):
+            nodes.append({"attrs": {step.get("attr"): step["value"]}})
+    return indexed_text({"content": nodes})
+
+class SearchQuery(NamedTuple):
+    expression: str  # FTS5 MATCH expression
+    math: Tuple[str, ...]  # math terms the expression looks for as a phrase, if any
+
+def _phrase(terms) -> str:
+    return '"' + " ".join(terms) + '"'
+
+def search_query(query: str) -> Optional[SearchQuery]:
+    """The FTS5 query for what a user typed, or None if it has no searchable terms.
+
+    LaTeX (anything with \\, ^, _, braces or =) is looked up as a phrase of math terms. Words
+    must all occur, the last one as a prefix so results follow typing; if they read as math
+    ("x squared", "integral of sin x") that phrase is looked up in the LaTeX too.
+    """
+    if _latex_query_re.search(query):
+        terms = tuple(math_terms(query)[:MAX_QUERY_TERMS])
+        return SearchQuery(f"math : {_phrase(terms)}", terms) if terms else None
+
+    words = _word_re.findall(query.lower())[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    expression = " ".join(_phrase([word]) for word in words) + "*"
+    spoken = canonical_tokens(query)
+    if any(token[0] == "\\" or token in _OPERATOR_TERMS for token in spoken):
+        terms = tuple(math_terms(" ".join(spoken))[:MAX_QUERY_TERMS])
+        return SearchQuery(f"({expression}) OR math : {_phrase(terms)}", terms)
+    return SearchQuery(expression, ())
+
+def highlight_segments(snippet: str) -> List[dict]:
+    """Split an FTS5 snippet into [{"text", "match"}] segments the client renders without HTML."""
+    segments = []
+    for part in re.split(f"({MATCH_START}[^{MATCH_END}]*{MATCH_END})", snippet):
+        if part.startswith(MATCH_START):
+            segments.append({"text": part[1:-1], "match": True})
+        elif part:
+            segments.append({"text": part, "match": False})
+    return segments
@@ -0,0 +1,57 @@
+import asyncio
+
+class SingleFlight:
+    """Share one in-flight call between concurrent requests with the same key."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self._inflight = {}
+        self._watchers = {}  # shared future -> callers awaiting it
+
+    async def do(self, key: str, fn, cancel_when_abandoned: bool = False):
+        """Await fn() once per key; concurrent callers get the same result or exception.
+
+        A caller that is cancelled normally leaves the call running so its result still
+        reaches the other callers and the cache. With cancel_when_abandoned, the call is
+        cancelled too if that caller was the last one waiting for it (speculative work).
+        """
+        future = self._inflight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        self._watchers[future] = self._watchers.get(future, 0) + 1
+        try:
+            # Shield so one client disconnecting does not cancel the call for everyone else
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if cancel_when_abandoned and self._watchers[future] == 1 and not future.done():
+                future.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            self._watchers[future] -= 1
+            if not self._watchers[future]:
+                del self._watchers[future]
+
+    def _finish(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter has gone away
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "upstreamCalls": self.calls,
+            "coalescedRequests": self.coalesced,
+            "abandonedCalls": self.abandoned,
+            "inFlight": len(self._inflight),
+        }
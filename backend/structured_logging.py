@@ -0,0 +1,149 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+# Attributes every LogRecord has; anything else on a record came from extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extra= fields and any exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to a QueueListener thread, dropping them when the queue is full.
+
+    Unlike QueueHandler, the message is not formatted here: %-style arguments are
+    rendered by the listener thread, off the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class Truncated:
+    """A log argument that renders as at most max_chars of text, noting how much was cut."""
+
+    __slots__ = ("text", "max_chars")
+
+    def __init__(self, text: str, max_chars: int):
+        self.text = text
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        if len(self.text) <= self.max_chars:
+            return self.text
+        return f"{self.text[:self.max_chars]}... [{len(self.text) - self.max_chars} more chars]"
+
+class PayloadLogger:
+    """Log request and response bodies for a sample of conversions, cut to max_chars.
+
+    Bodies such as full model responses are the bulk of what the backend logs. Each
+    endpoint logs them for a fraction of its requests (sample_rates, else default_rate);
+    always=True logs regardless of sampling, for failures worth investigating.
+    """
+
+    def __init__(self, logger: logging.Logger, default_rate: float = 1.0, sample_rates: dict = None,
+                 max_chars: int = 2000, level: int = logging.INFO):
+        self.logger = logger
+        self.default_rate = default_rate
+        self.sample_rates = sample_rates or {}
+        self.max_chars = max_chars
+        self.level = level
+        self.logged = 0
+        self.sampled_out = 0
+
+    def __call__(self, endpoint: str, message: str, payload: str, always: bool = False, level: int = None):
+        level = self.level if level is None else level
+        if not self.logger.isEnabledFor(level):
+            return
+        if not always and random.random() >= self.sample_rates.get(endpoint, self.default_rate):
+            self.sampled_out += 1
+            return
+        self.logged += 1
+        self.logger.log(level, "%s: %s", message, Truncated(payload, self.max_chars),
+                        extra={"endpoint": endpoint, "payloadChars": len(payload)})
+
+    def stats(self) -> dict:
+        return {"payloadsLogged": self.logged, "payloadsSampledOut": self.sampled_out}
+
+def parse_sample_rates(spec: str) -> dict:
+    """Parse "convert-table=0.01,convert-latex=0.1" into {endpoint: rate}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        endpoint, _, rate = item.partition("=")
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+_listener = None
+_handler = None
+
+def configure_logging(level: str = "INFO", log_format: str = "text", use_queue: bool = True,
+                      queue_size: int = 10000, stream=None) -> DroppingQueueHandler:
+    """Set up the root logger: text or JSON lines, written by a background thread unless use_queue is False.
+
+    Safe to call again (e.g. when the app module is reloaded): the previous handler and
+    listener are replaced. Returns the queue handler, or None without a queue.
+    """
+    global _listener, _handler
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _handler = None
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    if use_queue:
+        _handler = DroppingQueueHandler(queue.Queue(queue_size))
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+    else:
+        _handler = output
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+    return _handler if use_queue else None
+
+def flush_logging(timeout: float = 5.0):
+    """Wait until the listener has written everything queued so far."""
+    if isinstance(_handler, DroppingQueueHandler):
+        deadline = time.monotonic() + timeout
+        while _handler.queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
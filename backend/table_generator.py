@@ -0,0 +1,217 @@
+import itertools
+import re
+from typing import Optional
+
+MAX_DIMENSION = 20
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_NUM = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+# Truth table operators: (names in the prompt, column header for variables a and b, function)
+TRUTH_OPERATORS = [
+    (("xor", "exclusive or"), "{a} ⊕ {b}", lambda p, q: p != q),
+    (("nand",), "¬({a} ∧ {b})", lambda p, q: not (p and q)),
+    (("nor",), "¬({a} ∨ {b})", lambda p, q: not (p or q)),
+    (("implies", "->"), "{a} → {b}", lambda p, q: (not p) or q),
+    (("iff", "if and only if"), "{a} ↔ {b}", lambda p, q: p == q),
+    (("and",), "{a} ∧ {b}", lambda p, q: p and q),
+    (("or",), "{a} ∨ {b}", lambda p, q: p or q),
+]
+_TRUTH_OPERATOR_NAMES = {name: (header, operation) for names, header, operation in TRUTH_OPERATORS for name in names}
+# Exactly "<variable> <operator> <variable>"; negation, grouping and chained operators need the model
+_TRUTH_EXPRESSION = re.compile(
+    r"([a-z]) (" + "|".join(re.escape(name) for name in sorted(_TRUTH_OPERATOR_NAMES, key=len, reverse=True)) + r") ([a-z])",
+    re.IGNORECASE
+)
+_TRUTH_VARIABLES = re.compile(r"[a-z](?:, [a-z])+(?:,? and [a-z])?", re.IGNORECASE)
+
+def _number(token: str) -> int:
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+def _cell(content, is_header: bool) -> dict:
+    return {"content": str(content), "isHeader": is_header}
+
+def empty_table(rows: int, cols: int, headers: list = None) -> list:
+    """Empty table; when header names are given the first row holds them, as in the frontend's createTableWithHeaders."""
+    headers = headers or []
+    table_data = []
+    for r in range(rows):
+        is_header = r == 0 and bool(headers)
+        cells = []
+        for c in range(cols):
+            content = headers[c] if is_header and c < len(headers) else ""
+            cells.append(_cell(content, is_header))
+        table_data.append({"cells": cells})
+    return table_data
+
+def operation_table(symbol: str, rows: tuple, cols: tuple, operation) -> list:
+    """Grid like a multiplication table: header row and column of operands, results inside.
+
+    rows and cols are inclusive (start, end) ranges of the left and top operands.
+    """
+    row_operands, col_operands = range(rows[0], rows[1] + 1), range(cols[0], cols[1] + 1)
+    table_data = [{"cells": [_cell(symbol, True)] + [_cell(n, True) for n in col_operands]}]
+    for a in row_operands:
+        table_data.append({"cells": [_cell(a, True)] + [_cell(operation(a, b), False) for b in col_operands]})
+    return table_data
+
+def sequence_table(header: str, value_header: str, start: int, end: int, function) -> list:
+    """Two-column table of n and f(n)."""
+    table_data = [{"cells": [_cell(header, True), _cell(value_header, True)]}]
+    for n in range(start, end + 1):
+        table_data.append({"cells": [_cell(n, False), _cell(function(n), False)]})
+    return table_data
+
+def truth_table(variables: list, header: str = None, operation=None) -> list:
+    table_data = [{"cells": [_cell(v, True) for v in variables] + ([_cell(header, True)] if header else [])}]
+    for values in itertools.product([True, False], repeat=len(variables)):
+        cells = [_cell("T" if value else "F", False) for value in values]
+        if operation is not None:
+            cells.append(_cell("T" if operation(*values) else "F", False))
+        table_data.append({"cells": cells})
+    return table_data
+
+class LocalTableGenerator:
+    """Build structural and arithmetic tables directly, leaving content-bearing prompts to the model."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        # Ordered (compiled pattern, handler) pairs; the first match wins
+        self._rules = [(re.compile(pattern, re.IGNORECASE), handler) for pattern, handler in [
+            (rf"^(?:an? )?(?:(?:{_NUM}\s*(?:x|by|×)\s*{_NUM}) )?(?:multiplication|times) table(?: (?:from|for))?(?: {_NUM}\s*(?:to|-|through)\s*{_NUM})?$", self._multiplication),
+            (rf"^(?:an? )?(?:multiplication|times) table {_NUM}\s*(?:x|by|×)\s*{_NUM}$", self._multiplication_sized),
+            (rf"^(?:an? )?(?:multiplication|times) table (?:for|of) (?:the )?(?:number )?{_NUM}$", self._times_table_for),
+            (rf"^(?:an? )?(?:{_NUM}\s*(?:x|by|×)\s*{_NUM} )?addition table(?: (?:from|for))?(?: {_NUM}\s*(?:to|-|through)\s*{_NUM})?$", self._addition),
+            (rf"^(?:a )?(?:table of )?powers of {_NUM}(?: (?:from {_NUM} )?(?:up )?to {_NUM})?(?: table)?$", self._powers),
+            (rf"^(?:a )?(?:table of )?(squares|cubes)(?: (?:of numbers )?(?:from )?{_NUM}\s*(?:to|-|through)\s*{_NUM})?(?: table)?$", self._squares),
+            (r"^(?:a )?truth table(?: for| of)?(?: (.+))?$", self._truth),
+            (rf"^(?:an? )?(?:empty |blank |simple )?(?:table )?{_NUM}\s*(?:x|by|×)\s*{_NUM}(?: (?:empty |blank )?table)?(?: with headers? (.+))?$", self._dimensions),
+            (rf"^(?:an? )?(?:empty |blank )?table with {_NUM} rows?(?:,? and|,)? {_NUM} columns?(?: with headers? (.+))?$", self._rows_cols),
+            (rf"^(?:an? )?(?:empty |blank )?table with {_NUM} columns?(?:,? and|,)? {_NUM} rows?(?: with headers? (.+))?$", self._cols_rows),
+            (rf"^(?:an? )?(?:empty |blank )?(?:table with {_NUM} columns?|{_NUM}[ -]columns? table)(?: with headers? (.+))?$", self._columns_only),
+            (r"^(?:an? )?(?:empty |blank |simple )?table$", lambda match: empty_table(3, 3)),
+        ]]
+
+    def generate(self, prompt: str) -> Optional[list]:
+        """Return tableData for prompts that need no model, otherwise None."""
+        self.attempts += 1
+        text = " ".join(prompt.strip().rstrip(".").split())
+        for pattern, handler in self._rules:
+            match = pattern.match(text)
+            if match:
+                table_data = handler(match)
+                if table_data is not None:
+                    self.hits += 1
+                    return table_data
+        return None
+
+    def _range(self, start, end, default_end=10):
+        start = _number(start) if start else 1
+        end = _number(end) if end else default_end
+        if end < start or end - start + 1 > MAX_DIMENSION:
+            return None
+        return start, end
+
+    def _grid_bounds(self, match):
+        """(row range, column range) of an operation table: "3x5" is 1-3 by 1-5, "from 2 to 6" both 2-6."""
+        rows, cols, start, end = match.groups()
+        if start and end:
+            bounds = self._range(start, end)
+            return (bounds, bounds) if bounds else None
+        if rows and cols:
+            return self._sized_bounds(rows, cols)
+        bounds = self._range(None, None)
+        return bounds, bounds
+
+    def _sized_bounds(self, rows, cols):
+        row_bounds, col_bounds = self._range(None, rows), self._range(None, cols)
+        return (row_bounds, col_bounds) if row_bounds and col_bounds else None
+
+    def _multiplication(self, match):
+        bounds = self._grid_bounds(match)
+        return operation_table("×", *bounds, lambda a, b: a * b) if bounds else None
+
+    def _multiplication_sized(self, match):
+        bounds = self._sized_bounds(*match.groups())
+        return operation_table("×", *bounds, lambda a, b: a * b) if bounds else None
+
+    def _addition(self, match):
+        bounds = self._grid_bounds(match)
+        return operation_table("+", *bounds, lambda a, b: a + b) if bounds else None
+
+    def _times_table_for(self, match):
+        n = _number(match.group(1))
+        return sequence_table("n", f"{n} × n", 1, 10, lambda k: n * k)
+
+    def _powers(self, match):
+        base, start, end = match.groups()
+        base = _number(base)
+        bounds = self._range(start or "0", end, default_end=10)
+        if not bounds:
+            return None
+        return sequence_table("n", f"{base}^n", *bounds, lambda n: base ** n)
+
+    def _squares(self, match):
+        kind, start, end = match.groups()
+        exponent = 2 if kind.lower() == "squares" else 3
+        bounds = self._range(start, end)
+        if not bounds:
+            return None
+        return sequence_table("n", f"n^{exponent}", *bounds, lambda n: n ** exponent)
+
+    def _truth(self, match):
+        description = match.group(1) or ""
+        if not description or re.fullmatch(r"(?:two|2) variables", description, re.IGNORECASE):
+            return truth_table(["p", "q"])
+        if re.fullmatch(r"(?:three|3) variables", description, re.IGNORECASE):
+            return truth_table(["p", "q", "r"])
+
+        # Only the variables were given ("p, q and r"): list every combination
+        if _TRUTH_VARIABLES.fullmatch(description):
+            variables = re.findall(r"\b[a-z]\b", description.replace(" and ", " "), re.IGNORECASE)
+            if len(set(variables)) != len(variables):
+                return None
+            return truth_table(variables)
+
+        expression = _TRUTH_EXPRESSION.fullmatch(description)
+        if expression is None:
+            return None
+        a, operator, b = expression.groups()
+        if a == b:
+            return None
+        header, operation = _TRUTH_OPERATOR_NAMES[operator.lower()]
+        return truth_table([a, b], header.format(a=a, b=b), operation)
+
+    def _sized(self, rows, cols, headers):
+        rows, cols = _number(rows), _number(cols)
+        if not (0 < rows <= MAX_DIMENSION and 0 < cols <= MAX_DIMENSION):
+            return None
+        header_names = [h.strip() for h in headers.split(",")] if headers else None
+        return empty_table(rows, cols, header_names)
+
+    def _dimensions(self, match):
+        rows, cols, headers = match.groups()
+        return self._sized(rows, cols, headers)
+
+    def _rows_cols(self, match):
+        rows, cols, headers = match.groups()
+        return self._sized(rows, cols, headers)
+
+    def _cols_rows(self, match):
+        cols, rows, headers = match.groups()
+        return self._sized(rows, cols, headers)
+
+    def _columns_only(self, match):
+        cols_a, cols_b, headers = match.groups()
+        return self._sized("3", cols_a or cols_b, headers)
+
+    def stats(self) -> dict:
+        return {
+            "tableAttempts": self.attempts,
+            "tableLocalHits": self.hits,
+            "tableLocalHitRate": self.hits / self.attempts if self.attempts else 0.0,
+        }
@@ -0,0 +1,162 @@
+import logging
+from typing import List, NamedTuple
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+class TableCell(BaseModel):
+    content: str = ""
+    isHeader: bool = False
+
+    @field_validator("content", mode="before")
+    @classmethod
+    def coerce_content(cls, value):
+        # Models sometimes return numbers, booleans or null for cell content
+        if value is None:
+            return ""
+        return value if isinstance(value, str) else str(value)
+
+class TableRow(BaseModel):
+    cells: List[TableCell] = Field(min_length=1)
+
+class TablePayload(BaseModel):
+    tableData: List[TableRow] = Field(min_length=1)
+
+# Compiled once; pydantic-core parses and validates the JSON in a single pass
+_payload_adapter = TypeAdapter(TablePayload)
+_rows_adapter = TypeAdapter(List[TableRow])
+
+class TableParseError(ValueError):
+    pass
+
+class ParsedTable(NamedTuple):
+    rows: list      # rectangular tableData rows
+    complete: bool  # False if rows were salvaged from invalid JSON or short rows were padded
+
+def parse_table_response(response_text: str) -> ParsedTable:
+    """Parse the model's table JSON into rectangular tableData rows.
+
+    Well-formed output is validated directly against the TablePayload schema. Anything else
+    (truncated output, stray text, a bad row) falls back to salvaging every complete row,
+    and the result is marked incomplete, as it is when ragged rows had to be padded.
+    Raises TableParseError if no row can be recovered.
+    """
+    body = _strip_to_json(response_text)
+    if body is None:
+        raise TableParseError("No JSON found in model output")
+
+    complete = True
+    try:
+        if body.startswith("["):
+            rows = _rows_adapter.validate_json(body)
+        else:
+            rows = _payload_adapter.validate_json(body).tableData
+    except ValidationError as e:
+        logger.warning("Table JSON did not validate (%s errors), salvaging complete rows", e.error_count())
+        parser = TableRowStreamParser()
+        parser.feed(body)
+        rows = parser.rows
+        complete = False
+
+    if not rows:
+        raise TableParseError("No complete rows in model output")
+
+    table_data = [row.model_dump() for row in rows]
+    padded = make_rectangular(table_data)
+    return ParsedTable(table_data, complete and not padded)
+
+def make_rectangular(table_data: list) -> bool:
+    """Pad short rows with empty cells so every row has the same number of cells.
+
+    Returns True if any row was padded.
+    """
+    width = max(len(row["cells"]) for row in table_data)
+    padded = False
+    for row in table_data:
+        cells = row["cells"]
+        if len(cells) < width:
+            is_header = cells[0]["isHeader"]
+            cells.extend({"content": "", "isHeader": is_header} for _ in range(width - len(cells)))
+            padded = True
+    return padded
+
+def _strip_to_json(text: str):
+    """Drop markdown fences and any prose around the JSON payload."""
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return None
+    body = text[min(starts):].rstrip()
+    if body.endswith("```"):
+        body = body[:-3].rstrip()
+    return body
+
+class TableRowStreamParser:
+    """Incrementally pull complete {"cells": [...]} rows out of streamed or truncated table JSON.
+
+    Feed chunks as they arrive; each call returns the rows completed by that chunk.
+    The scanner tracks strings and escapes, so braces inside cell content are ignored.
+    Rows whose cell count differs from the first row, or that do not validate, are skipped
+    and counted in skipped.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.skipped = 0
+        self._buffer = []
+        self._length = 0
+        self._stack = []  # (bracket, start offset) for each open { or [
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> list:
+        completed = []
+        for char in chunk:
+            offset = self._length
+            self._buffer.append(char)
+            self._length += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append((char, offset))
+            elif char in "}]" and self._stack:
+                opener, start = self._stack.pop()
+                # Rows are objects that sit directly inside an array
+                if opener == "{" and self._stack and self._stack[-1][0] == "[":
+                    row = self._parse_row("".join(self._buffer[start:]))
+                    if row is not None:
+                        self.rows.append(row)
+                        completed.append(row)
+
+        return completed
+
+    @property
+    def finished(self) -> bool:
+        """True once every opened object and array has been closed (output was not truncated)."""
+        return bool(self._length) and not self._stack and not self._in_string
+
+    def _parse_row(self, text):
+        if '"cells"' not in text:
+            # Cell objects and other nested values are not rows
+            return None
+        try:
+            row = TableRow.model_validate_json(text)
+        except ValidationError:
+            self.skipped += 1
+            return None
+
+        # All rows must have the same number of cells as the first one
+        if self.rows and len(row.cells) != len(self.rows[0].cells):
+            self.skipped += 1
+            return None
+        return row
@@ -27,6 +27,7 @@ import {
 } from 'lucide-react';
 import { useTheme } from '../contexts/ThemeContext';
 import { exportToPdf, exportToLatex } from '../services/exportService';
+import { uploadImage } from '../services/imageService';
 
 const ToolbarContainer = styled.div`
   display: flex;
@@ -362,9 +363,16 @@ public static void displayValues(Collection<Integer> data) {
     const input = document.createElement('input');
     input.type = 'file';
     input.accept = 'image/*';
-    input.onchange = (e) => {
+    input.onchange = async (e) => {
       const file = e.target.files[0];
-      if (file) {
+      if (!file) return;
+
+      // The document keeps only URLs of the uploaded image; it embeds the data if the upload fails
+      try {
+        const attrs = await uploadImage(file);
+        editor.chain().focus().setImage({ ...attrs, alt: file.name }).run();
+      } catch (error) {
+        console.warn('Image upload failed, embedding the image in the document:', error.message);
         const reader = new FileReader();
         reader.onload = (event) => {
           const src = event.target.result;
@@ -386,10 +394,10 @@ public static void displayValues(Collection<Integer> data) {
     }
   };
 
-  const handleExportLatex = () => {
+  const handleExportLatex = async () => {
     setIsExportDropdownOpen(false);
     try {
-      exportToLatex(editor, documentTitle);
+      await exportToLatex(editor, documentTitle);
     } catch (error) {
       console.error('Error exporting LaTeX:', error);
       alert('Failed to export LaTeX. Please try again.');
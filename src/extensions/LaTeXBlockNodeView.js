@@ -1,6 +1,11 @@
 import React, { useEffect, useState, useRef, useCallback } from 'react';
 import { NodeViewWrapper } from '@tiptap/react';
 import katex from 'katex';
+import { convert, ConversionCancelledError } from '../services/conversionSocket';
+
+let nextConversionKey = 1;
+// Blocks get the backend's 20 s deadline for their lines plus some slack
+const BLOCK_CONVERSION_TIMEOUT_MS = 25000;
 
 const LaTeXBlockNodeView = ({ node, updateAttributes, getPos, editor }) => {
   const [showTooltip, setShowTooltip] = useState(false);
@@ -12,6 +17,11 @@ const LaTeXBlockNodeView = ({ node, updateAttributes, getPos, editor }) => {
   });
   const renderRef = useRef(null);
   const processingTimeoutRef = useRef(null);
+  // Identifies this node's conversions so a newer one cancels the previous one server-side
+  const conversionKeyRef = useRef(null);
+  if (conversionKeyRef.current === null) {
+    conversionKeyRef.current = `latex-block-${nextConversionKey++}`;
+  }
 
   const { originalText } = node.attrs;
 
@@ -57,23 +67,28 @@ const LaTeXBlockNodeView = ({ node, updateAttributes, getPos, editor }) => {
   // Convert English to LaTeX
   const convertEnglishToLatex = async (englishText) => {
     try {
-      const response = await fetch('http://localhost:8000/api/convert-latex-block', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          englishText: englishText.trim(),
-        }),
-      });
+      const data = await convert('convert-latex-block', { englishText: englishText.trim() }, async () => {
+        const response = await fetch('http://localhost:8000/api/convert-latex-block', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            englishText: englishText.trim(),
+          }),
+        });
 
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
 
-      const data = await response.json();
+        return response.json();
+      }, { key: conversionKeyRef.current, timeout: BLOCK_CONVERSION_TIMEOUT_MS });
       return data.latexCode;
     } catch (error) {
+      if (error instanceof ConversionCancelledError) {
+        throw error;
+      }
       console.error('Error converting English to LaTeX:', error);
       throw new Error('Failed to convert English to LaTeX. Please check your connection and try again.');
     }
@@ -120,6 +135,10 @@ const LaTeXBlockNodeView = ({ node, updateAttributes, getPos, editor }) => {
           });
           
         } catch (error) {
+          if (error instanceof ConversionCancelledError) {
+            // A newer conversion of this block replaced this one and will update the node
+            return;
+          }
           console.error('Error converting LaTeX block:', error);
           
           // Clear the processing timeout reference
@@ -1,6 +1,11 @@
 import { Node, mergeAttributes, InputRule } from '@tiptap/core';
 import { ReactNodeViewRenderer } from '@tiptap/react';
+import { Plugin, PluginKey } from '@tiptap/pm/state';
 import LaTeXNodeView from './LaTeXNodeView';
+import { sendLatexDraft } from '../services/latexService';
+
+// An expression that has been opened (/(, /s(, /m( or /ss() but not closed yet
+const OPEN_EXPRESSION = /\/(?:ss|s|m)?\(((?:[^)\\]|\\.)*)$/;
 
 export default Node.create({
   name: 'latex',
@@ -155,6 +160,28 @@ export default Node.create({
     ];
   },
 
+  addProseMirrorPlugins() {
+    return [
+      // Send the expression being typed as a draft so it is converted before it is closed
+      new Plugin({
+        key: new PluginKey('latexDraft'),
+        view: () => ({
+          update: (view, prevState) => {
+            if (view.state.doc.eq(prevState.doc)) {
+              return;
+            }
+            const { $from } = view.state.selection;
+            const textBefore = $from.parent.textContent.slice(0, $from.parentOffset);
+            const match = textBefore.match(OPEN_EXPRESSION);
+            if (match) {
+              sendLatexDraft(match[1]);
+            }
+          },
+        }),
+      }),
+    ];
+  },
+
   addCommands() {
     return {
       setLatex: (attributes) => ({ commands }) => {
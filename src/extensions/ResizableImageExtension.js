@@ -14,6 +14,9 @@ const ResizableImageExtension = Node.create({
       src: {
         default: null,
       },
+      srcset: {
+        default: null,
+      },
       alt: {
         default: null,
       },
@@ -35,6 +38,7 @@ const ResizableImageExtension = Node.create({
         tag: 'img[src]',
         getAttrs: (element) => ({
           src: element.getAttribute('src'),
+          srcset: element.getAttribute('srcset'),
           alt: element.getAttribute('alt'),
           title: element.getAttribute('title'),
           width: element.getAttribute('width'),
@@ -84,7 +84,7 @@ const TopLeftHandle = styled(ResizeHandle)`
 `;
 
 const ResizableImageNodeView = ({ node, updateAttributes, selected }) => {
-  const { src, alt, title, width, height } = node.attrs;
+  const { src, srcset, alt, title, width, height } = node.attrs;
   const [startPos, setStartPos] = useState({ x: 0, y: 0 });
   const [startSize, setStartSize] = useState({ width: 0, height: 0 });
   const imgRef = useRef(null);
@@ -165,6 +165,10 @@ const ResizableImageNodeView = ({ node, updateAttributes, selected }) => {
         <ResizableImg
           ref={imgRef}
           src={src}
+          srcSet={srcset || undefined}
+          sizes={srcset ? (width ? `${width}px` : '100vw') : undefined}
+          loading="lazy"
+          decoding="async"
           alt={alt}
           title={title}
           width={width}
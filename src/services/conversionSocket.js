@@ -0,0 +1,132 @@
+// One WebSocket to the backend carries every conversion instead of one HTTP request each.
+// Requests are multiplexed by id; a newer request with the same key cancels the older one.
+const SOCKET_URL = 'ws://localhost:8000/ws';
+const CONNECT_TIMEOUT_MS = 3000;
+// After the socket fails, use HTTP for a while before trying to connect again
+const RECONNECT_DELAY_MS = 10000;
+// Same budget as the HTTP requests; the server is told to cancel a conversion that runs over
+const REQUEST_TIMEOUT_MS = 10000;
+
+let socket = null;
+let connecting = null;
+let lastFailure = 0;
+let nextId = 1;
+const pending = new Map(); // id -> { resolve, reject, onPartial }
+
+// Rejection for a request the server cancelled because a newer one with the same key arrived
+export class ConversionCancelledError extends Error {
+  constructor() {
+    super('Conversion was superseded by a newer request');
+    this.name = 'ConversionCancelledError';
+  }
+}
+
+// Rejection for a request with no answer within its timeout; code matches axios's timeout errors
+export class ConversionTimeoutError extends Error {
+  constructor(timeout) {
+    super(`Conversion timed out after ${timeout} ms`);
+    this.name = 'ConversionTimeoutError';
+    this.code = 'ECONNABORTED';
+  }
+}
+
+function connect() {
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    return Promise.resolve(socket);
+  }
+  if (connecting) {
+    return connecting;
+  }
+  if (typeof WebSocket === 'undefined' || Date.now() - lastFailure < RECONNECT_DELAY_MS) {
+    return Promise.reject(new Error('Conversion socket unavailable'));
+  }
+
+  connecting = new Promise((resolve, reject) => {
+    const ws = new WebSocket(SOCKET_URL);
+    const timer = setTimeout(() => ws.close(), CONNECT_TIMEOUT_MS);
+
+    ws.onopen = () => {
+      clearTimeout(timer);
+      socket = ws;
+      connecting = null;
+      resolve(ws);
+    };
+
+    ws.onmessage = (event) => handleMessage(JSON.parse(event.data));
+
+    ws.onclose = () => {
+      clearTimeout(timer);
+      lastFailure = Date.now();
+      if (socket === ws) {
+        socket = null;
+      } else {
+        connecting = null;
+        reject(new Error('Conversion socket unavailable'));
+      }
+      // Requests still in flight are retried over HTTP by their callers
+      for (const request of pending.values()) {
+        request.reject(new Error('Conversion socket closed'));
+      }
+      pending.clear();
+    };
+  });
+  return connecting;
+}
+
+function handleMessage({ id, event, data }) {
+  const request = pending.get(id);
+  if (!request) {
+    return;
+  }
+
+  if (event === 'done') {
+    pending.delete(id);
+    request.resolve(data);
+  } else if (event === 'error') {
+    pending.delete(id);
+    // Shaped like an axios error so callers handle both transports the same way
+    const error = new Error(typeof data.detail === 'string' ? data.detail : 'Conversion failed');
+    error.response = { status: data.status, data };
+    request.reject(error);
+  } else if (event === 'cancelled') {
+    pending.delete(id);
+    request.reject(new ConversionCancelledError());
+  } else if (request.onPartial) {
+    // "line" events for LaTeX blocks
+    request.onPartial(event, data);
+  }
+}
+
+async function sendOverSocket(type, fields, { key, onPartial, timeout = REQUEST_TIMEOUT_MS } = {}) {
+  const ws = await connect();
+  const id = nextId++;
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      pending.delete(id);
+      if (ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ id, type: 'cancel' }));
+      }
+      reject(new ConversionTimeoutError(timeout));
+    }, timeout);
+    pending.set(id, {
+      resolve: (data) => { clearTimeout(timer); resolve(data); },
+      reject: (error) => { clearTimeout(timer); reject(error); },
+      onPartial,
+    });
+    ws.send(JSON.stringify({ ...fields, id, type, key }));
+  });
+}
+
+// Run a conversion over the shared socket, falling back to httpRequest() (which resolves
+// to the response body) if the socket cannot be used. Server errors, cancellations and
+// timeouts (options.timeout, 10 s by default) are not retried.
+export async function convert(type, fields, httpRequest, options = {}) {
+  try {
+    return await sendOverSocket(type, fields, options);
+  } catch (error) {
+    if (error.response || error instanceof ConversionCancelledError || error instanceof ConversionTimeoutError) {
+      throw error;
+    }
+    return httpRequest();
+  }
+}
@@ -1,9 +1,33 @@
+import axios from 'axios';
 import jsPDF from 'jspdf';
 import html2canvas from 'html2canvas';
 
-export const exportToLatex = (editor, documentTitle = 'Document') => {
+const EXPORT_TIMEOUT_MS = 60000;
+
+// The backend renders the same LaTeX as the local conversion below and caches it per node,
+// so exporting a large document again is cheap; the local conversion is used when it is unreachable.
+const exportOnServer = async (editor, documentTitle, format) => {
+  const response = await axios.post(`/api/export/${format}`, {
+    title: documentTitle,
+    content: editor.getJSON(),
+  }, { responseType: 'blob', timeout: EXPORT_TIMEOUT_MS });
+  return response.data;
+};
+
+export const exportToLatex = async (editor, documentTitle = 'Document') => {
   if (!editor) return;
 
+  try {
+    const tex = await exportOnServer(editor, documentTitle, 'latex');
+    downloadFile(tex, `${documentTitle}.tex`, 'text/plain');
+  } catch (error) {
+    console.warn('Server LaTeX export failed, converting locally:', error.message);
+    exportToLatexLocally(editor, documentTitle);
+  }
+};
+
+const exportToLatexLocally = (editor, documentTitle) => {
+
   const json = editor.getJSON();
   let latex = convertJsonToLatex(json);
   
@@ -71,6 +95,19 @@ ${latex}
 export const exportToPdf = async (editor, documentTitle = 'Document') => {
   if (!editor) return;
 
+  // A typeset PDF when the server has a LaTeX engine (501 otherwise), else a capture of the editor
+  try {
+    const pdf = await exportOnServer(editor, documentTitle, 'pdf');
+    downloadFile(pdf, `${documentTitle}.pdf`, 'application/pdf');
+    return;
+  } catch (error) {
+    console.warn('Server PDF export unavailable, rendering in the browser:', error.message);
+  }
+  await exportToPdfInBrowser(editor, documentTitle);
+};
+
+const exportToPdfInBrowser = async (editor, documentTitle) => {
+
   try {
     // Get the editor element
     const editorElement = document.querySelector('.ProseMirror');
@@ -0,0 +1,30 @@
+import axios from 'axios';
+
+const UPLOAD_TIMEOUT_MS = 60000;
+
+// Variant used as the image's src; srcset lets the browser pick a smaller (or the full) one
+const DISPLAY_VARIANT = 'w1280';
+
+// Upload an image to the backend, which stores it once per content hash and makes resized
+// variants. Returns the attributes a resizableImage node keeps: URLs instead of the image data.
+export const uploadImage = async (file) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  const response = await axios.post('/api/images', formData, { timeout: UPLOAD_TIMEOUT_MS });
+  const image = response.data;
+
+  // Variants are still images, so animated GIFs are always shown from the original
+  if (image.contentType === 'image/gif') {
+    return { src: image.url, srcset: null };
+  }
+
+  const candidates = Object.entries(image.variants)
+    .filter(([name]) => name.startsWith('w'))
+    .map(([, variant]) => `${variant.url} ${variant.width}w`);
+  candidates.push(`${image.url} ${image.width}w`);
+
+  return {
+    src: (image.variants[DISPLAY_VARIANT] || image).url,
+    srcset: candidates.join(', '),
+  };
+};
@@ -1,8 +1,15 @@
 import axios from 'axios';
+import { convert } from './conversionSocket';
 
 // Cache for converted expressions to avoid repeated API calls
 const conversionCache = new Map();
 
+// Expressions typed so far are sent as drafts so the backend can convert them speculatively.
+// Only one inline expression is typed at a time, so one draft session per page is enough.
+const draftSessionId = `draft-${Math.random().toString(36).slice(2)}`;
+const DRAFT_THROTTLE_MS = 150;
+let draftTimer = null;
+
 // Built-in patterns for common mathematical expressions
 const builtInPatterns = [
   // Basic operations
@@ -103,16 +110,20 @@ export async function convertToLatex(naturalLanguage) {
   // If no built-in pattern matches, try API conversion
   try {
     
-    const response = await axios.post('/api/convert-latex', {
-      text: trimmedText
-    }, {
-      timeout: 10000, // 10 second timeout
-      headers: {
-        'Content-Type': 'application/json'
-      }
+    const data = await convert('convert-latex', { text: trimmedText, sessionId: draftSessionId }, async () => {
+      const response = await axios.post('/api/convert-latex', {
+        text: trimmedText,
+        sessionId: draftSessionId
+      }, {
+        timeout: 10000, // 10 second timeout
+        headers: {
+          'Content-Type': 'application/json'
+        }
+      });
+      return response.data;
     });
     
-    const latexCode = response.data.latex;
+    const latexCode = data.latex;
     if (latexCode) {
       conversionCache.set(trimmedText, latexCode);
       return latexCode;
@@ -136,6 +147,25 @@ export async function convertToLatex(naturalLanguage) {
   return fallback;
 }
 
+// Report an expression while it is still being typed; the backend starts converting it
+// once typing pauses, so the final convertToLatex call usually finds the answer ready
+export function sendLatexDraft(text) {
+  clearTimeout(draftTimer);
+  draftTimer = setTimeout(() => {
+    const trimmedText = text.trim();
+    if (!trimmedText || conversionCache.has(trimmedText) || tryBuiltInConversion(trimmedText)) {
+      return;
+    }
+    const draft = { sessionId: draftSessionId, text: trimmedText };
+    convert('convert-latex-draft', draft, async () => {
+      const response = await axios.post('/api/convert-latex/draft', draft, { timeout: 5000 });
+      return response.data;
+    }, { timeout: 5000 }).catch(() => {
+      // Drafts are only a hint; the final conversion still happens
+    });
+  }, DRAFT_THROTTLE_MS);
+}
+
 // Clear the cache (useful for development)
 export function clearConversionCache() {
   conversionCache.clear();
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { convert } from './conversionSocket';
 
 // Cache for converted table structures
 const tableCache = new Map();
@@ -171,16 +172,19 @@ export async function convertTablePrompt(prompt) {
   // Try AI conversion via API only for complex descriptions
   try {
     console.log('TableService: Trying AI conversion for:', trimmedPrompt);
-    const response = await axios.post('/api/convert-table', {
-      prompt: trimmedPrompt
-    }, {
-      timeout: 10000,
-      headers: {
-        'Content-Type': 'application/json'
-      }
+    const data = await convert('convert-table', { prompt: trimmedPrompt }, async () => {
+      const response = await axios.post('/api/convert-table', {
+        prompt: trimmedPrompt
+      }, {
+        timeout: 10000,
+        headers: {
+          'Content-Type': 'application/json'
+        }
+      });
+      return response.data;
     });
     
-    const tableData = response.data.tableData;
+    const tableData = data.tableData;
     if (tableData && Array.isArray(tableData) && tableData.length > 0) {
       console.log('TableService: AI conversion succeeded');
       tableCache.set(trimmedPrompt, tableData);